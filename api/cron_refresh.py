@@ -1,7 +1,9 @@
 """
 Vercel Cron 定时刷新全量缓存 - 独立函数，maxDuration 300 秒
-每天 UTC 00:00（香港时间 08:00）执行，加载全量数据并写入缓存文件
-日志写入与 Admin 刷新同一处（Blob/refresh_log.txt）
+每天 UTC 00:00-02:50（香港时间 08:00 起）每 10 分钟调用一次：
+- 有未完成的刷新任务则从检查点继续（单次调用受 REFRESH_TIME_BUDGET_SECONDS 限制）
+- 今天已刷新完成则直接返回；否则开始新的刷新
+日志写入与 Admin 刷新同一处（Blob 分段日志 refresh_log/ 或本地 refresh_log.txt）
 """
 import json
 import os
@@ -23,7 +25,7 @@ class handler(BaseHTTPRequestHandler):
 
         try:
             from kn_producer_cache import refresh_producer_full_cache
-            result = refresh_producer_full_cache(triggered_by="cron")
+            result = refresh_producer_full_cache(triggered_by="cron", resume=True)
             if "error" in result:
                 self._send_json(500, result)
                 return
@@ -31,6 +33,9 @@ class handler(BaseHTTPRequestHandler):
                 "ok": True,
                 "last_updated": result.get("last_updated"),
                 "producer_count": result.get("producer_count"),
+                "pending": result.get("pending", 0),
+                "idle": result.get("idle", False),
+                "in_progress": result.get("in_progress", False),
             })
         except Exception as e:
             self._send_json(500, {"error": str(e)})
@@ -21,6 +21,9 @@ app = Flask(__name__)
 # Vercel 等 serverless 需固定 secret_key，否则 session 无法跨请求
 app.secret_key = os.getenv("SECRET_KEY", "dev-secret-change-me-in-production")
 app.config["JSON_AS_ASCII"] = False  # JSON 输出中文不转义，避免乱码
+# 请求级指标（耗时、数据库时间、缓存命中、响应大小），见 /api/metrics
+from kn_metrics import init_metrics, record_cache
+init_metrics(app)
 # 子路径部署，如 chuanx.xyz/rtrisk，设置 APP_ROOT=/rtrisk
 APP_ROOT = (os.getenv("APP_ROOT") or "").rstrip("/")
 
@@ -146,7 +149,9 @@ def load_partners():
     try:
         from flask import g
         if hasattr(g, "_rt_load_partners"):
+            record_cache("g", True)
             return g._rt_load_partners
+        record_cache("g", False)
     except RuntimeError:
         pass
     producers = load_producers(json_only=True)
@@ -232,7 +237,9 @@ def load_producers(json_only=False):
         try:
             from flask import g
             if hasattr(g, "_rt_producers_json"):
+                record_cache("g", True)
                 return g._rt_producers_json
+            record_cache("g", False)
         except RuntimeError:
             pass
     from spv_config import load_producers_from_spv_config
@@ -353,29 +360,6 @@ def _portfolio_stats(loans):
     }
 
 
-def fmt_usd(n):
-    if n >= 1e6:
-        return f"${n/1e6:.1f}M"
-    if n >= 1e3:
-        return f"${n/1e3:.0f}K"
-    return f"${n:,.0f}"
-
-
-def _fmt_local(n):
-    """本币格式（无数额符号）"""
-    if n is None or (isinstance(n, float) and (n != n or n < 0)):
-        return "-"
-    try:
-        x = float(n)
-    except (TypeError, ValueError):
-        return "-"
-    if x >= 1e6:
-        return f"{x/1e6:.1f}M"
-    if x >= 1e3:
-        return f"{x/1e3:.0f}K"
-    return f"{x:,.0f}"
-
-
 def login_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -457,6 +441,57 @@ def api_cache_meta():
         return jsonify({})
 
 
+@app.route("/api/cache-archive")
+@app.route("/api/cache-archive/<date_str>")
+@login_required
+def api_cache_archive(date_str=None):
+    """历史每日归档（Admin）：无日期时返回可用日期列表；?spv_id= 只返回单个生产商"""
+    if not _is_admin():
+        return jsonify({"error": "权限不足"}), 403
+    try:
+        from kn_cache_archive import list_archive_dates, load_daily_archive
+        if not date_str:
+            return jsonify({"dates": list_archive_dates()})
+        data = load_daily_archive(date_str, spv_id=request.args.get("spv_id") or None)
+        if data is None:
+            return jsonify({"error": "该日期无归档"}), 404
+        return jsonify(data)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/admin/slow-queries", methods=["GET", "DELETE"])
+@login_required
+def api_admin_slow_queries():
+    """慢查询日志（Admin）：GET 返回最近的慢 SQL（?limit=），DELETE 清空"""
+    if not _is_admin():
+        return jsonify({"error": "权限不足"}), 403
+    from db_connect import get_slow_queries, clear_slow_queries, SQL_SLOW_THRESHOLD_MS
+    if request.method == "DELETE":
+        clear_slow_queries()
+        return jsonify({"ok": True})
+    limit = request.args.get("limit", type=int)
+    return jsonify({"threshold_ms": SQL_SLOW_THRESHOLD_MS, "queries": get_slow_queries(limit)})
+
+
+@app.route("/api/metrics")
+def api_metrics():
+    """
+    请求级指标（Prometheus 文本格式）：仅 Admin 登录会话可访问；
+    抓取程序可用 Authorization: Bearer {METRICS_TOKEN}（设置了 METRICS_TOKEN 时）
+    """
+    token = os.getenv("METRICS_TOKEN", "")
+    if not (token and request.headers.get("Authorization", "") == f"Bearer {token}"):
+        if "user" not in session:
+            return jsonify({"error": "请先登录"}), 401
+        if not _is_admin():
+            return jsonify({"error": "权限不足"}), 403
+    from kn_metrics import render_prometheus
+    resp = make_response(render_prometheus())
+    resp.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return resp
+
+
 def _user_with_role_label(user, lang):
     """Ensure user.role_label matches current lang."""
     cfg = load_user_config()
@@ -508,6 +543,17 @@ def admin_cache_refresh():
     except Exception as e:
         app.logger.exception("[admin_cache_refresh] 加载失败: %s", e)
 
+    # 最近一次刷新的性能报告及与上一次的对比
+    profile = None
+    profile_cmp = {}
+    try:
+        from kn_refresh_profile import load_profile_report, compare_reports
+        profile = load_profile_report()
+        if profile:
+            profile_cmp = compare_reports(profile, load_profile_report(previous=True))
+    except Exception as e:
+        app.logger.warning("[admin_cache_refresh] 性能报告加载失败: %s", e)
+
     cache_backend = "file"
     if os.getenv("VERCEL"):
         try:
@@ -524,6 +570,8 @@ def admin_cache_refresh():
         refresh_logs_text=refresh_logs_text,
         cache_backend=cache_backend,
         is_vercel=bool(os.getenv("VERCEL")),
+        profile=profile,
+        profile_cmp=profile_cmp,
     )
 
 
@@ -608,11 +656,15 @@ def alert_panel():
     if "alert_panel" not in user.get("permissions", []):
         return redirect(url_for("dashboard"))
     data = load_partners()
+    # 告警与覆盖倍数来自告警状态（板块刷新时 kn_alerts 增量评估，按 spv_id 存），无状态时回退到 producers.json
+    # partner_id 经 partner → spv 映射取状态（如 partner_beta → kn）
+    from kn_producer_cache import load_alert_state_for
+    spv_map = _get_partner_spv_map()
     partners_list = []
     for pid, p in data["partners"].items():
-        alerts = p.get("alerts", [])
-        pi = p.get("priority_indicators", {})
-        cov = pi.get("coverage_ratio", {})
+        st = load_alert_state_for(spv_map.get(pid) or pid)
+        alerts = (st.get("alerts") or []) + (p.get("alerts") or [])
+        cov = st.get("coverage") or (p.get("priority_indicators") or {}).get("coverage_ratio", {})
         partners_list.append({
             "id": p["id"],
             "name": p["name"],
@@ -743,10 +795,10 @@ def portfolio():
     # PM/Investor 从缓存读取累计指标与平台持仓；Admin 从 DB
     if cache_only:
         try:
-            from kn_producer_cache import load_producer_full_cache
-            cache_data, _ = load_producer_full_cache()
-            cum = (cache_data or {}).get("portfolio_cumulative_stats") or {}
-            allocation = (cache_data or {}).get("allocation_by_platform")
+            from kn_producer_cache import load_producer_manifest
+            manifest = load_producer_manifest()
+            cum = (manifest or {}).get("portfolio_cumulative_stats") or {}
+            allocation = (manifest or {}).get("allocation_by_platform")
         except Exception:
             cum = {}
             allocation = None
@@ -803,16 +855,14 @@ def partner_manage():
     if "manage_partners" not in user.get("permissions", []):
         return redirect(url_for("dashboard"))
 
-    # 加载统一缓存
-    cache_data = None
-    full_cache = {}
+    # 统一缓存仅读 manifest（小文件）；列表卡片来自刷新时预计算的摘要索引，不加载分片
+    manifest_producers = {}
     try:
-        from kn_producer_cache import load_producer_full_cache
-        cache_data, _ = load_producer_full_cache()
-        full_cache = (cache_data or {}).get("producers", {})
+        from kn_producer_cache import load_producer_manifest
+        manifest_producers = (load_producer_manifest() or {}).get("producers") or {}
     except Exception:
         pass
-    cache_exists = bool(full_cache)
+    cache_exists = bool(manifest_producers)
     cache_only = _cache_only_mode(user)
 
     # PM/Investor 仅读缓存：无缓存时提示联系管理员
@@ -820,15 +870,42 @@ def partner_manage():
         return render_template("partner_list.html", user=user, partners=[], partners_revenue=[], partners_cashflow=[],
             data_source="cache", no_cache_hint=True, show_refresh=False)
 
-    # 生产商列表：缓存存在时从缓存；否则 Admin 从 DB
+    from kn_partner_summary import build_partner_summary
+    partners = []
+    partners_revenue = []
+    partners_cashflow = []
     if cache_exists:
-        producers_active = [
-            {"id": sid, "name": p.get("name", sid), "region": p.get("region", "-"), "product_type": p.get("product_type", "-"),
-             "status": p.get("status", "active"), "onboard_date": p.get("onboard_date", "-"), "exchange_rate": p.get("exchange_rate", 1),
-             "currency": p.get("currency", "USD")}
-            for sid, p in full_cache.items() if str(p.get("status", "active")).lower() in ("active", "")
-        ]
+        summaries = {}
+        try:
+            from kn_producer_cache import load_partner_summary
+            summaries = load_partner_summary()
+        except Exception:
+            pass
+        for sid, entry in manifest_producers.items():
+            if str(entry.get("status", "active")).lower() not in ("active", ""):
+                continue
+            rate = float(entry.get("exchange_rate", 1) or 1)
+            env_key = f"{sid.upper()}_EXCHANGE_RATE"
+            if os.getenv(env_key):
+                try:
+                    rate = float(os.getenv(env_key))
+                except ValueError:
+                    pass
+            row = summaries.get(sid)
+            # 摘要与分片版本不一致（或汇率被环境变量覆盖）时，仅对该生产商回退到分片
+            if not row or row.get("updated_at") != entry.get("updated_at") or row.get("exchange_rate") != rate:
+                pc = None
+                try:
+                    from kn_producer_cache import load_producer_shard
+                    pc = load_producer_shard(sid)
+                except Exception:
+                    pass
+                row = build_partner_summary(pc or entry, sid, rate=rate)
+            partners.append(row["partner"])
+            partners_revenue.append(row["revenue"])
+            partners_cashflow.append(row["cashflow"])
     else:
+        # 无统一缓存：Admin 从 DB / 单独缓存逐个生产商构建
         try:
             from project_loader import load_projects_with_internal_params
             projects = load_projects_with_internal_params()
@@ -838,97 +915,12 @@ def partner_manage():
         if not producers_active:
             producers = load_producers()
             producers_active = [p for p in producers.values() if p.get("status") == "active"]
-
-    partners = []
-    partners_revenue = []
-    partners_cashflow = []
-    # 缓存存在时用 JSON 派生的映射，避免 DB
-    if cache_exists:
-        spv_map = {p["id"]: p["id"] for p in producers_active}
-        if "kn" in spv_map:
-            spv_map["partner_beta"] = "kn"
-    else:
-        spv_map = _get_partner_spv_map()
-    for prod in producers_active:
-        pid = prod["id"]
-        spv_id = spv_map.get(pid) or pid
-        pc = (full_cache or {}).get(spv_id) or (full_cache or {}).get(str(spv_id).strip().lower()) if full_cache else None
-
-        partner_like = {
-            "id": pid,
-            "name": prod.get("name", pid),
-            "country": prod.get("region", "-"),
-            "product_type": prod.get("product_type", "-"),
-            "status": prod.get("status", "active"),
-            "onboard_date": prod.get("onboard_date", "-"),
-            "monthly_volume": 0,
-            "monthly_volume_fmt": "-",
-        }
-        if cache_exists:
-            risk_data = (pc or {}).get("risk_data", [])
-        else:
-            risk_data = _load_risk_data_for_partner(pid, partner_like)
-        # 缓存存在时用 prod 的配置，避免 _get_producer_config 访问 DB
-        if cache_exists:
-            rate = float(prod.get("exchange_rate", 1) or 1)
-            local_currency = prod.get("currency", "USD") or "USD"
-            env_key = f"{spv_id.upper()}_EXCHANGE_RATE"
-            if os.getenv(env_key):
-                try:
-                    rate = float(os.getenv(env_key))
-                except ValueError:
-                    pass
-        else:
+        for prod in producers_active:
+            pid = prod["id"]
+            risk_data = _load_risk_data_for_partner(pid, {})
             cfg = _get_producer_config(pid)
             rate = float((cfg.get("exchange_rate") if cfg else None) or prod.get("exchange_rate", 1) or 1)
             local_currency = (cfg.get("currency") if cfg else None) or prod.get("currency", "USD")
-        is_usd = (local_currency or "USD") == "USD"
-
-        if risk_data:
-            latest = sorted(risk_data, key=lambda r: r.get("stat_date", ""), reverse=True)[0]
-            od1 = float(latest.get("overdue_1_plus_ratio", 0))
-            m0 = float(latest.get("m0_ratio", 0))
-            cb = float(latest.get("current_balance", 0))
-            cd = float(latest.get("cumulative_disbursement", 0))
-            usd_cb = cb / rate if rate else cb
-            usd_cd = cd / rate if rate else cd
-            partner_like["latest"] = {
-                "stat_date": latest["stat_date"],
-                "current_balance_fmt": fmt_usd(usd_cb),
-                "cum_disb_fmt": fmt_usd(usd_cd),
-                "current_balance_local": _fmt_local(cb),
-                "current_balance_usd": fmt_usd(usd_cb),
-                "cum_disb_local": _fmt_local(cd),
-                "cum_disb_usd": fmt_usd(usd_cd),
-                "m0_ratio_fmt": f"{m0*100:.2f}%",
-                "m0_class": "good" if m0 >= 0.96 else "warn" if m0 >= 0.93 else "danger",
-                "od1_fmt": f"{od1*100:.2f}%",
-                "od1_class": "good" if od1 < 0.03 else "warn" if od1 < 0.05 else "danger",
-                "active_borrowers": f"{int(latest.get('active_borrowers', 0)):,}",
-            }
-        else:
-            partner_like["latest"] = {
-                "stat_date": "-",
-                "current_balance_fmt": "-",
-                "cum_disb_fmt": "-",
-                "current_balance_local": "-",
-                "current_balance_usd": "-",
-                "cum_disb_local": "-",
-                "cum_disb_usd": "-",
-                "m0_ratio_fmt": "-",
-                "m0_class": "",
-                "od1_fmt": "-",
-                "od1_class": "",
-                "active_borrowers": "-",
-            }
-        partner_like["local_currency"] = local_currency
-        partner_like["exchange_rate"] = rate
-        partner_like["is_usd"] = is_usd
-
-        # 收益数据：缓存存在时仅用统一缓存；否则回退到单独缓存或 prod
-        if cache_exists:
-            rev_data = (pc or {}).get("revenue_data", [])
-        else:
             rev_data = prod.get("revenue_data", [])
             if not rev_data:
                 try:
@@ -938,62 +930,22 @@ def partner_manage():
                         rev_data = cached_rev
                 except Exception:
                     pass
-
-        # 月放贷规模：从 revenue_data 最新月 disbursement
-        monthly_vol = 0
-        if rev_data:
-            monthly_vol = float(rev_data[-1].get("disbursement", 0) or 0)
-        usd_mv = monthly_vol / rate if rate else monthly_vol
-        partner_like["monthly_volume"] = monthly_vol
-        partner_like["monthly_volume_local"] = _fmt_local(monthly_vol) if monthly_vol else "-"
-        partner_like["monthly_volume_usd"] = fmt_usd(usd_mv) if monthly_vol else "-"
-        partner_like["monthly_volume_fmt"] = fmt_usd(usd_mv) if monthly_vol else "-"
-        partners.append(partner_like)
-        if cache_exists:
-            rev_local_currency = local_currency
-            rev_exchange_rate = rate
-        else:
-            cfg = _get_producer_config(pid)
-            rev_local_currency = (cfg.get("currency") if cfg else None) or prod.get("currency", "USD")
-            rev_exchange_rate = float((cfg.get("exchange_rate") if cfg else None) or prod.get("exchange_rate", 1) or 1)
-        partners_revenue.append({
-            "id": pid,
-            "name": partner_like["name"],
-            "country": partner_like["country"],
-            "product_type": partner_like["product_type"],
-            "revenue_data": rev_data,
-            "local_currency": rev_local_currency,
-            "exchange_rate": rev_exchange_rate,
-        })
-        # 现金流预测：缓存存在时仅用统一缓存；否则回退到单独缓存或 DB
-        if cache_exists:
-            cashflow_data = (pc or {}).get("cashflow_data", [])
-        else:
             cashflow_data = []
             try:
                 from kn_cashflow_cache import load_cashflow_cache
                 cached_cf, _, _ = load_cashflow_cache(pid)
                 if cached_cf:
                     cashflow_data = cached_cf
-                else:
-                    from kn_cashflow import compute_cashflow_forecast
-                    coll_rate = 0.98
-                    if rev_data:
-                        coll_rate = rev_data[-1].get("collection_rate", 0.98) or 0.98
-                    cf = compute_cashflow_forecast(spv_id=pid, months_ahead=12, collection_rate=coll_rate)
-                    cashflow_data = cf.get("forecast", [])
             except Exception:
                 pass
-        partners_cashflow.append({
-            "id": pid,
-            "name": partner_like["name"],
-            "country": partner_like["country"],
-            "product_type": partner_like["product_type"],
-            "cashflow_data": cashflow_data,
-            "total_expected": sum(r.get("expected_inflow", 0) for r in cashflow_data),
-            "local_currency": rev_local_currency,
-            "exchange_rate": rev_exchange_rate,
-        })
+            row = build_partner_summary(
+                dict(prod, region=prod.get("region", "-"), risk_data=risk_data, revenue_data=rev_data,
+                     cashflow_data=cashflow_data),
+                pid, rate=rate, currency=local_currency,
+            )
+            partners.append(row["partner"])
+            partners_revenue.append(row["revenue"])
+            partners_cashflow.append(row["cashflow"])
     return render_template(
         "partner_list.html", user=user, partners=partners,
         partners_revenue=partners_revenue,
@@ -1003,23 +955,37 @@ def partner_manage():
     )
 
 
+def _revalidate_if_stale(spv_id, *sections):
+    """
+    缓存板块过期时安排后台刷新（stale-while-revalidate），本请求照常使用现有缓存
+    仅可刷新缓存的角色（Admin / manage_partners）触发；PM/Investor 只读缓存，由 Cron 刷新
+    列表页不调用（N 个生产商 × 3 个板块），只在单个生产商的详情页按板块触发
+    """
+    if not spv_id or not _can_refresh_cache():
+        return
+    try:
+        from kn_producer_cache import schedule_revalidate
+        for section in sections:
+            schedule_revalidate(spv_id, section)
+    except Exception:
+        pass
+
+
 def _get_producer_data_from_full_cache(spv_id):
     """
-    从统一缓存获取单个生产商数据
+    从统一缓存获取单个生产商数据（仅加载 manifest + 该生产商分片）
     返回: (pc, last_updated, cache_exists)
     - cache_exists=True: 缓存文件存在，必须仅用此数据，不再访问 DB 或单独缓存
     - cache_exists=False: 无统一缓存，可回退到单独缓存或 DB
     """
     try:
-        from kn_producer_cache import load_producer_full_cache
-        data, last_updated = load_producer_full_cache()
-        cache_exists = bool(data and data.get("producers"))
+        from kn_producer_cache import load_producer_manifest, load_producer_shard
+        manifest = load_producer_manifest()
+        cache_exists = bool(manifest and manifest.get("producers"))
         if not cache_exists:
             return None, None, False
-        producers = data.get("producers", {})
-        sid = str(spv_id or "").strip().lower()
-        pc = producers.get(spv_id) or producers.get(sid)
-        return pc, last_updated, True
+        pc = load_producer_shard(spv_id)
+        return pc, manifest.get("last_updated"), True
     except Exception:
         return None, None, False
 
@@ -1190,6 +1156,7 @@ def partner_risk(partner_id):
         risk_data = (pc or {}).get("risk_data", [])
         if full_cache_updated:
             cache_last_updated = full_cache_updated[:19].replace("T", " ")
+        _revalidate_if_stale(spv_id, "risk")
     elif spv_id:
         try:
             from kn_risk_cache import load_risk_cache
@@ -1257,9 +1224,9 @@ def _get_spv_id_and_cache(partner_id):
     cache_only = _cache_only_mode()
     if cache_only:
         try:
-            from kn_producer_cache import load_producer_full_cache
-            data, _ = load_producer_full_cache()
-            producers = (data or {}).get("producers", {})
+            from kn_producer_cache import load_producer_manifest
+            manifest = load_producer_manifest()
+            producers = (manifest or {}).get("producers", {})
             spv_map = {pid: pid for pid in producers}
             if "kn" in spv_map:
                 spv_map["partner_beta"] = "kn"
@@ -1507,19 +1474,26 @@ def loan_detail(partner_id, loan_id):
     # 优先从数据库查询（KN 等有 spv_id 的生产商），仿照查询页面内容
     if spv_id in valid_spv:
         try:
-            from risk_query import query_loan_detail
-            result = query_loan_detail(loan_id, spv_id=spv_id)
+            # loan-360：同合同 loan、还款计划/记录、逾期状态、客户一次查询（进程内 LRU）
+            from risk_query import query_loan_360
+            result = query_loan_360(loan_id, spv_id)
+            if result is None:
+                from risk_query import query_loan_detail
+                from kn_risk_query import get_loan_overdue_info, get_customer_info
+                result = query_loan_detail(loan_id, spv_id=spv_id)
+                if not result.get("error") and result.get("loans"):
+                    result["overdue"] = get_loan_overdue_info(loan_id, spv_id)
+                    result["customer_info"] = get_customer_info(result["loans"][0].get("status", {}).get("customer_id"))
             if not result.get("error") and result.get("loans"):
-                first = result["loans"][0]
+                first = next((l for l in result["loans"] if str(l.get("loan_id")) == loan_id), result["loans"][0])
                 contract_no = result.get("contract_no", "-")
                 status = first.get("status", {})
                 schedule = first.get("schedule", [])
                 records = first.get("records", [])
 
                 # 合并 raw_loan + calc_overdue 信息
-                from kn_risk_query import get_loan_overdue_info, get_customer_info
-                overdue = get_loan_overdue_info(loan_id, spv_id)
-                customer_info = get_customer_info(status.get("customer_id"))
+                overdue = result.get("overdue") or {}
+                customer_info = result.get("customer_info") or {}
 
                 loan = {
                     "loan_id": status.get("loan_id", loan_id),
@@ -1627,6 +1601,7 @@ def partner_cashflow(partner_id):
         cashflow_data = (pc or {}).get("cashflow_data", [])
         if full_cache_updated:
             cache_last_updated = full_cache_updated[:19].replace("T", " ")
+        _revalidate_if_stale(spv_id, "cashflow")
         rev_list = (pc or {}).get("revenue_data", [])
         if rev_list:
             cr = rev_list[-1].get("collection_rate", 0.98) or 0.98
@@ -1647,13 +1622,12 @@ def partner_cashflow(partner_id):
                 else:
                     collection_rate = cr if cr >= 0.5 else 0.98
             else:
-                from kn_cashflow import compute_cashflow_forecast
+                # 无缓存时不在请求内计算，后台刷新后下次打开即可显示
                 rev_data = partner.get("revenue_data", [])
                 if rev_data:
                     cr = rev_data[-1].get("collection_rate", 0.98) or 0.98
                     collection_rate = cr if cr >= 0.5 else (rev_data[-2].get("collection_rate", 0.98) or 0.98 if len(rev_data) >= 2 else 0.98)
-                cf = compute_cashflow_forecast(spv_id=spv_id, months_ahead=12, collection_rate=collection_rate)
-                cashflow_data = cf.get("forecast", [])
+                _revalidate_if_stale(spv_id, "cashflow")
         except Exception:
             pass
     # 使用正确的回收率重新计算预期回收（避免缓存中使用了错误回收率的历史数据）
@@ -1707,6 +1681,7 @@ def partner_revenue(partner_id):
         revenue_data = (pc or {}).get("revenue_data", [])
         if full_cache_updated:
             cache_last_updated = full_cache_updated[:19].replace("T", " ")
+        _revalidate_if_stale(spv_id, "revenue")
     else:
         revenue_data = partner.get("revenue_data", [])
         if not revenue_data:
@@ -1838,13 +1813,16 @@ def api_cron_refresh_cache():
             return jsonify({"error": "Unauthorized"}), 401
     try:
         from kn_producer_cache import refresh_producer_full_cache
-        result = refresh_producer_full_cache(triggered_by="cron")
+        result = refresh_producer_full_cache(triggered_by="cron", resume=True)
         if "error" in result:
             return jsonify(result), 500
         return jsonify({
             "ok": True,
             "last_updated": result.get("last_updated"),
             "producer_count": result.get("producer_count"),
+            "pending": result.get("pending", 0),
+            "idle": result.get("idle", False),
+            "in_progress": result.get("in_progress", False),
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1856,21 +1834,23 @@ def api_refresh_all_producer_cache():
     """
     Admin/项目经理 刷新全量缓存。
     - 本地：后台执行，立即返回 started=True，可轮询 /api/partner/refresh-status
-    - Vercel：同步执行（Serverless 响应返回后函数终止，后台线程会被杀），返回刷新结果
+    - Vercel：同步执行（Serverless 响应返回后函数终止，后台线程会被杀），返回刷新结果；
+      单次调用有时间预算，未完成时返回 pending，页面以 {"resume": true} 再次调用继续
     """
     if not _can_refresh_cache():
         return jsonify({"error": "权限不足"}), 403
     try:
-        from kn_producer_cache import clear_refresh_log, refresh_producer_full_cache_async, get_refresh_status
-        clear_refresh_log()  # 按 Refresh 时先清空日志，再启动刷新
-        refresh_producer_full_cache_async()
+        from kn_producer_cache import refresh_producer_full_cache_async, get_refresh_status
+        # 新刷新开始时由刷新任务自身清空日志；已有刷新进行中时附着，不清空其日志
+        resume = bool((request.get_json(silent=True) or {}).get("resume"))
+        refresh_producer_full_cache_async(resume=resume)
         st = get_refresh_status()
         if st.get("result") is not None:
             # Vercel 同步执行完成，直接返回结果
             r = st["result"]
             if "error" in r:
                 return jsonify(r), 500
-            return jsonify({"ok": True, "started": False, "last_updated": r.get("last_updated"), "last_updated_by": r.get("last_updated_by", "admin"), "producer_count": r.get("producer_count"), "logs": r.get("logs", [])})
+            return jsonify({"ok": True, "started": False, "last_updated": r.get("last_updated"), "last_updated_by": r.get("last_updated_by", "admin"), "producer_count": r.get("producer_count"), "pending": r.get("pending", 0), "in_progress": r.get("in_progress", False), "logs": r.get("logs", [])})
         return jsonify({"started": True})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1935,12 +1915,13 @@ def api_refresh_risk(partner_id):
     exchange_rate = (cfg.get("exchange_rate") if cfg else 1) or 1
     currency = (cfg.get("currency") if cfg else "USD") or "USD"
     try:
-        from kn_risk_cache import refresh_risk_cache
-        from kn_producer_cache import update_producer_risk_in_full_cache
-        result = refresh_risk_cache(spv_id_lower, exchange_rate, currency)
+        from kn_producer_cache import refresh_producer_section
+        result = refresh_producer_section(spv_id_lower, "risk", updated_by="admin",
+                                          exchange_rate=exchange_rate, currency=currency)
         if "error" in result:
             return jsonify(result), 500
-        update_producer_risk_in_full_cache(spv_id_lower, exchange_rate, currency)
+        if result.get("in_progress"):
+            return jsonify(result), 202  # 其他实例正在刷新同一板块
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1960,12 +1941,13 @@ def api_refresh_revenue(partner_id):
     exchange_rate = float((cfg.get("exchange_rate") if cfg else 1) or 1)
     currency = (cfg.get("currency") if cfg else "USD") or "USD"
     try:
-        from kn_revenue_cache import refresh_revenue_cache
-        from kn_producer_cache import update_producer_revenue_in_full_cache
-        result = refresh_revenue_cache(spv_id, exchange_rate, currency)
+        from kn_producer_cache import refresh_producer_section
+        result = refresh_producer_section(spv_id, "revenue", updated_by="admin",
+                                          exchange_rate=exchange_rate, currency=currency)
         if "error" in result:
             return jsonify(result), 500
-        update_producer_revenue_in_full_cache(spv_id, exchange_rate, currency)
+        if result.get("in_progress"):
+            return jsonify(result), 202  # 其他实例正在刷新同一板块
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1984,22 +1966,14 @@ def api_refresh_cashflow(partner_id):
     cfg = _get_producer_config(spv_id)
     exchange_rate = float((cfg.get("exchange_rate") if cfg else 1) or 1)
     currency = (cfg.get("currency") if cfg else "USD") or "USD"
-    coll_rate = 0.98
-    try:
-        from kn_revenue_cache import load_revenue_cache
-        cached_rev, _ = load_revenue_cache(spv_id)
-        if cached_rev:
-            cr = cached_rev[-1].get("collection_rate", 0.98) or 0.98
-            coll_rate = cr if cr >= 0.5 else (cached_rev[-2].get("collection_rate", 0.98) or 0.98 if len(cached_rev) >= 2 else 0.98)
-    except Exception:
-        pass
     try:
-        from kn_cashflow_cache import refresh_cashflow_cache
-        from kn_producer_cache import update_producer_cashflow_in_full_cache
-        result = refresh_cashflow_cache(spv_id, exchange_rate, currency, coll_rate)
+        from kn_producer_cache import refresh_producer_section
+        result = refresh_producer_section(spv_id, "cashflow", updated_by="admin",
+                                          exchange_rate=exchange_rate, currency=currency)
         if "error" in result:
             return jsonify(result), 500
-        update_producer_cashflow_in_full_cache(spv_id, exchange_rate, currency)
+        if result.get("in_progress"):
+            return jsonify(result), 202  # 其他实例正在刷新同一板块
         return jsonify(result)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -2128,16 +2102,60 @@ def _flatten_priority_indicators(pi):
     return flat
 
 
+@app.route("/api/partner/<partner_id>/roll-rate")
+@login_required
+def api_partner_roll_rate(partner_id):
+    """
+    DPD 档位迁移矩阵（kn_roll_rate）：默认返回月末对月末流转率序列与最新一期矩阵（读缓存）
+    ?from=YYYY-MM-DD&to=YYYY-MM-DD：任意两日的矩阵（未缓存时查询 DB，PM/Investor 仅读缓存）；
+    日期格式错误、from 不早于 to、分区不存在时返回 400
+    """
+    user = session["user"]
+    if partner_id not in _allowed_partner_ids(user) and user["role"] not in ("admin", "risk"):
+        return jsonify({"error": "权限不足"}), 403
+    spv_id = str(_get_partner_spv_map().get(partner_id) or partner_id).strip().lower()
+    from kn_roll_rate import load_roll_rate_cache, compute_transition, cached_transition, latest_transition, parse_period
+    cache = load_roll_rate_cache(spv_id) or {}
+    d_from, d_to = request.args.get("from"), request.args.get("to")
+    if d_from or d_to:
+        try:
+            d_from, d_to = parse_period(d_from, d_to)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        hit = cached_transition(cache, d_from, d_to)
+        if hit is not None:
+            return jsonify(hit)
+        if _cache_only_mode(user):
+            return jsonify({"error": "该期间无缓存"}), 404
+        try:
+            return jsonify(compute_transition(spv_id, d_from, d_to))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            app.logger.warning("[迁移矩阵] 计算失败 spv_id=%s %s~%s: %s", spv_id, d_from, d_to, e)
+            return jsonify({"error": "迁移矩阵计算失败"}), 500
+    return jsonify({"spv_id": spv_id, "last_updated": cache.get("last_updated"),
+                    "series": cache.get("series") or [], "latest": latest_transition(cache)})
+
+
 @app.route("/api/partner/<partner_id>/download-excel")
 @login_required
 def api_partner_download_excel(partner_id):
-    """下载生产商缓存数据为 Excel：风控、收益、现金流 三个 Tab"""
-    spv_id = _get_partner_spv_map().get(partner_id) or partner_id
-    valid_spv = set(_get_partner_spv_map().values() or []) | set(load_producers(json_only=True).keys() or [])
+    """
+    下载生产商缓存数据为 Excel：风控、收益、现金流 三个 Tab
+    PM/Investor 与页面一致仅读统一缓存：无缓存返回 404，分片缺少的板块留空，不回退单独缓存或 DB
+    """
+    user = session["user"]
+    cache_only = _cache_only_mode(user)
+    spv_id, cache_exists, valid_spv = _get_spv_id_and_cache(partner_id)
+    if cache_only and not cache_exists:
+        return jsonify({"error": "暂无缓存数据"}), 404
     if spv_id not in valid_spv:
         return jsonify({"error": "未知生产商"}), 404
 
     pc, _, cache_exists = _get_producer_data_from_full_cache(spv_id)
+    if cache_only and not cache_exists:
+        return jsonify({"error": "暂无缓存数据"}), 404
     risk_data = []
     revenue_data = []
     cashflow_data = []
@@ -2148,7 +2166,7 @@ def api_partner_download_excel(partner_id):
         revenue_data = pc.get("revenue_data", [])
         cashflow_data = pc.get("cashflow_data", [])
         priority_indicators = pc.get("priority_indicators")
-        if not priority_indicators and risk_data:
+        if not priority_indicators and risk_data and not cache_only:
             try:
                 from spv_internal_params import load_priority_indicators_for_spv, compute_priority_from_risk_data
                 rate = float((pc.get("exchange_rate") or 1) or 1)
@@ -2193,8 +2211,15 @@ def api_partner_download_excel(partner_id):
         wb = Workbook()
         wb.remove(wb.active)
 
-        # Tab 1: 风控
+        # Tab 1: 风控（USD 列导出时按汇率换算，缓存只存本币）
         ws1 = wb.create_sheet("风控", 0)
+        try:
+            from kn_risk_cache import risk_row_to_usd
+            usd_rate = float(((pc or {}).get("exchange_rate") if cache_exists else None)
+                             or (None if cache_only else (_get_producer_config(spv_id) or {}).get("exchange_rate")) or 1)
+            risk_data = [dict(r, _usd=risk_row_to_usd(r, usd_rate)) for r in risk_data]
+        except Exception:
+            pass
         h1, r1 = _json_to_excel_rows(risk_data)
         if h1:
             ws1.append(h1)
@@ -2215,7 +2240,7 @@ def api_partner_download_excel(partner_id):
         if revenue_data:
             cr = revenue_data[-1].get("collection_rate", 0.98) or 0.98
             collection_rate = cr if cr >= 0.5 else (revenue_data[-2].get("collection_rate", 0.98) or 0.98 if len(revenue_data) >= 2 else 0.98)
-        else:
+        elif not cache_only:
             try:
                 from kn_cashflow_cache import load_cashflow_cache
                 _, _, cr = load_cashflow_cache(spv_id)
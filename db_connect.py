@@ -1,8 +1,15 @@
 """
 PostgreSQL 数据库连接与连接池
+- 连接统一包装为 _PooledConnWrapper，游标为 _InstrumentedCursor：每次 execute 计时、记录行数与调用方（模块.函数）
+- 慢查询日志：超过 SQL_SLOW_THRESHOLD_MS 的语句进入滚动日志（最近 SQL_SLOW_LOG_SIZE 条），get_slow_queries() 读取
+- 非生产环境且 SQL_EXPLAIN_SLOW=1 时，对慢的只读语句（SELECT / WITH）附带 EXPLAIN (ANALYZE, BUFFERS) 执行计划
 """
 import os
+import sys
+import threading
 import time
+from collections import deque
+from datetime import datetime
 import psycopg2
 from psycopg2 import pool
 from db_config import get_db_config, get_connection_string, get_pool_config
@@ -10,15 +17,195 @@ from db_config import get_db_config, get_connection_string, get_pool_config
 _pool = None
 _CONNECT_RETRIES = 3
 _CONNECT_RETRY_DELAY = 2
+# 查询观察者：fn(rec)，rec = { sql, seconds, rows, bytes, caller }；fetch 时 bytes 在 rec 上原地累加（估算值）
+# caller 需栈帧回溯，仅在有观察者声明 needs_caller 或慢查询时计算，否则为 None
+_query_observers = []
+_caller_observers = set()
+# 慢查询阈值（毫秒，0 关闭）、滚动日志条数、是否附带执行计划
+SQL_SLOW_THRESHOLD_MS = float(os.getenv("SQL_SLOW_THRESHOLD_MS", "500") or 0)
+SQL_SLOW_LOG_SIZE = int(os.getenv("SQL_SLOW_LOG_SIZE", "200") or 200)
+SQL_EXPLAIN_SLOW = (os.getenv("SQL_EXPLAIN_SLOW") or "").strip().lower() in ("1", "true", "yes")
+_slow_log = deque(maxlen=SQL_SLOW_LOG_SIZE)
+_slow_lock = threading.Lock()
+_MAX_SQL_LEN = 2000
+_QUERY_HELPERS = ("_query",)  # 通用查询辅助函数，调用方标记取其上一层
+
+
+def add_query_observer(fn, needs_caller: bool = False):
+    """注册查询观察者（如全量刷新性能分析），每次 execute 后调用；needs_caller=True 时 rec 带调用方标记"""
+    if fn not in _query_observers:
+        _query_observers.append(fn)
+    if needs_caller:
+        _caller_observers.add(fn)
+
+
+def remove_query_observer(fn):
+    try:
+        _query_observers.remove(fn)
+    except ValueError:
+        pass
+    _caller_observers.discard(fn)
+
+
+def _is_production() -> bool:
+    """生产环境（Vercel production 或 FLASK_ENV=production）不执行 EXPLAIN ANALYZE"""
+    env = (os.getenv("VERCEL_ENV") or os.getenv("FLASK_ENV") or "").strip().lower()
+    return env == "production"
+
+
+def _caller_tag() -> str:
+    """调用方 模块.函数：跳过 db_connect 自身及通用查询辅助函数（_query 等），取第一个业务栈帧"""
+    f = sys._getframe(1)
+    fallback = None
+    while f is not None:
+        mod = f.f_globals.get("__name__", "?")
+        if mod != __name__:
+            tag = f"{mod}.{f.f_code.co_name}"
+            if f.f_code.co_name not in _QUERY_HELPERS:
+                return tag
+            fallback = fallback or tag
+        f = f.f_back
+    return fallback or "?"
+
+
+def get_slow_queries(limit: int = None) -> list:
+    """滚动慢查询日志，最新在前：[{ at, sql, seconds, rows, caller, plan? }]"""
+    with _slow_lock:
+        items = list(_slow_log)
+    items.reverse()
+    return items[:limit] if limit else items
+
+
+def clear_slow_queries():
+    with _slow_lock:
+        _slow_log.clear()
+
+
+def _explain(conn, sql, params):
+    """对只读语句取 EXPLAIN (ANALYZE, BUFFERS)；在保存点内执行，失败不影响调用方事务"""
+    head = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ""
+    if head not in ("SELECT", "WITH") or conn is None:
+        return None
+    cur = conn.cursor()
+    savepoint = not conn.autocommit
+    try:
+        if savepoint:
+            cur.execute("SAVEPOINT rt_risk_explain")
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql, params)
+        plan = "\n".join(r[0] for r in cur.fetchall())
+        if savepoint:
+            cur.execute("RELEASE SAVEPOINT rt_risk_explain")
+        return plan
+    except Exception as e:
+        if savepoint:
+            try:
+                cur.execute("ROLLBACK TO SAVEPOINT rt_risk_explain")
+            except Exception:
+                pass
+        return f"EXPLAIN 失败: {e}"
+    finally:
+        cur.close()
+
+
+def _record_slow(rec, conn, params):
+    entry = {"at": datetime.now().isoformat(timespec="seconds"), "sql": rec["sql"][:_MAX_SQL_LEN],
+             "seconds": round(rec["seconds"], 4), "rows": rec["rows"], "caller": rec["caller"]}
+    if SQL_EXPLAIN_SLOW and not _is_production():
+        entry["plan"] = _explain(conn, rec["sql"], params)
+    with _slow_lock:
+        _slow_log.append(entry)
+    import logging
+    logging.getLogger("db_connect").warning("[slow_sql] %.3fs rows=%s %s: %s",
+                                            rec["seconds"], rec["rows"], rec["caller"], entry["sql"][:200])
+
+
+def _estimate_bytes(rows) -> int:
+    """按首行字符长度 × 行数估算返回数据量，避免逐行序列化"""
+    if not rows:
+        return 0
+    return len(repr(rows[0])) * len(rows)
+
+
+class _InstrumentedCursor:
+    """
+    包装游标：execute 计时、记录行数，慢于阈值时写入慢查询日志；
+    有观察者或慢查询时才生成记录，调用方（栈帧回溯）仅在慢查询或观察者需要时解析，fetch* 估算返回字节数
+    """
+
+    def __init__(self, cur, conn=None):
+        self._cur = cur
+        self._conn = conn
+        self._rec = None
+
+    def execute(self, sql, params=None):
+        t0 = time.perf_counter()
+        try:
+            return self._cur.execute(sql, params)
+        finally:
+            seconds = time.perf_counter() - t0
+            slow = SQL_SLOW_THRESHOLD_MS > 0 and seconds * 1000 >= SQL_SLOW_THRESHOLD_MS
+            if _query_observers or slow:
+                rec = {"sql": sql if isinstance(sql, str) else str(sql), "seconds": seconds,
+                       "rows": max(self._cur.rowcount or 0, 0), "bytes": 0,
+                       "caller": _caller_tag() if slow or _caller_observers else None}
+                self._rec = rec
+                if slow:
+                    try:
+                        _record_slow(rec, self._conn, params)
+                    except Exception:
+                        pass
+                for fn in list(_query_observers):
+                    try:
+                        fn(rec)
+                    except Exception:
+                        pass
+            else:
+                self._rec = None
+
+    def _count(self, rows):
+        if self._rec is not None and rows:
+            self._rec["bytes"] += _estimate_bytes(rows)
+        return rows
+
+    def fetchone(self):
+        row = self._cur.fetchone()
+        if self._rec is not None and row is not None:
+            self._rec["bytes"] += len(repr(row))
+        return row
+
+    def fetchall(self):
+        return self._count(self._cur.fetchall())
+
+    def fetchmany(self, *args, **kwargs):
+        return self._count(self._cur.fetchmany(*args, **kwargs))
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cur.close()
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
 
 
 class _PooledConnWrapper:
-    """包装连接池中的连接，使 close() 归还到池而非真正关闭"""
+    """
+    包装连接：cursor() 返回带计时的游标（_InstrumentedCursor）
+    pool_obj 非空时 close() 归还到池而非真正关闭；为空（独立连接）时直接关闭
+    """
 
     def __init__(self, conn, pool_obj):
         self._conn = conn
         self._pool = pool_obj
 
+    def cursor(self, *args, **kwargs):
+        return _InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._conn)
+
     def close(self):
         if self._pool and self._conn:
             try:
@@ -29,6 +216,12 @@ class _PooledConnWrapper:
                 except Exception:
                     pass
             self._conn = None
+        elif self._conn:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
 
     def __getattr__(self, name):
         return getattr(self._conn, name)
@@ -94,13 +287,17 @@ def get_connection():
     """创建并返回数据库连接（含 DNS 不稳定时的重试）"""
     def _do_connect():
         if (os.getenv("DATABASE_URL") or "").strip():
-            return _connect_with_string()
+            return _PooledConnWrapper(_connect_with_string(), None)
         pool_cfg = get_pool_config()
         if pool_cfg["pool_size"] > 1:
             p = _get_pool()
-            conn = p.getconn()
+            try:
+                conn = p.getconn()
+            except pool.PoolError:
+                # 池已满（如并发刷新）时不阻塞，临时建立独立连接，close() 即真正关闭
+                return _PooledConnWrapper(psycopg2.connect(**_get_connect_kwargs()), None)
             return _PooledConnWrapper(conn, p)
-        return psycopg2.connect(**_get_connect_kwargs())
+        return _PooledConnWrapper(psycopg2.connect(**_get_connect_kwargs()), None)
 
     return _connect_with_retry(_do_connect)
 
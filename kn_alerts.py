@@ -0,0 +1,216 @@
+"""
+告警引擎 - 生产商分片板块刷新时增量评估阈值规则，结果与历史写入告警状态（kn_producer_cache.alert_state.json），
+告警面板（alert_panel）直接读取，不再重新推导
+- 规则：覆盖倍数 vs 补仓线 / 平仓线、DPD30+ 占比、M0 占比、杠杆 vs 上限、日环比突增
+- 每条规则声明依赖的分片板块（risk / priority），板块刷新时只评估相关规则，其余规则的告警原样保留
+- 告警按 key 去重：首次触发 open，严重程度变化记 severity 事件，不再触发时 resolved（保留 ALERT_RESOLVED_KEEP_DAYS 天）
+- 每个生产商保留最近 ALERT_HISTORY_LIMIT 条事件（open / severity / resolve）
+"""
+import os
+from datetime import datetime, timedelta
+
+ALERT_HISTORY_LIMIT = int(os.getenv("ALERT_HISTORY_LIMIT", "200") or 200)
+ALERT_RESOLVED_KEEP_DAYS = int(os.getenv("ALERT_RESOLVED_KEEP_DAYS", "7") or 7)
+
+# 阈值（比例均为小数）；与生产商列表卡片 / 风控页配色一致
+ALERT_THRESHOLDS = {
+    "dpd30_medium": 0.03,
+    "dpd30_high": 0.05,
+    "m0_medium": 0.96,
+    "m0_high": 0.93,
+    "leverage_medium": 0.9,  # 当前杠杆 / 上限
+    "spike_pp": 0.005,  # 日环比变化 0.5 个百分点
+}
+
+# 分片板块 -> 受影响的规则板块（单个生产商风控刷新时同时重算优先级指标）
+SECTION_RULE_SCOPES = {"risk": ("risk", "priority"), "priority": ("priority",), "revenue": (), "cashflow": ()}
+
+_SEVERITY_ORDER = {"high": 0, "medium": 1, "low": 2}
+_SPIKE_METRICS = (
+    # (字段, 名称, 方向：1 上升告警 / -1 下降告警)
+    ("overdue_1_plus_ratio", "逾期1+占比", 1),
+    ("overdue_30_plus_ratio", "DPD30+占比", 1),
+    ("m0_ratio", "M0占比", -1),
+)
+
+
+def _f(v, default=None):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return default
+
+
+def _latest_two(risk_data):
+    """risk_data 中 stat_date 最大的两行：(latest, previous)，不足时为 None"""
+    rows = sorted((r for r in (risk_data or []) if r.get("stat_date")), key=lambda r: str(r["stat_date"]))
+    if not rows:
+        return None, None
+    return rows[-1], (rows[-2] if len(rows) >= 2 else None)
+
+
+def _hit(key, severity, title, detail, value, threshold, stat_date):
+    return {"key": key, "severity": severity, "title": title, "detail": detail,
+            "value": value, "threshold": threshold, "date": stat_date}
+
+
+def _rule_coverage(pc, th):
+    cov = (pc.get("priority_indicators") or {}).get("coverage_ratio") or {}
+    cur = _f(cov.get("current"))
+    if cur is None:
+        return []
+    liq = _f(cov.get("liquidation"), 1.02)
+    mc = _f(cov.get("margin_call"), 1.15)
+    stat_date = (cov.get("breakdown") or {}).get("stat_date") or ""
+    if cur <= liq:
+        return [_hit("coverage", "high", "覆盖倍数低于平仓线",
+                     f"当前覆盖倍数 {cur:.2f}x ≤ 平仓线 {liq:.2f}x", cur, liq, stat_date)]
+    if cur <= mc:
+        return [_hit("coverage", "medium", "覆盖倍数低于补仓线",
+                     f"当前覆盖倍数 {cur:.2f}x ≤ 补仓线 {mc:.2f}x（平仓线 {liq:.2f}x）", cur, mc, stat_date)]
+    return []
+
+
+def _rule_leverage(pc, th):
+    lev = (pc.get("priority_indicators") or {}).get("leverage_ratio") or {}
+    cur, limit = _f(lev.get("current")), _f(lev.get("limit"))
+    if cur is None or not limit:
+        return []
+    if cur >= limit:
+        return [_hit("leverage", "high", "杠杆倍数超过上限",
+                     f"当前杠杆 {cur:.1f}x ≥ 上限 {limit:.1f}x", cur, limit, "")]
+    if cur >= limit * th["leverage_medium"]:
+        return [_hit("leverage", "medium", "杠杆倍数接近上限",
+                     f"当前杠杆 {cur:.1f}x，已用 {cur / limit:.0%}（上限 {limit:.1f}x）",
+                     cur, limit * th["leverage_medium"], "")]
+    return []
+
+
+def _rule_dpd30(pc, th):
+    latest, _ = _latest_two(pc.get("risk_data"))
+    v = _f((latest or {}).get("overdue_30_plus_ratio"))
+    if v is None:
+        return []
+    for sev in ("high", "medium"):
+        limit = th[f"dpd30_{sev}"]
+        if v >= limit:
+            return [_hit("dpd30", sev, "DPD30+ 占比偏高", f"DPD30+ 占比 {v:.2%} ≥ {limit:.2%}",
+                         v, limit, latest["stat_date"])]
+    return []
+
+
+def _rule_m0(pc, th):
+    latest, _ = _latest_two(pc.get("risk_data"))
+    v = _f((latest or {}).get("m0_ratio"))
+    if v is None:
+        return []
+    for sev in ("high", "medium"):
+        limit = th[f"m0_{sev}"]
+        if v < limit:
+            return [_hit("m0", sev, "M0 占比偏低", f"M0 占比 {v:.2%} < {limit:.2%}", v, limit, latest["stat_date"])]
+    return []
+
+
+def _rule_spike(pc, th):
+    latest, prev = _latest_two(pc.get("risk_data"))
+    if not latest or not prev:
+        return []
+    out = []
+    for field, label, direction in _SPIKE_METRICS:
+        a, b = _f(prev.get(field)), _f(latest.get(field))
+        if a is None or b is None:
+            continue
+        delta = (b - a) * direction
+        if delta >= th["spike_pp"]:
+            sev = "high" if delta >= th["spike_pp"] * 3 else "medium"
+            out.append(_hit(f"spike:{field}", sev, f"{label}日环比{'上升' if direction > 0 else '下降'}",
+                            f"{prev['stat_date']} {a:.2%} → {latest['stat_date']} {b:.2%}（{(b - a) * 100:+.2f}pp）",
+                            b, th["spike_pp"], latest["stat_date"]))
+    return out
+
+
+# (规则名, 依赖的板块, 评估函数)；告警 key 以规则名开头
+ALERT_RULES = (
+    ("coverage", ("priority",), _rule_coverage),
+    ("leverage", ("priority",), _rule_leverage),
+    ("dpd30", ("risk",), _rule_dpd30),
+    ("m0", ("risk",), _rule_m0),
+    ("spike", ("risk",), _rule_spike),
+)
+
+
+def rule_scopes_for_section(section):
+    """分片板块对应的规则板块；None 表示全部板块（全量发布）"""
+    if section is None:
+        return None
+    return SECTION_RULE_SCOPES.get(section, (section,))
+
+
+def _coverage_snapshot(pc):
+    cov = (pc.get("priority_indicators") or {}).get("coverage_ratio") or {}
+    if not cov:
+        return None
+    return {k: cov.get(k) for k in ("current", "baseline", "margin_call", "liquidation")}
+
+
+def evaluate_producer(pc: dict, prev: dict = None, scopes=None, now: datetime = None, thresholds: dict = None) -> dict:
+    """
+    增量评估单个生产商：只运行依赖 scopes 中板块的规则（None 为全部），与上次状态 prev 合并
+    返回新的状态 { updated_at, alerts, history, coverage }；scopes 为空元组时原样返回 prev
+    """
+    prev = prev or {}
+    rules = [r for r in ALERT_RULES if scopes is None or set(r[1]) & set(scopes)]
+    if not rules and prev:
+        return prev
+    now = now or datetime.now()
+    at = now.isoformat(timespec="seconds")
+    th = dict(ALERT_THRESHOLDS, **(thresholds or {}))
+
+    hits = {}
+    for name, _, fn in rules:
+        try:
+            for h in fn(pc, th):
+                hits[h["key"]] = dict(h, rule=name)
+        except Exception:
+            continue
+    evaluated = {name for name, _, _ in rules}
+
+    alerts = {a["key"]: dict(a) for a in prev.get("alerts") or []}
+    events = []
+    for key, h in hits.items():
+        a = alerts.get(key)
+        if a is None or a.get("status") != "open":
+            alerts[key] = dict(h, status="open", opened_at=at, resolved_at=None, date=h["date"] or at[:10])
+            events.append({"at": at, "key": key, "event": "open", "severity": h["severity"], "value": h["value"]})
+            continue
+        if a.get("severity") != h["severity"]:
+            events.append({"at": at, "key": key, "event": "severity", "severity": h["severity"], "value": h["value"]})
+        a.update({k: h[k] for k in ("severity", "title", "detail", "value", "threshold")})
+        a["date"] = h["date"] or a.get("date")
+    for key, a in alerts.items():
+        if a.get("rule") in evaluated and key not in hits and a.get("status") == "open":
+            a["status"] = "resolved"
+            a["resolved_at"] = at
+            events.append({"at": at, "key": key, "event": "resolve", "severity": a.get("severity"), "value": None})
+
+    keep_after = (now - timedelta(days=ALERT_RESOLVED_KEEP_DAYS)).isoformat(timespec="seconds")
+    active = [a for a in alerts.values() if a.get("status") == "open" or (a.get("resolved_at") or "") >= keep_after]
+    active.sort(key=lambda a: (a.get("status") != "open", _SEVERITY_ORDER.get(a.get("severity"), 9),
+                               a.get("key", "")))
+    history = (list(prev.get("history") or []) + events)[-ALERT_HISTORY_LIMIT:]
+    coverage = _coverage_snapshot(pc) if scopes is None or "priority" in scopes else prev.get("coverage")
+    return {"updated_at": at, "alerts": active, "history": history, "coverage": coverage}
+
+
+def evaluate_all(producers: dict, prev_state: dict = None, now: datetime = None) -> dict:
+    """全量发布：全部生产商评估全部规则（与上次状态合并以保留历史），返回 { sid: state }"""
+    prev_state = prev_state or {}
+    now = now or datetime.now()
+    out = {}
+    for sid, pc in producers.items():
+        try:
+            out[sid] = evaluate_producer(pc, prev_state.get(sid), None, now)
+        except Exception:
+            if prev_state.get(sid):
+                out[sid] = prev_state[sid]
+    return out
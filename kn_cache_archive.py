@@ -0,0 +1,228 @@
+"""
+全量缓存每日归档 - 内容寻址 + gzip 压缩 + 去重
+- 每个生产商按板块（风控/收益/现金流/优先级/基础信息）拆成块，按内容 sha256 命名，相同内容只存一份
+- 风控（每个 stat_date 一行）、收益（每月一行）按行成块：每天新增一个日期 / 月份时，历史行仍命中已有块；
+  现金流预测、优先级指标随基准日整体变化，按板块成块，基本不跨天去重
+- 刷新时间等易变字段（_VOLATILE_KEYS）不参与 hash，单独记在 manifest 中，还原时合并回去
+- 每天一个 manifest（daily/manifest_YYYY-MM-DD.json）记录当天各块的 hash
+- load_daily_archive(date) 按日期还原当天全量缓存（与 producer_full_cache 结构一致）
+- 默认保留 365 天；过期 manifest 删除后，未被任何 manifest 引用的块一并清理
+"""
+import gzip
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+
+from kn_producer_cache import DAILY_CACHE_DIR
+
+ARCHIVE_RETENTION_DAYS = int(os.getenv("CACHE_ARCHIVE_RETENTION_DAYS", "365") or 365)
+OBJECTS_DIR = os.path.join(DAILY_CACHE_DIR, "objects")
+_MANIFEST_PREFIX = "manifest_"
+_LEGACY_PREFIX = "producer_full_cache_"
+# 单独成块的板块；其余字段（名称、汇率等）合并为 info 块
+_SECTIONS = ("risk_data", "revenue_data", "cashflow_data", "priority_indicators")
+# 按行成块的板块（列表，每行对应一个 stat_date / 月份）
+_ROW_SECTIONS = ("risk_data", "revenue_data")
+_VOLATILE_KEYS = ("last_updated", "updated_at", "computed_at", "refreshed_at")
+
+
+def _object_path(h: str) -> str:
+    return os.path.join(OBJECTS_DIR, h[:2], f"{h}.json.gz")
+
+
+def _manifest_path(date_str: str) -> str:
+    return os.path.join(DAILY_CACHE_DIR, f"{_MANIFEST_PREFIX}{date_str}.json")
+
+
+def _put_object(value) -> str:
+    """写入内容块（已存在则跳过），返回 hash"""
+    raw = json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    h = hashlib.sha256(raw).hexdigest()
+    path = _object_path(h)
+    if not os.path.isfile(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp, "wb", compresslevel=6) as f:
+            f.write(raw)
+        os.replace(tmp, path)
+    return h
+
+
+def _get_object(h: str):
+    if not h:
+        return None
+    with gzip.open(_object_path(h), "rb") as f:
+        return json.loads(f.read().decode("utf-8"))
+
+
+def _put_section(sec: str, value, volatile: dict):
+    """写入一个板块：按行板块返回 hash 列表，其余返回单个 hash；易变字段移入 volatile[sec]"""
+    if sec in _ROW_SECTIONS and isinstance(value, list):
+        return [_put_object(row) for row in value]
+    if isinstance(value, dict):
+        vol = {k: value[k] for k in _VOLATILE_KEYS if k in value}
+        if vol:
+            volatile[sec] = vol
+            value = {k: v for k, v in value.items() if k not in vol}
+    return _put_object(value)
+
+
+def _get_section(sec: str, ref, volatile: dict):
+    if isinstance(ref, list):
+        return [_get_object(h) for h in ref]
+    value = _get_object(ref)
+    if isinstance(value, dict) and volatile.get(sec):
+        value = dict(value, **volatile[sec])
+    return value
+
+
+def _entry_hashes(entry: dict):
+    """manifest 中一个生产商条目引用的全部块 hash"""
+    for sec, ref in entry.items():
+        if sec == "volatile":
+            continue
+        if isinstance(ref, list):
+            yield from ref
+        else:
+            yield ref
+
+
+def archive_daily_snapshot(data: dict, date_str: str = None) -> str:
+    """
+    归档一份全量缓存（save_producer_full_cache 调用）
+    data: { last_updated, system_cutover_date, producers, portfolio_cumulative_stats, allocation_by_platform }
+    同一天多次刷新时覆盖当天 manifest；返回 manifest 路径
+    """
+    date_str = date_str or datetime.now().strftime("%Y-%m-%d")
+    producers = {}
+    for sid, pc in (data.get("producers") or {}).items():
+        pc = pc or {}
+        volatile = {}
+        entry = {sec: _put_section(sec, pc.get(sec), volatile) for sec in _SECTIONS if sec in pc}
+        entry["info"] = _put_section("info", {k: v for k, v in pc.items() if k not in _SECTIONS}, volatile)
+        if volatile:
+            entry["volatile"] = volatile
+        producers[sid] = entry
+    manifest = {
+        "date": date_str,
+        "last_updated": data.get("last_updated"),
+        "system_cutover_date": data.get("system_cutover_date"),
+        "portfolio_cumulative_stats": _put_object(data.get("portfolio_cumulative_stats")),
+        "allocation_by_platform": _put_object(data.get("allocation_by_platform")),
+        "producers": producers,
+    }
+    path = _manifest_path(date_str)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def list_archive_dates() -> list:
+    """已归档日期（升序），含旧版整包归档"""
+    if not os.path.isdir(DAILY_CACHE_DIR):
+        return []
+    dates = set()
+    for f in os.listdir(DAILY_CACHE_DIR):
+        if not f.endswith(".json"):
+            continue
+        for prefix in (_MANIFEST_PREFIX, _LEGACY_PREFIX):
+            if f.startswith(prefix):
+                dates.add(f[len(prefix):-len(".json")])
+    return sorted(dates)
+
+
+def load_daily_archive(date_str: str, spv_id: str = None):
+    """
+    按日期读取归档，返回与 producer_full_cache 相同结构的 dict，无则 None
+    spv_id 非空时只还原该生产商（其他生产商块不解压）
+    兼容旧版 producer_full_cache_YYYY-MM-DD.json
+    """
+    try:
+        date_str = datetime.strptime(str(date_str)[:10], "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+    path = _manifest_path(date_str)
+    if not os.path.isfile(path):
+        legacy = os.path.join(DAILY_CACHE_DIR, f"{_LEGACY_PREFIX}{date_str}.json")
+        if not os.path.isfile(legacy):
+            return None
+        try:
+            with open(legacy, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return None
+        if spv_id:
+            sid = str(spv_id).strip().lower()
+            data["producers"] = {k: v for k, v in (data.get("producers") or {}).items() if k == sid}
+        return data
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        producers = {}
+        for sid, entry in (manifest.get("producers") or {}).items():
+            if spv_id and sid != str(spv_id).strip().lower():
+                continue
+            volatile = entry.get("volatile") or {}
+            pc = dict(_get_section("info", entry.get("info"), volatile) or {})
+            for sec in _SECTIONS:
+                if sec in entry:
+                    pc[sec] = _get_section(sec, entry[sec], volatile)
+            producers[sid] = pc
+        return {
+            "date": date_str,
+            "last_updated": manifest.get("last_updated"),
+            "system_cutover_date": manifest.get("system_cutover_date"),
+            "producers": producers,
+            "portfolio_cumulative_stats": _get_object(manifest.get("portfolio_cumulative_stats")),
+            "allocation_by_platform": _get_object(manifest.get("allocation_by_platform")),
+        }
+    except Exception:
+        return None
+
+
+def purge_daily_archive(retention_days: int = None):
+    """删除超过保留期的 manifest / 旧版归档，并清理不再被引用的内容块"""
+    if not os.path.isdir(DAILY_CACHE_DIR):
+        return
+    retention_days = retention_days or ARCHIVE_RETENTION_DAYS
+    cutoff = (datetime.now() - timedelta(days=retention_days)).strftime("%Y-%m-%d")
+    referenced = set()
+    for f in os.listdir(DAILY_CACHE_DIR):
+        path = os.path.join(DAILY_CACHE_DIR, f)
+        if not f.endswith(".json"):
+            continue
+        prefix = _MANIFEST_PREFIX if f.startswith(_MANIFEST_PREFIX) else (
+            _LEGACY_PREFIX if f.startswith(_LEGACY_PREFIX) else None)
+        if not prefix:
+            continue
+        if f[len(prefix):-len(".json")] < cutoff:
+            try:
+                os.remove(path)
+            except Exception:
+                pass
+            continue
+        if prefix == _MANIFEST_PREFIX:
+            try:
+                with open(path, "r", encoding="utf-8") as fp:
+                    m = json.load(fp)
+                referenced.add(m.get("portfolio_cumulative_stats"))
+                referenced.add(m.get("allocation_by_platform"))
+                for entry in (m.get("producers") or {}).values():
+                    referenced.update(_entry_hashes(entry))
+            except Exception:
+                return  # manifest 读取失败时不做块清理，避免误删
+    if not os.path.isdir(OBJECTS_DIR):
+        return
+    for sub in os.listdir(OBJECTS_DIR):
+        subdir = os.path.join(OBJECTS_DIR, sub)
+        if not os.path.isdir(subdir):
+            continue
+        for f in os.listdir(subdir):
+            if f.endswith(".json.gz") and f[:-len(".json.gz")] not in referenced:
+                try:
+                    os.remove(os.path.join(subdir, f))
+                except Exception:
+                    pass
@@ -2,10 +2,18 @@
 缓存存储后端 - 支持文件系统与 Vercel Blob（跨实例共享）
 - Vercel + Blob：使用 Vercel Blob 存储，Admin 刷新后所有实例可访问
 - 本地：使用 config/cache 或 /tmp
+- 刷新日志：分段对象（SegmentedBlobLog），不再整文件读-追加-写
+- Blob 读取分层：进程内存（LRU，按条数与总字节数限制）-> /tmp 镜像（按 uploadedAt 校验）-> 条件 GET；list 结果短时缓存
 """
+import hashlib
 import json
 import logging
 import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
 from typing import Optional, Union
 
 log = logging.getLogger("kn_cache_storage")
@@ -13,7 +21,35 @@ log = logging.getLogger("kn_cache_storage")
 BLOB_PREFIX = "rt_risk/"
 BLOB_PATH_CACHE = BLOB_PREFIX + "producer_full_cache.json"
 BLOB_PATH_META = BLOB_PREFIX + "cache_meta.json"
-BLOB_PATH_LOG = BLOB_PREFIX + "refresh_log.txt"
+BLOB_PATH_LOG = BLOB_PREFIX + "refresh_log.txt"  # 旧版单文件日志，仅兼容读取
+BLOB_LOG_PREFIX = BLOB_PREFIX + "refresh_log/"
+BLOB_PATH_LOG_HEAD = BLOB_LOG_PREFIX + "current.json"
+BLOB_PATH_MANIFEST = BLOB_PREFIX + "producer_cache_manifest.json"
+BLOB_PATH_PARTNER_SUMMARY = BLOB_PREFIX + "partner_summary.json"
+BLOB_PATH_ALERT_STATE = BLOB_PREFIX + "alert_state.json"
+BLOB_SHARD_PREFIX = BLOB_PREFIX + "shards/"
+BLOB_JOB_PREFIX = BLOB_PREFIX + "refresh_job/"
+BLOB_PATH_JOB = BLOB_JOB_PREFIX + "job.json"
+BLOB_STAGING_PREFIX = BLOB_JOB_PREFIX + "staging/"
+BLOB_PATH_PROFILE = BLOB_PREFIX + "refresh_profile.json"
+BLOB_ROLL_RATE_PREFIX = BLOB_PREFIX + "roll_rate/"
+BLOB_PATH_PROFILE_PREV = BLOB_PREFIX + "refresh_profile_prev.json"
+BLOB_PATH_JOB_PROFILE = BLOB_JOB_PREFIX + "profile.json"
+
+
+def blob_shard_path(spv_id: str) -> str:
+    """单个生产商分片在 Blob 中的路径"""
+    return f"{BLOB_SHARD_PREFIX}{spv_id}.json"
+
+
+def blob_staging_path(spv_id: str) -> str:
+    """可续跑刷新中单个生产商已完成板块的暂存对象路径"""
+    return f"{BLOB_STAGING_PREFIX}{str(spv_id or '').strip().lower()}.json"
+
+
+def blob_roll_rate_path(spv_id: str) -> str:
+    """单个 SPV 迁移矩阵缓存在 Blob 中的路径"""
+    return f"{BLOB_ROLL_RATE_PREFIX}{str(spv_id or '').strip().lower()}.json"
 
 
 def _use_blob():
@@ -35,51 +71,378 @@ def _blob_put(path: str, content: Union[str, bytes]) -> bool:
         if len(data) == 0:
             data = b"\n"
         vercel_blob.put(path, data, {"allowOverwrite": "true"})
+        # 本实例的旧镜像与 list 结果已过期，下次读取重新校验
+        _mirror_drop(path)
+        _invalidate_list_cache(path)
         return True
     except Exception as e:
         log.error("[blob_put] 失败 path=%s: %s", path, e)
         return False
 
 
+# ---------- 读取分层：进程内存 -> /tmp 镜像 -> 条件 GET ----------
+# list 结果短时缓存（秒），同一文件夹的多次读取只列一次
+BLOB_LIST_TTL = float(os.getenv("BLOB_LIST_TTL", "10") or 10)
+_BLOB_MIRROR_DIR = os.path.join("/tmp", "rt_risk_blob_mirror")
+_list_cache = {}  # folder -> (ts, {pathname: blob})
+_list_lock = threading.Lock()
+# 进程内存层上限：条数、总字节数（按 text 长度估算）；超出时淘汰最久未用
+BLOB_MEMORY_MAX_ENTRIES = int(os.getenv("BLOB_MEMORY_MAX_ENTRIES", "64") or 64)
+BLOB_MEMORY_MAX_BYTES = int(os.getenv("BLOB_MEMORY_MAX_BYTES", str(64 * 1024 * 1024)) or 64 * 1024 * 1024)
+_blob_memory = OrderedDict()  # path -> {"version", "etag", "text"}，最近使用在末尾
+_blob_memory_bytes = 0
+_blob_memory_lock = threading.Lock()
+_session = None
+
+
+def _memory_size(entry: dict) -> int:
+    return len(entry.get("text") or "")
+
+
+def _memory_get(path: str) -> Optional[dict]:
+    with _blob_memory_lock:
+        entry = _blob_memory.get(path)
+        if entry is not None:
+            _blob_memory.move_to_end(path)
+        return entry
+
+
+def _memory_put(path: str, entry: dict):
+    """写入进程内存层；单条超过字节上限时不缓存（仍有 /tmp 镜像）"""
+    global _blob_memory_bytes
+    with _blob_memory_lock:
+        old = _blob_memory.pop(path, None)
+        if old is not None:
+            _blob_memory_bytes -= _memory_size(old)
+        size = _memory_size(entry)
+        if size > BLOB_MEMORY_MAX_BYTES:
+            return
+        _blob_memory[path] = entry
+        _blob_memory_bytes += size
+        while _blob_memory and (len(_blob_memory) > BLOB_MEMORY_MAX_ENTRIES
+                                or _blob_memory_bytes > BLOB_MEMORY_MAX_BYTES):
+            _, evicted = _blob_memory.popitem(last=False)
+            _blob_memory_bytes -= _memory_size(evicted)
+
+
+def _memory_drop(path: str):
+    global _blob_memory_bytes
+    with _blob_memory_lock:
+        old = _blob_memory.pop(path, None)
+        if old is not None:
+            _blob_memory_bytes -= _memory_size(old)
+
+
+def _get_session():
+    """复用 HTTP 连接（keep-alive），避免每次下载重新握手"""
+    global _session
+    if _session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        s = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        s.mount("https://", adapter)
+        s.mount("http://", adapter)
+        _session = s
+    return _session
+
+
+def _blob_version(b: dict) -> str:
+    """blob 版本标识：uploadedAt + size（覆盖写入后 uploadedAt 必变）"""
+    return f"{b.get('uploadedAt') or ''}|{b.get('size') or ''}|{b.get('url') or ''}"
+
+
+def _blob_list_folder(folder: str, force: bool = False, folded: bool = False) -> dict:
+    """
+    列出文件夹下的 blob（分页），结果缓存 BLOB_LIST_TTL 秒；返回 {pathname: blob}
+    folded=True 时只列直接子对象（mode=folded，子文件夹不展开），供按精确路径读取；
+    默认递归列出全部下级对象，供清理分段日志、暂存等按文件夹遍历
+    """
+    key = (folder, folded)
+    now = time.time()
+    with _list_lock:
+        hit = _list_cache.get(key)
+        if hit and not force and now - hit[0] < BLOB_LIST_TTL:
+            return hit[1]
+    import vercel_blob
+    result = {}
+    cursor = None
+    for _ in range(50):
+        opts = {"prefix": folder, "limit": "1000"}
+        if folded:
+            opts["mode"] = "folded"
+        if cursor:
+            opts["cursor"] = cursor
+        blobs = vercel_blob.list(opts)
+        if not isinstance(blobs, dict):
+            break
+        for x in blobs.get("blobs", []) or []:
+            if x.get("pathname"):
+                result[x["pathname"]] = x
+        cursor = blobs.get("cursor")
+        if not blobs.get("hasMore") or not cursor:
+            break
+    with _list_lock:
+        _list_cache[key] = (time.time(), result)
+    return result
+
+
+def _invalidate_list_cache(path: str = None):
+    """写入后使所在文件夹的 list 缓存失效；path 为空时全部失效"""
+    with _list_lock:
+        if path is None:
+            _list_cache.clear()
+        else:
+            folder = _blob_folder(path)
+            _list_cache.pop((folder, False), None)
+            _list_cache.pop((folder, True), None)
+
+
+def _blob_folder(path: str) -> str:
+    return path.rsplit("/", 1)[0] + "/" if "/" in path else BLOB_PREFIX
+
+
+def _mirror_paths(path: str):
+    h = hashlib.sha1(path.encode("utf-8")).hexdigest()
+    return os.path.join(_BLOB_MIRROR_DIR, h + ".meta.json"), os.path.join(_BLOB_MIRROR_DIR, h + ".body")
+
+
+def _mirror_read(path: str) -> Optional[dict]:
+    """读取 /tmp 镜像（实例重启前的热数据），无则 None"""
+    meta_path, body_path = _mirror_paths(path)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(body_path, "r", encoding="utf-8") as f:
+            meta["text"] = f.read()
+        return meta
+    except Exception:
+        return None
+
+
+def _mirror_write(path: str, entry: dict):
+    """写入 /tmp 镜像（先写 body 再写 meta，meta 存在即 body 完整）"""
+    meta_path, body_path = _mirror_paths(path)
+    try:
+        os.makedirs(_BLOB_MIRROR_DIR, exist_ok=True)
+        tmp = f"{body_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(entry["text"])
+        os.replace(tmp, body_path)
+        tmp = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"path": path, "version": entry.get("version"), "etag": entry.get("etag")}, f)
+        os.replace(tmp, meta_path)
+    except Exception as e:
+        log.debug("[blob_mirror] 写入失败 path=%s: %s", path, e)
+
+
+def _mirror_drop(path: str):
+    _memory_drop(path)
+    for p in _mirror_paths(path):
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+
+
+def _record_cache(layer: str, hit: bool):
+    """缓存命中统计（kn_metrics，/api/metrics）"""
+    try:
+        from kn_metrics import record_cache
+        record_cache(layer, hit)
+    except Exception:
+        pass
+
+
 def _blob_get(path: str) -> Optional[str]:
-    """从 Blob 读取内容（用文件夹 prefix 列出后按 pathname 精确匹配）"""
+    """
+    从 Blob 读取内容（用所在文件夹 prefix 列出后按 pathname 精确匹配）
+    版本（uploadedAt）未变时直接返回进程内存或 /tmp 镜像；变了才用 If-None-Match 条件下载
+    """
     token = os.getenv("BLOB_READ_WRITE_TOKEN")
     if not token:
         return None
     try:
-        import vercel_blob
-        # 用 rt_risk/ 前缀列出，避免精确 path 作为 prefix 时漏匹配
-        blobs = vercel_blob.list({"prefix": BLOB_PREFIX, "limit": "20"})
-        blobs_list = blobs.get("blobs", []) if isinstance(blobs, dict) else []
-        b = None
-        for x in blobs_list:
-            if x.get("pathname") == path:
-                b = x
-                break
+        # 用所在文件夹前缀折叠列出（如 rt_risk/、rt_risk/shards/）：只含直接子对象，
+        # 不随分片、日志分段、归档等下级对象增多而变慢；避免精确 path 作为 prefix 时漏匹配
+        b = _blob_list_folder(_blob_folder(path), folded=True).get(path)
         if not b:
+            _record_cache("blob", False)
             return None
+        version = _blob_version(b)
+        entry = _memory_get(path)
+        layer = "memory"
+        if entry is None:
+            entry = _mirror_read(path)
+            layer = "file"
+            if entry is not None:
+                _memory_put(path, entry)
+        if entry is not None and entry.get("version") == version:
+            _record_cache(layer, True)
+            return entry["text"]
+        _record_cache(layer, False)
         url = b.get("url") or b.get("downloadUrl")
         if not url:
             return None
-        import requests
         # Public blob URL（.public.blob.vercel-storage.com）无需 Authorization，带 token 反而可能 403
         headers = {}
         if ".private.blob.vercel-storage.com" in url:
             headers["Authorization"] = f"Bearer {token}"
-        r = requests.get(url, headers=headers, timeout=60)
-        r.raise_for_status()
-        return r.content.decode("utf-8", errors="replace")
+        if entry is not None and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        r = _get_session().get(url, headers=headers, timeout=60)
+        _record_cache("blob", True)
+        if r.status_code == 304 and entry is not None:
+            entry = dict(entry, version=version)
+        else:
+            r.raise_for_status()
+            entry = {"version": version, "etag": r.headers.get("ETag"),
+                     "text": r.content.decode("utf-8", errors="replace")}
+        _memory_put(path, entry)
+        _mirror_write(path, entry)
+        return entry["text"]
     except Exception as e:
         log.warning("[blob_get] 失败 path=%s: %s", path, e)
         return None
 
 
 def _blob_append(path: str, content: str) -> bool:
-    """追加内容到 Blob（读-追加-写）"""
+    """追加内容到 Blob（读-追加-写，O(n) 传输；刷新日志请用 SegmentedBlobLog）"""
     existing = _blob_get(path) or ""
     return _blob_put(path, existing + content)
 
 
+def _blob_delete(urls: list) -> bool:
+    """删除 Blob（按 url），失败忽略"""
+    if not urls or not os.getenv("BLOB_READ_WRITE_TOKEN"):
+        return False
+    try:
+        import vercel_blob
+        vercel_blob.delete(urls)
+        return True
+    except Exception as e:
+        log.warning("[blob_delete] 失败: %s", e)
+        return False
+
+
+# ---------- 分段日志：内存缓冲，按行数/字节/时间批量写入段对象 ----------
+LOG_FLUSH_LINES = int(os.getenv("REFRESH_LOG_FLUSH_LINES", "50") or 50)
+LOG_FLUSH_BYTES = int(os.getenv("REFRESH_LOG_FLUSH_BYTES", "65536") or 65536)
+LOG_FLUSH_SECONDS = float(os.getenv("REFRESH_LOG_FLUSH_SECONDS", "5") or 5)
+
+
+class SegmentedBlobLog:
+    """
+    刷新日志分段写入 Blob，替代整文件读-追加-写
+    - 布局：refresh_log/current.json 记录当前 run_id；段对象 refresh_log/<run_id>/00001.txt ...
+    - append 只写内存，满 LOG_FLUSH_LINES 行 / LOG_FLUSH_BYTES 字节 / LOG_FLUSH_SECONDS 秒时写一个段
+    - 段写入后不再修改，读取方列出后按序号拼接
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.run_id = None
+        self._buf = []
+        self._buf_bytes = 0
+        self._seq = 0
+        self._last_flush = time.time()
+
+    def start(self, first_text: str = ""):
+        """开始新一轮日志：生成 run_id、写 head、删除旧段"""
+        with self._lock:
+            self.run_id = datetime.now().strftime("%Y%m%d%H%M%S") + "_" + uuid.uuid4().hex[:8]
+            self._buf = []
+            self._buf_bytes = 0
+            self._seq = 0
+            self._last_flush = time.time()
+            run_id = self.run_id
+        try:
+            old = _blob_list_folder(BLOB_LOG_PREFIX, force=True)
+            stale = [b.get("url") for p, b in old.items()
+                     if p != BLOB_PATH_LOG_HEAD and not p.startswith(f"{BLOB_LOG_PREFIX}{run_id}/") and b.get("url")]
+            _blob_delete(stale)
+        except Exception:
+            pass
+        _blob_put(BLOB_PATH_LOG_HEAD, json.dumps({"run_id": run_id, "started_at": datetime.now().isoformat()}))
+        if first_text:
+            self.append(first_text)
+            self.flush()
+
+    def resume(self):
+        """续写 head 记录的 run（可续跑刷新的后续调用），段序号接在已有段之后；无 head 时开始新 run"""
+        head = cache_get_json(BLOB_PATH_LOG_HEAD)
+        if not head or not head.get("run_id"):
+            self.start()
+            return
+        run_id = head["run_id"]
+        seq = 0
+        try:
+            for p in _blob_list_folder(f"{BLOB_LOG_PREFIX}{run_id}/", force=True):
+                name = p.rsplit("/", 1)[-1]
+                if name.endswith(".txt") and name[:-4].isdigit():
+                    seq = max(seq, int(name[:-4]))
+        except Exception:
+            pass
+        with self._lock:
+            self.run_id = run_id
+            self._buf = []
+            self._buf_bytes = 0
+            self._seq = seq
+            self._last_flush = time.time()
+
+    def append(self, text: str):
+        """缓冲一行，达到阈值时写段"""
+        with self._lock:
+            if self.run_id is None:
+                return
+            self._buf.append(text)
+            self._buf_bytes += len(text.encode("utf-8"))
+            due = (len(self._buf) >= LOG_FLUSH_LINES or self._buf_bytes >= LOG_FLUSH_BYTES
+                   or time.time() - self._last_flush >= LOG_FLUSH_SECONDS)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """把缓冲内容写为一个新段（刷新结束时必须调用）"""
+        with self._lock:
+            if self.run_id is None or not self._buf:
+                self._last_flush = time.time()
+                return
+            self._seq += 1
+            path = f"{BLOB_LOG_PREFIX}{self.run_id}/{self._seq:05d}.txt"
+            content = "".join(self._buf)
+            self._buf = []
+            self._buf_bytes = 0
+            self._last_flush = time.time()
+        _blob_put(path, content)
+
+
+refresh_log_writer = SegmentedBlobLog()
+
+
+def read_segmented_log(max_lines: int = 2000) -> Optional[list]:
+    """
+    拼接当前 run 的日志段，返回最后 max_lines 行；无 head（旧版）返回 None
+    从最新段往前读，够行数即停止，段内容不变可命中本地镜像
+    """
+    head = cache_get_json(BLOB_PATH_LOG_HEAD)
+    if not head or not head.get("run_id"):
+        return None
+    folder = f"{BLOB_LOG_PREFIX}{head['run_id']}/"
+    try:
+        segs = sorted(p for p in _blob_list_folder(folder, force=True) if p.endswith(".txt"))
+    except Exception:
+        return None
+    lines = []
+    for p in reversed(segs):
+        raw = _blob_get(p) or ""
+        lines = raw.splitlines(keepends=True) + lines
+        if len(lines) >= max_lines:
+            break
+    return lines[-max_lines:]
+
+
 def cache_get_json(path: str) -> Optional[dict]:
     """从 Blob 读取 JSON"""
     raw = _blob_get(path)
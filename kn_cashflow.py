@@ -6,11 +6,54 @@
 import logging
 from datetime import datetime, date
 
-from kn_data_utils import get_calc_table
+from kn_data_utils import list_calc_tables
 
 log = logging.getLogger("kn_cashflow")
 
 
+def _forecast_from_refresh_run(spv_id: str, months_ahead: int, collection_rate: float):
+    """
+    全量刷新中：复用共享阶段 active_loans / schedule_by_month（与收益共用一次还款计划展开）
+    非刷新或阶段失败时返回 None，由调用方走原查询
+    """
+    try:
+        from kn_refresh_dag import current_run
+        run = current_run()
+        if run is None:
+            return None
+        latest_dt = run.get("latest_data_date")
+        as_of_str = (latest_dt or date.today()).strftime("%Y-%m-%d")
+        active = run.get("active_loans", spv_id)
+        if not active.get("loan_ids"):
+            log.info("[现金流] 无活跃贷款")
+            return {"forecast": [], "total_expected": 0, "as_of_date": as_of_str}
+        schedule = run.get("schedule_by_month", spv_id)
+    except Exception as e:
+        log.warning("[现金流] 共享阶段不可用，改为直接查询: %s", e)
+        return None
+    months = sorted(m for m, v in schedule.items() if v["loan_count_active"] > 0)[:months_ahead]
+    forecast = []
+    total_expected = 0.0
+    for m in months:
+        v = schedule[m]
+        principal, interest = v["principal_active"], v["interest_active"]
+        expected = (principal + interest) * collection_rate
+        total_expected += expected
+        forecast.append({
+            "month": m,
+            "expected_inflow": int(round(expected)),
+            "principal": int(round(principal)),
+            "interest": int(round(interest)),
+            "loan_count": v["loan_count_active"],
+        })
+    log.info("[现金流] 完成（共享阶段），%d 个月预测，总预期 %.0f", len(forecast), total_expected)
+    return {
+        "forecast": forecast,
+        "total_expected": int(round(total_expected)),
+        "as_of_date": as_of_str,
+    }
+
+
 def compute_cashflow_forecast(spv_id: str = "kn", months_ahead: int = 12, collection_rate: float = 0.98):
     """
     从数据库计算指定 spv_id 的未来现金流预测
@@ -22,16 +65,21 @@ def compute_cashflow_forecast(spv_id: str = "kn", months_ahead: int = 12, collec
         "forecast": [ { month, expected_inflow, principal, interest, loan_count }, ... ],
         "total_expected": float,
         "as_of_date": str,
+        "error"?: 数据库连接失败时附带（forecast 为空）
     }
     """
     log.info("[现金流] 开始计算 spv_id=%s months_ahead=%d", spv_id, months_ahead)
+    shared = _forecast_from_refresh_run(spv_id, months_ahead, collection_rate)
+    if shared is not None:
+        return shared
     try:
         from db_connect import get_connection
         conn = get_connection()
         cur = conn.cursor()
     except Exception as e:
         log.warning("[现金流] 数据库连接失败: %s", e)
-        return {"forecast": [], "total_expected": 0, "as_of_date": datetime.now().strftime("%Y-%m-%d")}
+        return {"forecast": [], "total_expected": 0, "as_of_date": datetime.now().strftime("%Y-%m-%d"),
+                "error": f"数据库连接失败: {e}"}
 
     today = date.today()
     try:
@@ -47,14 +95,8 @@ def compute_cashflow_forecast(spv_id: str = "kn", months_ahead: int = 12, collec
     active_loan_ids = set()
     latest_tbl = None
     latest_dt = None
-    tables_to_check = [get_calc_table(y, m) for y in [2024, 2025, 2026, 2027] for m in range(1, 13)]
-    placeholders = ",".join(["%s"] * len(tables_to_check))
     try:
-        cur.execute(
-            f"SELECT table_name FROM information_schema.tables WHERE table_schema='public' AND table_name IN ({placeholders})",
-            tables_to_check
-        )
-        existing_tables = [r[0] for r in cur.fetchall() if r and r[0]]
+        existing_tables = list_calc_tables(cur)
     except Exception:
         existing_tables = []
     for tbl in existing_tables:
@@ -12,7 +12,8 @@ log = logging.getLogger("kn_cashflow_cache")
 BASE_DIR = os.path.dirname(__file__)
 # Vercel/AWS Lambda 等 serverless 仅 /tmp 可写，与 kn_producer_cache 保持一致
 _IS_SERVERLESS = bool(os.getenv("VERCEL") or os.getenv("AWS_LAMBDA_FUNCTION_NAME") or os.getenv("LAMBDA_TASK_ROOT"))
-_CACHE_BASE = os.path.join("/tmp", "rt_risk_cache") if _IS_SERVERLESS else os.path.join(BASE_DIR, "config", "cache")
+_CACHE_BASE = os.getenv("RT_RISK_CACHE_DIR") or (
+    os.path.join("/tmp", "rt_risk_cache") if _IS_SERVERLESS else os.path.join(BASE_DIR, "config", "cache"))
 CACHE_DIR = _CACHE_BASE
 CACHE_FILE_PREFIX = "cashflow_cache_"
 
@@ -76,6 +77,8 @@ def refresh_cashflow_cache(spv_id: str, exchange_rate: float = 1, currency: str
         return {"error": str(e)}
 
     cf = compute_cashflow_forecast(spv_id=spv_id, months_ahead=12, collection_rate=collection_rate)
+    if cf.get("error"):
+        return {"error": cf["error"]}
     forecast = cf.get("forecast", [])
     total_expected = cf.get("total_expected", 0)
 
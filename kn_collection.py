@@ -6,7 +6,7 @@ from datetime import datetime
 from decimal import Decimal
 
 
-from kn_data_utils import get_calc_table
+from kn_data_utils import get_calc_table, table_exists
 
 
 def _dpd_bucket_into_collection(dpd):
@@ -69,11 +69,7 @@ def compute_collection_report(spv_id: str, stat_date: str):
     cur = conn.cursor()
 
     # 检查 calc_overdue 表存在
-    cur.execute(
-        "SELECT 1 FROM information_schema.tables WHERE table_schema='public' AND table_name = %s",
-        (calc_table,)
-    )
-    if not cur.fetchone():
+    if not table_exists(cur, calc_table):
         cur.close()
         conn.close()
         return []
@@ -176,11 +172,7 @@ def compute_collection_report(spv_id: str, stat_date: str):
     for (y, m) in months_needed:
         ct = f"calc_overdue_y{y}m{m:02d}"
         try:
-            cur.execute(
-                "SELECT 1 FROM information_schema.tables WHERE table_schema='public' AND table_name = %s",
-                (ct,)
-            )
-            if not cur.fetchone():
+            if not table_exists(cur, ct):
                 continue
             cur.execute(f"""
                 SELECT loan_id, stat_date::date, dpd
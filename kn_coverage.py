@@ -0,0 +1,221 @@
+"""
+覆盖倍数时间序列 - 每个 SPV、每个历史 stat_date 一次批量计算全部口径，供风控页绘制覆盖倍数与斩仓线/平仓线走势
+- m0：方案一（与 spv_internal_params._compute_coverage_ratio 同公式）
+- abs：方案二 ABS（与 _compute_coverage_ratio_abs 同公式）
+- contract：合同口径，Value = (剩余本金 + 剩余应收利息) * (1 - Vtg30)，不含早偿折损与现金
+  （scripts/coverage_ratio_docking.py Method 1 按还款计划求未来应还，这里用日指标 current_balance + all_remaining_interest）
+- vintage：Vintage 口径，合同剩余价值按 cohort 余额分摊后乘 survival = ∏(1 - default_mob_i)，i = 1..min(剩余月数, max_mob)
+  （scripts/coverage_method2_only.py 逐笔贷款计算，这里按放款月 cohort 计算；该日无 vintage_data 时为 None）
+- 参数按生效日匹配：每个 stat_date 使用 effective_date <= stat_date 的最新一条 spv_internal_params，
+  该日尚无生效参数时各口径为 None
+- 结果按列存放（stat_date / m0 / abs / contract / vintage 等长列表），随 priority_indicators.coverage_series 写入分片
+"""
+import math
+from bisect import bisect_right
+
+from spv_internal_params import (
+    _coverage_params, _num, _rows_by_spv, _spv_cfg_from_producer, _spv_cfg_from_rec,
+)
+
+COVERAGE_METHODS = ("m0", "abs", "contract", "vintage")
+
+
+def _f(v):
+    try:
+        return float(v or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _eff_key(rec) -> str:
+    """effective_date 统一为 YYYY-MM-DD 字符串；缺失时排在最前（视为自始生效）"""
+    v = rec.get("effective_date")
+    if v is None or v == "":
+        return ""
+    return v.isoformat()[:10] if hasattr(v, "isoformat") else str(v)[:10]
+
+
+def fetch_params_history(conn, cur) -> dict:
+    """
+    spv_internal_params 全部记录（一条查询覆盖全部 SPV），按 effective_date 升序
+    返回: { spv_id 原值: [rec, ...] }；无 effective_date 列时各 SPV 的记录均视为自始生效
+    """
+    try:
+        cur.execute("SELECT * FROM spv_internal_params ORDER BY spv_id, effective_date NULLS FIRST")
+    except Exception:
+        conn.rollback()
+        cur.execute("SELECT * FROM spv_internal_params ORDER BY spv_id")
+    cols = [d[0].lower() for d in cur.description] if cur.description else []
+    out = {}
+    for row in cur.fetchall():
+        rec = dict(zip(cols, row))
+        key = rec.get("spv_id") or rec.get("id")
+        if key:
+            out.setdefault(str(key), []).append(rec)
+    for recs in out.values():
+        recs.sort(key=_eff_key)
+    return out
+
+
+def _load_params_history_and_configs():
+    """
+    全部 SPV 的 spv_internal_params 历史与 spv_config 配置：(history_by_spv, config_rows_by_spv)
+    全量刷新中复用阶段结果；否则一次连接内两条查询（另有一次表存在性检查）
+    """
+    from kn_data_utils import _current_refresh_run
+    run = _current_refresh_run()
+    if run is not None:
+        return run.get("spv_internal_params_history") or {}, run.get("spv_config_rows") or {}
+
+    from db_connect import get_connection
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT table_name FROM information_schema.tables
+            WHERE table_schema='public' AND table_name IN ('spv_internal_params', 'spv_config')
+        """)
+        tables = {r[0] for r in cur.fetchall()}
+        history = fetch_params_history(conn, cur) if "spv_internal_params" in tables else {}
+        configs = {}
+        if "spv_config" in tables:
+            cur.execute("SELECT DISTINCT ON (spv_id) * FROM spv_config ORDER BY spv_id")
+            configs = _rows_by_spv(cur)
+        return history, configs
+    finally:
+        try:
+            cur.close()
+        except Exception:
+            pass
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def _vintage_survival_value(row, contract_local: float, vtg30: float, term: float):
+    """
+    Vintage 口径折损后价值（本币）：合同剩余价值按各 cohort current_balance 占比分摊，
+    default_mob 为 MOB 1~max_mob 各 cohort dpd30_rate 的均值（无数据的 MOB 用 Vtg30），
+    max_mob = min(4, ceil(期限))；无 vintage_data 或 cohort 余额为 0 时返回 None
+    """
+    cohorts = [(int(v.get("mob") or 0), _f(v.get("current_balance")), _f(v.get("dpd30_rate")))
+               for v in (row.get("vintage_data") or [])]
+    total_bal = sum(b for _, b, _ in cohorts)
+    if total_bal <= 0:
+        return None
+    max_mob = min(4, max(1, math.ceil(term))) if term > 0 else 4
+    raw = {}
+    for mob, _, dpd30 in cohorts:
+        if 1 <= mob <= max_mob:
+            raw.setdefault(mob, []).append(dpd30)
+    default_by_mob = {m: sum(v) / len(v) for m, v in raw.items()}
+    term_months = math.ceil(term) if term > 0 else max_mob
+    value = 0.0
+    for mob, bal, _ in cohorts:
+        if bal <= 0:
+            continue
+        survival = 1.0
+        for i in range(min(max(0, term_months - mob), max_mob)):
+            survival *= 1 - default_by_mob.get(mob + i + 1, vtg30)
+        value += contract_local * bal / total_bal * survival
+    return value
+
+
+def compute_coverage_series(risk_data, params_history, spv_cfg=None, exchange_rate=1) -> dict:
+    """
+    单个 SPV 全部 stat_date 的覆盖倍数（不访问 DB）
+    risk_data: 日指标（本币，顺序不限）；params_history: 该 SPV 的 spv_internal_params 记录（effective_date 升序）
+    返回: { stat_date: [...], effective_date: [...], m0/abs/contract/vintage: [...],
+            liquidation, margin_call, baseline }，各列表与 stat_date 等长，按 stat_date 升序
+    """
+    spv_cfg = spv_cfg or {}
+    rate = exchange_rate or 1
+    if rate <= 0:
+        rate = 1
+    history = list(params_history or [])
+    eff_keys = [_eff_key(r) for r in history]
+    derived = [_coverage_params(r) + (_num(r, "product_term"),) for r in history]
+
+    rows = sorted((r for r in (risk_data or []) if r.get("stat_date")), key=lambda r: str(r["stat_date"]))
+    out = {"stat_date": [], "effective_date": []}
+    out.update({m: [] for m in COVERAGE_METHODS})
+    for row in rows:
+        stat_date = str(row["stat_date"])[:10]
+        out["stat_date"].append(stat_date)
+        idx = bisect_right(eff_keys, stat_date) - 1
+        if idx < 0:
+            out["effective_date"].append(None)
+            for m in COVERAGE_METHODS:
+                out[m].append(None)
+            continue
+        early_discount, vtg30, coop_principal, unallocated, product_term = derived[idx]
+        out["effective_date"].append(eff_keys[idx] or None)
+        loan_usd = coop_principal + unallocated
+        if loan_usd <= 0:
+            for m in COVERAGE_METHODS:
+                out[m].append(None)
+            continue
+
+        cb = _f(row.get("current_balance"))
+        m0_bal = _f(row.get("m0_balance")) or cb * _f(row.get("m0_ratio"))
+        cash = _f(row.get("cash"))
+        remaining_interest = _f(row.get("all_remaining_interest") or row.get("all_accrued_interest"))
+        m0_value = (m0_bal + _f(row.get("m0_accrued_interest")) * early_discount) * (1 - vtg30) + cash
+        abs_value = (cb + remaining_interest * early_discount) * (1 - vtg30) + cash
+        contract_local = cb + remaining_interest
+        vintage_value = _vintage_survival_value(row, contract_local, vtg30,
+                                                _f(row.get("avg_duration")) or product_term)
+
+        denom = rate * loan_usd
+        out["m0"].append(round(m0_value / denom, 4))
+        out["abs"].append(round(abs_value / denom, 4))
+        out["contract"].append(round(contract_local * (1 - vtg30) / denom, 4))
+        out["vintage"].append(round(vintage_value / denom, 4) if vintage_value is not None else None)
+
+    out["liquidation"] = spv_cfg.get("liquidation_line") or 1.02
+    out["margin_call"] = spv_cfg.get("margin_call_line") or 1.15
+    out["baseline"] = spv_cfg.get("baseline") or 1.43
+    return out
+
+
+def build_coverage_series_batch(risk_by_spv: dict, rates=None, spv_ids=None) -> dict:
+    """
+    多个 SPV 的覆盖倍数时间序列（参数历史与 spv_config 各一条查询，全量刷新中复用阶段结果）
+    risk_by_spv: { spv_id: risk_data }，rates: { spv_id: exchange_rate }
+    返回: { spv_id: series 或 None }；无 spv_internal_params 记录的 SPV 为 None，数据库不可用时返回 {}
+    """
+    rates = rates or {}
+    try:
+        history, config_rows = _load_params_history_and_configs()
+    except Exception:
+        return {}
+    producers = None  # spv_config 无该 SPV 时的回退配置，整批只加载一次
+    out = {}
+    for spv_id in (list(spv_ids) if spv_ids is not None else list(risk_by_spv)):
+        recs = history.get(str(spv_id))
+        risk_data = risk_by_spv.get(spv_id)
+        if not recs or not risk_data:
+            out[spv_id] = None
+            continue
+        rec = config_rows.get(str(spv_id))
+        if rec:
+            spv_cfg = _spv_cfg_from_rec(rec)
+        else:
+            if producers is None:
+                try:
+                    from spv_config import load_producers_from_spv_config
+                    producers = load_producers_from_spv_config()
+                except Exception:
+                    producers = {}
+            spv_cfg = _spv_cfg_from_producer(producers.get(spv_id, {}))
+        try:
+            out[spv_id] = compute_coverage_series(risk_data, recs, spv_cfg, rates.get(spv_id, 1))
+        except Exception:
+            out[spv_id] = None
+    return out
+
+
+def load_coverage_series(spv_id, risk_data, exchange_rate=1):
+    """单个 SPV 的覆盖倍数时间序列，无参数或数据库不可用时返回 None"""
+    return build_coverage_series_batch({spv_id: risk_data}, {spv_id: exchange_rate}).get(spv_id)
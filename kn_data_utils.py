@@ -9,8 +9,10 @@ from decimal import Decimal
 def get_cache_dir():
     """
     返回缓存根目录。Vercel/AWS Lambda 等 serverless 仅 /tmp 可写，使用 /tmp/rt_risk_cache；
-    本地使用 config/cache。
+    本地使用 config/cache。RT_RISK_CACHE_DIR 可覆盖（基准测试、压测用独立目录）。
     """
+    if os.getenv("RT_RISK_CACHE_DIR"):
+        return os.getenv("RT_RISK_CACHE_DIR")
     if os.getenv("VERCEL") or os.getenv("AWS_LAMBDA_FUNCTION_NAME") or os.getenv("LAMBDA_TASK_ROOT"):
         return os.path.join("/tmp", "rt_risk_cache")
     base = os.path.dirname(os.path.abspath(__file__))
@@ -54,6 +56,83 @@ def get_calc_table(year_or_dt, month=None):
     return f"calc_overdue_y{dt.year}m{dt.month:02d}"
 
 
+def _current_refresh_run():
+    """全量刷新中的共享中间结果（kn_refresh_dag），非刷新时为 None"""
+    try:
+        from kn_refresh_dag import current_run
+        return current_run()
+    except Exception:
+        return None
+
+
+def table_exists(cur, table_name: str) -> bool:
+    """
+    表是否存在（public schema）
+    全量刷新中复用 public_tables 阶段结果，不再逐表查询 information_schema
+    """
+    run = _current_refresh_run()
+    if run is not None:
+        try:
+            return table_name in run.get("public_tables")
+        except Exception:
+            pass
+    cur.execute(
+        "SELECT 1 FROM information_schema.tables WHERE table_schema='public' AND table_name = %s",
+        (table_name,)
+    )
+    return bool(cur.fetchone())
+
+
+def list_calc_tables(cur) -> list:
+    """存在的 calc_overdue 月分区表（升序）；全量刷新中复用 calc_tables 阶段结果"""
+    run = _current_refresh_run()
+    if run is not None:
+        try:
+            return list(run.get("calc_tables"))
+        except Exception:
+            pass
+    tables_to_check = [get_calc_table(y, m) for y in [2024, 2025, 2026, 2027] for m in range(1, 13)]
+    placeholders = ",".join(["%s"] * len(tables_to_check))
+    cur.execute(
+        f"SELECT table_name FROM information_schema.tables WHERE table_schema='public' AND table_name IN ({placeholders})",
+        tables_to_check
+    )
+    existing = {r[0] for r in cur.fetchall() if r and r[0]}
+    return [t for t in tables_to_check if t in existing]
+
+
+def get_spv_stat_dates(spv_id: str) -> list:
+    """该 SPV 在 calc_overdue 各分区中的全部 stat_date（升序，YYYY-MM-DD）；全量刷新中复用 spv_stat_dates 阶段"""
+    run = _current_refresh_run()
+    if run is not None:
+        return sorted(d for d, _ in run.get("spv_stat_dates", spv_id))
+    from db_connect import get_connection
+    conn = get_connection()
+    cur = conn.cursor()
+    dates = set()
+    try:
+        for tbl in list_calc_tables(cur):
+            try:
+                cur.execute(f"SELECT DISTINCT stat_date::date FROM {tbl} WHERE spv_id = %s", (spv_id,))
+                dates.update(str(r[0])[:10] for r in cur.fetchall() if r and r[0])
+            except Exception:
+                conn.rollback()
+    finally:
+        cur.close()
+        conn.close()
+    return sorted(dates)
+
+
+def month_end_dates(stat_dates) -> list:
+    """每月最大的 stat_date（升序）；最新月即最新数据日"""
+    by_month = {}
+    for d in stat_dates:
+        d = str(d)[:10]
+        if d > by_month.get(d[:7], ""):
+            by_month[d[:7]] = d
+    return [by_month[m] for m in sorted(by_month)]
+
+
 def get_latest_data_date():
     """
     从数据库 calc_overdue 表中获取最新的 stat_date（系统最新数据日）
@@ -64,6 +143,12 @@ def get_latest_data_date():
     global _refresh_latest_date
     if _refresh_latest_date is not None:
         return _refresh_latest_date
+    run = _current_refresh_run()
+    if run is not None:
+        try:
+            return run.get("latest_data_date")
+        except Exception:
+            pass
     try:
         from db_connect import get_connection
         conn = get_connection()
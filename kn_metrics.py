@@ -0,0 +1,178 @@
+"""
+请求级指标 - Flask 中间件 + Prometheus 文本格式导出（/api/metrics）
+- 每个路由（endpoint）的请求耗时直方图、响应大小直方图、按状态码计数
+- 每个请求的数据库时间与查询数（db_connect 查询观察者，按请求上下文归属；后台线程的查询不计入）：
+  默认关闭，设置 METRICS_DB_TIMING=1 时注册观察者（每条 SQL 多一次记录开销，不做调用方栈帧回溯）
+- 各缓存层命中/未命中：g（请求内）、memory（进程内）、file（本地文件 / Blob 的 /tmp 镜像）、blob（远程下载）
+- 指标保存在进程内存中，多实例 / serverless 下每个实例各自计数（以 rt_risk_process_start_time_seconds 区分重启）
+"""
+import os
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (1024, 10240, 102400, 512000, 1048576, 5242880, 20971520)
+_NO_ENDPOINT = "-"  # 请求上下文之外（后台刷新线程等）
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket_counts, sum, count]
+_buckets = {}  # name -> buckets
+_HELP = {
+    "rt_risk_http_requests_total": ("counter", "HTTP 请求数（按路由、方法、状态码）"),
+    "rt_risk_http_request_duration_seconds": ("histogram", "HTTP 请求耗时（秒）"),
+    "rt_risk_http_request_db_seconds": ("histogram", "单个请求内数据库查询总耗时（秒）"),
+    "rt_risk_http_request_db_queries_total": ("counter", "请求内执行的 SQL 条数"),
+    "rt_risk_http_requests_with_db_total": ("counter", "访问了数据库的请求数"),
+    "rt_risk_http_response_bytes": ("histogram", "响应体大小（字节）"),
+    "rt_risk_cache_lookups_total": ("counter", "缓存查找次数（按路由、缓存层、命中/未命中）"),
+    "rt_risk_process_start_time_seconds": ("gauge", "进程启动时间（Unix 秒）"),
+}
+_START_TIME = time.time()
+# 请求级数据库时间 / 查询数（需注册 db_connect 查询观察者）
+METRICS_DB_TIMING = (os.getenv("METRICS_DB_TIMING") or "").strip().lower() in ("1", "true", "yes")
+
+
+def _labels(**kw):
+    return tuple(sorted((k, str(v)) for k, v in kw.items()))
+
+
+def _inc(name, value=1, **labels):
+    key = (name, _labels(**labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def _observe(name, value, buckets, **labels):
+    key = (name, _labels(**labels))
+    with _lock:
+        _buckets.setdefault(name, buckets)
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = [[0] * len(buckets), 0.0, 0]
+        for i, b in enumerate(buckets):
+            if value <= b:
+                h[0][i] += 1
+        h[1] += value
+        h[2] += 1
+
+
+def _current_endpoint():
+    try:
+        from flask import has_request_context, request
+        if has_request_context():
+            return request.endpoint or "unmatched"
+    except Exception:
+        pass
+    return _NO_ENDPOINT
+
+
+def record_cache(layer: str, hit: bool):
+    """记录一次缓存查找：layer 为 g / memory / file / blob"""
+    try:
+        _inc("rt_risk_cache_lookups_total", layer=layer, result="hit" if hit else "miss",
+             endpoint=_current_endpoint())
+    except Exception:
+        pass
+
+
+def _on_query(rec):
+    """db_connect 查询观察者：累加到当前请求（g._rt_metrics），请求外的查询忽略"""
+    try:
+        from flask import g, has_request_context
+        if not has_request_context():
+            return
+        m = getattr(g, "_rt_metrics", None)
+        if m is not None:
+            m["db"] += rec["seconds"]
+            m["queries"] += 1
+    except Exception:
+        pass
+
+
+def _before_request():
+    from flask import g
+    g._rt_metrics = {"t0": time.perf_counter(), "db": 0.0, "queries": 0}
+
+
+def _after_request(response):
+    try:
+        from flask import g, request
+        m = getattr(g, "_rt_metrics", None)
+        endpoint = request.endpoint or "unmatched"
+        if m is None or endpoint == "static":
+            return response
+        elapsed = time.perf_counter() - m["t0"]
+        _inc("rt_risk_http_requests_total", endpoint=endpoint, method=request.method, status=response.status_code)
+        _observe("rt_risk_http_request_duration_seconds", elapsed, LATENCY_BUCKETS,
+                 endpoint=endpoint, method=request.method)
+        if METRICS_DB_TIMING:
+            _observe("rt_risk_http_request_db_seconds", m["db"], LATENCY_BUCKETS, endpoint=endpoint)
+        if m["queries"]:
+            _inc("rt_risk_http_request_db_queries_total", m["queries"], endpoint=endpoint)
+            _inc("rt_risk_http_requests_with_db_total", endpoint=endpoint)
+        # 流式响应（send_file 等）长度未知时不计大小
+        size = response.calculate_content_length() if not response.is_streamed else None
+        if size is not None:
+            _observe("rt_risk_http_response_bytes", size, BYTES_BUCKETS, endpoint=endpoint)
+    except Exception:
+        pass
+    return response
+
+
+def init_metrics(app):
+    """注册请求前后钩子；METRICS_DB_TIMING 开启时另注册数据库查询观察者"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    if METRICS_DB_TIMING:
+        from db_connect import add_query_observer
+        add_query_observer(_on_query)
+
+
+def _fmt_labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    esc = (lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+
+def _fmt_num(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def render_prometheus() -> str:
+    """导出全部指标（Prometheus text exposition format 0.0.4）"""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: (list(v[0]), v[1], v[2]) for k, v in _histograms.items()}
+        buckets = dict(_buckets)
+    by_name = {}
+    for (name, labels), v in counters.items():
+        by_name.setdefault(name, []).append((labels, v))
+    for (name, labels), v in histograms.items():
+        by_name.setdefault(name, []).append((labels, v))
+    by_name["rt_risk_process_start_time_seconds"] = [((), _START_TIME)]
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text = _HELP.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, v in sorted(by_name[name]):
+            if kind != "histogram":
+                lines.append(f"{name}{_fmt_labels(labels)} {_fmt_num(v)}")
+                continue
+            counts, total, count = v
+            for b, c in zip(buckets[name], counts):
+                lines.append(f"{name}_bucket{_fmt_labels(labels, ('le', _fmt_num(b)))} {c}")
+            lines.append(f"{name}_bucket{_fmt_labels(labels, ('le', '+Inf'))} {count}")
+            lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_num(total)}")
+            lines.append(f"{name}_count{_fmt_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def reset_metrics():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
@@ -0,0 +1,121 @@
+"""
+生产商列表摘要 - 刷新时由分片预计算，生产商管理页（partner_manage）直接渲染，无需排序、换算或访问 DB
+- partner：风控卡片（最新一日 KPI、格式化金额、状态样式、月放贷规模）
+- revenue：收益卡片（revenue_data 仅保留列表页用到的字段）
+- cashflow：现金流卡片（forecast 仅保留月份与预期回款，含合计）
+"""
+
+# 列表页 JS 使用的字段（templates/partner_list.html renderRevenue / renderCashflow）
+_REVENUE_KEYS = ("month", "outstanding_balance", "cumulative_disbursement", "net_revenue",
+                 "avg_yield_annualized", "collection_rate")
+_CASHFLOW_KEYS = ("month", "expected_inflow")
+
+_EMPTY_LATEST = {
+    "stat_date": "-",
+    "current_balance_fmt": "-",
+    "cum_disb_fmt": "-",
+    "current_balance_local": "-",
+    "current_balance_usd": "-",
+    "cum_disb_local": "-",
+    "cum_disb_usd": "-",
+    "m0_ratio_fmt": "-",
+    "m0_class": "",
+    "od1_fmt": "-",
+    "od1_class": "",
+    "active_borrowers": "-",
+}
+
+
+def fmt_usd(n):
+    if n >= 1e6:
+        return f"${n/1e6:.1f}M"
+    if n >= 1e3:
+        return f"${n/1e3:.0f}K"
+    return f"${n:,.0f}"
+
+
+def fmt_local(n):
+    """本币格式（无数额符号）"""
+    if n is None or (isinstance(n, float) and (n != n or n < 0)):
+        return "-"
+    try:
+        x = float(n)
+    except (TypeError, ValueError):
+        return "-"
+    if x >= 1e6:
+        return f"{x/1e6:.1f}M"
+    if x >= 1e3:
+        return f"{x/1e3:.0f}K"
+    return f"{x:,.0f}"
+
+
+def _latest_kpis(risk_data, rate: float) -> dict:
+    """risk_data 最新一日（stat_date 最大）的 KPI 与格式化值"""
+    if not risk_data:
+        return dict(_EMPTY_LATEST)
+    latest = max(risk_data, key=lambda r: r.get("stat_date", ""))
+    od1 = float(latest.get("overdue_1_plus_ratio", 0))
+    m0 = float(latest.get("m0_ratio", 0))
+    cb = float(latest.get("current_balance", 0))
+    cd = float(latest.get("cumulative_disbursement", 0))
+    usd_cb = cb / rate if rate else cb
+    usd_cd = cd / rate if rate else cd
+    return {
+        "stat_date": latest["stat_date"],
+        "current_balance_fmt": fmt_usd(usd_cb),
+        "cum_disb_fmt": fmt_usd(usd_cd),
+        "current_balance_local": fmt_local(cb),
+        "current_balance_usd": fmt_usd(usd_cb),
+        "cum_disb_local": fmt_local(cd),
+        "cum_disb_usd": fmt_usd(usd_cd),
+        "m0_ratio_fmt": f"{m0*100:.2f}%",
+        "m0_class": "good" if m0 >= 0.96 else "warn" if m0 >= 0.93 else "danger",
+        "od1_fmt": f"{od1*100:.2f}%",
+        "od1_class": "good" if od1 < 0.03 else "warn" if od1 < 0.05 else "danger",
+        "active_borrowers": f"{int(latest.get('active_borrowers', 0)):,}",
+    }
+
+
+def build_partner_summary(pc: dict, partner_id: str = None, rate: float = None, currency: str = None) -> dict:
+    """
+    由生产商分片（或同结构的 dict）构建列表页三张卡片
+    rate / currency：默认取 pc 中的汇率与币种（刷新时已应用 {SID}_EXCHANGE_RATE）
+    返回: { partner, revenue, cashflow, exchange_rate }
+    """
+    pid = partner_id or pc.get("id")
+    rate = float(rate if rate is not None else (pc.get("exchange_rate", 1) or 1))
+    local_currency = currency or pc.get("currency", "USD") or "USD"
+    base = {
+        "id": pid,
+        "name": pc.get("name", pid),
+        "country": pc.get("region", "-"),
+        "product_type": pc.get("product_type", "-"),
+    }
+
+    rev_data = pc.get("revenue_data") or []
+    # 月放贷规模：revenue_data 最新月 disbursement
+    monthly_vol = float(rev_data[-1].get("disbursement", 0) or 0) if rev_data else 0
+    usd_mv = monthly_vol / rate if rate else monthly_vol
+    partner = dict(base, **{
+        "status": pc.get("status", "active"),
+        "onboard_date": pc.get("onboard_date", "-"),
+        "latest": _latest_kpis(pc.get("risk_data") or [], rate),
+        "local_currency": local_currency,
+        "exchange_rate": rate,
+        "is_usd": local_currency == "USD",
+        "monthly_volume": monthly_vol,
+        "monthly_volume_local": fmt_local(monthly_vol) if monthly_vol else "-",
+        "monthly_volume_usd": fmt_usd(usd_mv) if monthly_vol else "-",
+        "monthly_volume_fmt": fmt_usd(usd_mv) if monthly_vol else "-",
+    })
+
+    cashflow_data = [{k: r.get(k) for k in _CASHFLOW_KEYS} for r in (pc.get("cashflow_data") or [])]
+    return {
+        "partner": partner,
+        "revenue": dict(base, revenue_data=[{k: r.get(k) for k in _REVENUE_KEYS} for r in rev_data],
+                        local_currency=local_currency, exchange_rate=rate),
+        "cashflow": dict(base, cashflow_data=cashflow_data,
+                         total_expected=sum(r.get("expected_inflow") or 0 for r in cashflow_data),
+                         local_currency=local_currency, exchange_rate=rate),
+        "exchange_rate": rate,
+    }
@@ -3,148 +3,328 @@
 - Admin 刷新全量数据，保存到跨实例文件系统（Vercel Blob / 本地文件），可被其他 login 共享，不删除
 - PM/Investor 仅读取，不修改
 - Vercel：需 Blob 实现跨实例共享；本地：文件即可
+- 过期（CACHE_STALE_SECONDS）板块照常返回，并由后台单次刷新（schedule_revalidate）
+- 存储结构：manifest（基础信息 + 投资组合统计）+ 每个生产商一个分片，页面按需加载单个分片
 """
 import json
 import os
 import threading
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Vercel/AWS Lambda 等 serverless 仅 /tmp 可写，部署环境 config/cache 在 .gitignore 中不存在
+# RT_RISK_CACHE_DIR 可覆盖（基准测试、压测使用独立目录，不影响 config/cache）
 _IS_SERVERLESS = bool(os.getenv("VERCEL") or os.getenv("AWS_LAMBDA_FUNCTION_NAME") or os.getenv("LAMBDA_TASK_ROOT"))
-_CACHE_BASE = os.path.join("/tmp", "rt_risk_cache") if _IS_SERVERLESS else os.path.join(BASE_DIR, "config", "cache")
+_CACHE_BASE = os.getenv("RT_RISK_CACHE_DIR") or (
+    os.path.join("/tmp", "rt_risk_cache") if _IS_SERVERLESS else os.path.join(BASE_DIR, "config", "cache"))
 CACHE_DIR = _CACHE_BASE
 DAILY_CACHE_DIR = os.path.join(CACHE_DIR, "daily")
-CACHE_FILE = os.path.join(CACHE_DIR, "producer_full_cache.json")
+CACHE_FILE = os.path.join(CACHE_DIR, "producer_full_cache.json")  # 旧版整包缓存，仅兼容读取
+MANIFEST_FILE = os.path.join(CACHE_DIR, "producer_cache_manifest.json")
+PARTNER_SUMMARY_FILE = os.path.join(CACHE_DIR, "partner_summary.json")  # 生产商管理页摘要索引
+ALERT_STATE_FILE = os.path.join(CACHE_DIR, "alert_state.json")  # 告警状态与历史（kn_alerts）
+SHARD_DIR = os.path.join(CACHE_DIR, "shards")
 CACHE_META_FILE = os.path.join(CACHE_DIR, "cache_meta.json")
 REFRESH_LOG_FILE = os.path.join(CACHE_DIR, "refresh_log.txt")
-CACHE_RETENTION_DAYS = 30
+MANIFEST_VERSION = 2
+# 超过该秒数的分片板块视为过期：照常返回，同时后台刷新（stale-while-revalidate）
+CACHE_STALE_SECONDS = int(os.getenv("CACHE_STALE_SECONDS", "86400") or 86400)
+# 其他实例已在刷新同一板块时，在该秒数内不重复触发
+REVALIDATE_LEASE_SECONDS = int(os.getenv("REVALIDATE_LEASE_SECONDS", "600") or 600)
+REVALIDATE_SECTIONS = ("risk", "revenue", "cashflow")
+# 同一 (生产商, 板块) 在本进程内两次过期检查的最小间隔（秒），间隔内直接返回，不读 manifest / cache_meta
+REVALIDATE_THROTTLE_SECONDS = int(os.getenv("REVALIDATE_THROTTLE_SECONDS", "300") or 300)
+# 全量刷新租约有效期（秒），持有期间自动续约；须长于单次调用时长（serverless maxDuration 300）
+REFRESH_LEASE_SECONDS = int(os.getenv("REFRESH_LEASE_SECONDS", "360") or 360)
+# 全量刷新时并发处理的生产商数；默认取连接池的一半（每个任务可能同时占用 2 个连接）
+REFRESH_WORKERS = int(os.getenv("REFRESH_WORKERS", "0") or 0) or max(1, int(os.getenv("DATABASE_POOL_SIZE", "5")) // 2)
+# 写入 manifest 的生产商基础信息，列表页/权限判断无需加载分片
+_PRODUCER_INFO_KEYS = ("id", "name", "region", "product_type", "status", "onboard_date", "contact",
+                       "exchange_rate", "currency")
 
 
 def _ensure_cache_dir():
     os.makedirs(CACHE_DIR, exist_ok=True)
     os.makedirs(DAILY_CACHE_DIR, exist_ok=True)
-
-
-def _purge_old_daily_cache():
-    """删除超过 30 天的每日归档文件（不影响主缓存 producer_full_cache.json）"""
-    if not os.path.isdir(DAILY_CACHE_DIR):
-        return
-    cutoff = datetime.now() - timedelta(days=CACHE_RETENTION_DAYS)
-    for f in os.listdir(DAILY_CACHE_DIR):
-        if not f.endswith(".json"):
-            continue
-        path = os.path.join(DAILY_CACHE_DIR, f)
-        try:
-            mtime = datetime.fromtimestamp(os.path.getmtime(path))
-            if mtime < cutoff:
-                os.remove(path)
-        except Exception:
-            pass
+    os.makedirs(SHARD_DIR, exist_ok=True)
 
 
 def get_risk_data_from_full_cache(spv_id: str):
     """
     从统一缓存获取单个生产商 risk_data，供其他模块调用（避免循环导入 app）
+    仅加载该生产商分片，不解析其他生产商数据
     返回: (risk_data, cache_exists)
     - cache_exists=True: 缓存文件存在，仅用此数据，不再访问单独缓存
     - cache_exists=False: 无统一缓存，可回退到 load_risk_cache
     """
-    data, _ = load_producer_full_cache()
-    if not data:
+    manifest = load_producer_manifest()
+    if not manifest or not manifest.get("producers"):
         return None, False
-    producers = data.get("producers", {}) if isinstance(data, dict) else data
-    if not producers:
-        return None, False
-    sid = str(spv_id or "").strip().lower()
-    pc = producers.get(spv_id) or producers.get(sid)
+    pc = load_producer_shard(spv_id)
     risk_data = (pc or {}).get("risk_data", []) if pc else []
     return risk_data, True
 
 
-# 进程级缓存：文件未变更时复用，避免重复解析大 JSON
-_producer_cache_memory = None
-_producer_cache_mtime = 0
-_cache_meta_memory = None
-_cache_meta_mtime = 0
+def _g_get(name):
+    """读取请求内缓存（Flask g），无请求上下文时返回 None"""
+    try:
+        from flask import g
+        return getattr(g, name, None)
+    except RuntimeError:
+        return None
+    except Exception:
+        return None
 
 
-def load_producer_full_cache():
-    """
-    从缓存加载（Blob 优先实现跨实例共享，否则文件）
-    1. 请求内复用（Flask g）
-    2. 进程内复用
-    返回: (data, last_updated) 或 (None, None)
-    """
-    global _producer_cache_memory, _producer_cache_mtime
+def _g_set(name, value):
+    """写入请求内缓存（Flask g），无请求上下文时忽略"""
     try:
         from flask import g
-        if hasattr(g, "_rt_producer_full_cache"):
-            return g._rt_producer_full_cache
-    except RuntimeError:
+        setattr(g, name, value)
+    except (RuntimeError, Exception):
         pass
+
+
+def _record_cache(layer: str, hit: bool):
+    """缓存命中统计（kn_metrics，/api/metrics）"""
+    try:
+        from kn_metrics import record_cache
+        record_cache(layer, hit)
     except Exception:
         pass
 
+
+def _invalidate_request_cache():
+    """保存后清除本请求内的缓存，避免同一请求内读到旧分片"""
+    for name in ("_rt_producer_full_cache", "_rt_producer_manifest", "_rt_producer_shards", "_rt_partner_summary",
+                 "_rt_alert_state"):
+        _g_set(name, None)
+
+
+def _shard_key(spv_id) -> str:
+    return str(spv_id or "").strip().lower()
+
+
+def _shard_file(spv_id) -> str:
+    return os.path.join(SHARD_DIR, f"producer_{_shard_key(spv_id)}.json")
+
+
+def _write_json_atomic(path: str, data, indent=None):
+    """先写临时文件再 rename，读取方不会读到半个文件"""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent)
+    os.replace(tmp, path)
+
+
+# 进程级缓存：文件未变更时复用，避免重复解析 JSON
+_legacy_cache_memory = None
+_legacy_cache_mtime = 0
+_manifest_memory = None
+_manifest_mtime = 0
+_shard_memory = {}  # sid -> (manifest 中的 updated_at, pc)
+_cache_meta_memory = None
+_cache_meta_mtime = 0
+_summary_memory = None
+_summary_mtime = 0
+_alert_memory = None
+_alert_mtime = 0
+
+
+def _load_legacy_full_cache():
+    """读取旧版整包缓存 producer_full_cache.json（升级前写入），无则返回 None"""
+    global _legacy_cache_memory, _legacy_cache_mtime
     try:
         from kn_cache_storage import _use_blob, cache_get_json, BLOB_PATH_CACHE
         if _use_blob():
             d = cache_get_json(BLOB_PATH_CACHE)
             if d:
-                producers = d.get("producers", {})
-                last_updated = d.get("last_updated")
-                result = (
-                    {
-                        "producers": producers,
-                        "portfolio_cumulative_stats": d.get("portfolio_cumulative_stats"),
-                        "allocation_by_platform": d.get("allocation_by_platform"),
-                        "system_cutover_date": d.get("system_cutover_date"),
-                    },
-                    last_updated,
-                )
-                try:
-                    from flask import g
-                    g._rt_producer_full_cache = result
-                except (RuntimeError, Exception):
-                    pass
-                return result
+                return d
     except Exception:
         pass
-
     if not os.path.isfile(CACHE_FILE):
-        return None, None
+        return None
     try:
         mtime = os.path.getmtime(CACHE_FILE)
-        if _producer_cache_memory is not None and mtime == _producer_cache_mtime:
-            result = _producer_cache_memory
-        else:
-            with open(CACHE_FILE, "r", encoding="utf-8") as f:
-                d = json.load(f)
-            producers = d.get("producers", {})
-            last_updated = d.get("last_updated")
-            result = (
-                {
-                    "producers": producers,
-                    "portfolio_cumulative_stats": d.get("portfolio_cumulative_stats"),
-                    "allocation_by_platform": d.get("allocation_by_platform"),
-                    "system_cutover_date": d.get("system_cutover_date"),
-                },
-                last_updated,
-            )
-            _producer_cache_memory = result
-            _producer_cache_mtime = mtime
+        if _legacy_cache_memory is not None and mtime == _legacy_cache_mtime:
+            return _legacy_cache_memory
+        with open(CACHE_FILE, "r", encoding="utf-8") as f:
+            d = json.load(f)
+        _legacy_cache_memory = d
+        _legacy_cache_mtime = mtime
+        return d
+    except Exception:
+        return None
+
+
+def _producer_manifest_entry(pc: dict, updated_at: str, sections: dict = None) -> dict:
+    """
+    manifest 中单个生产商条目：基础信息 + 分片版本，列表页无需加载分片
+    sections: 各板块（risk/revenue/cashflow）最近更新时间，供过期判断；默认均为 updated_at
+    """
+    entry = {k: pc.get(k) for k in _PRODUCER_INFO_KEYS if k in pc}
+    entry["updated_at"] = updated_at
+    entry["sections"] = dict(sections) if sections else {sec: updated_at for sec in REVALIDATE_SECTIONS}
+    entry["risk_rows"] = len(pc.get("risk_data") or [])
+    entry["revenue_rows"] = len(pc.get("revenue_data") or [])
+    entry["cashflow_rows"] = len(pc.get("cashflow_data") or [])
+    return entry
+
+
+def _manifest_from_legacy(d: dict) -> dict:
+    """从旧版整包缓存派生 manifest（legacy=True 时分片从整包读取）"""
+    last_updated = d.get("last_updated")
+    producers = {}
+    for spv_id, pc in (d.get("producers") or {}).items():
+        producers[_shard_key(spv_id)] = _producer_manifest_entry(pc or {}, last_updated)
+    return {
+        "version": MANIFEST_VERSION,
+        "legacy": True,
+        "last_updated": last_updated,
+        "system_cutover_date": d.get("system_cutover_date"),
+        "portfolio_cumulative_stats": d.get("portfolio_cumulative_stats"),
+        "allocation_by_platform": d.get("allocation_by_platform"),
+        "producers": producers,
+    }
+
+
+def load_producer_manifest():
+    """
+    加载缓存清单（小文件）：last_updated、投资组合统计、各生产商基础信息与分片版本
+    1. 请求内复用（Flask g）
+    2. Blob 优先（跨实例共享），否则文件（进程内按 mtime 复用）
+    3. 无 manifest 时从旧版整包缓存派生
+    返回: manifest dict 或 None
+    """
+    global _manifest_memory, _manifest_mtime
+    cached = _g_get("_rt_producer_manifest")
+    _record_cache("g", cached is not None)
+    if cached is not None:
+        return cached
+
+    manifest = None
+    try:
+        from kn_cache_storage import _use_blob, cache_get_json, BLOB_PATH_MANIFEST
+        if _use_blob():
+            manifest = cache_get_json(BLOB_PATH_MANIFEST)
+    except Exception:
+        pass
+    if manifest is None and os.path.isfile(MANIFEST_FILE):
         try:
-            from flask import g
-            g._rt_producer_full_cache = result
-        except (RuntimeError, Exception):
-            pass
-        return result
+            mtime = os.path.getmtime(MANIFEST_FILE)
+            if _manifest_memory is not None and mtime == _manifest_mtime:
+                _record_cache("memory", True)
+                manifest = _manifest_memory
+            else:
+                _record_cache("memory", False)
+                with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+                _record_cache("file", True)
+                _manifest_memory = manifest
+                _manifest_mtime = mtime
+        except Exception:
+            manifest = None
+    if manifest is None:
+        legacy = _load_legacy_full_cache()
+        if legacy:
+            manifest = _manifest_from_legacy(legacy)
+    if manifest is not None:
+        _g_set("_rt_producer_manifest", manifest)
+    return manifest
+
+
+def _read_shard(sid: str, version):
+    """读取单个分片（Blob 优先，否则文件），按 manifest 版本在进程内复用"""
+    mem = _shard_memory.get(sid)
+    if mem is not None and version and mem[0] == version:
+        _record_cache("memory", True)
+        return mem[1]
+    _record_cache("memory", False)
+    pc = None
+    try:
+        from kn_cache_storage import _use_blob, cache_get_json, blob_shard_path
+        if _use_blob():
+            pc = cache_get_json(blob_shard_path(sid))
     except Exception:
-        return None, None
+        pass
+    if pc is None:
+        path = _shard_file(sid)
+        if not os.path.isfile(path):
+            _record_cache("file", False)
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                pc = json.load(f)
+        except Exception:
+            return None
+        _record_cache("file", True)
+    _shard_memory[sid] = (version, pc)
+    return pc
 
 
-_cache_meta_memory = None
-_cache_meta_mtime = 0
+def load_producer_shard(spv_id: str):
+    """
+    按需加载单个生产商分片（risk_data / revenue_data / cashflow_data / priority_indicators）
+    单个页面请求的 I/O 与解析只与该生产商数据量相关，与生产商总数无关
+    返回: pc dict 或 None（manifest 中无该生产商）
+    """
+    sid = _shard_key(spv_id)
+    if not sid:
+        return None
+    shards = _g_get("_rt_producer_shards")
+    if shards is None:
+        shards = {}
+        _g_set("_rt_producer_shards", shards)
+    if sid in shards:
+        _record_cache("g", True)
+        return shards[sid]
+    _record_cache("g", False)
+
+    manifest = load_producer_manifest()
+    entry = ((manifest or {}).get("producers") or {}).get(sid)
+    if not entry:
+        return None
+    if manifest.get("legacy"):
+        legacy_producers = (_load_legacy_full_cache() or {}).get("producers") or {}
+        pc = legacy_producers.get(spv_id) or legacy_producers.get(sid)
+    else:
+        pc = _read_shard(sid, entry.get("updated_at"))
+    shards[sid] = pc
+    return pc
+
+
+def load_producer_full_cache():
+    """
+    加载全部生产商（manifest + 所有分片），仅供确需全量数据的页面使用；
+    单个生产商页面请用 load_producer_shard
+    1. 请求内复用（Flask g）
+    2. 分片按 manifest 版本进程内复用
+    返回: (data, last_updated) 或 (None, None)
+    """
+    cached = _g_get("_rt_producer_full_cache")
+    _record_cache("g", cached is not None)
+    if cached is not None:
+        return cached
+    manifest = load_producer_manifest()
+    if not manifest:
+        return None, None
+    producers = {}
+    for sid in (manifest.get("producers") or {}):
+        pc = load_producer_shard(sid)
+        if pc is not None:
+            producers[sid] = pc
+    result = (
+        {
+            "producers": producers,
+            "portfolio_cumulative_stats": manifest.get("portfolio_cumulative_stats"),
+            "allocation_by_platform": manifest.get("allocation_by_platform"),
+            "system_cutover_date": manifest.get("system_cutover_date"),
+        },
+        manifest.get("last_updated"),
+    )
+    _g_set("_rt_producer_full_cache", result)
+    return result
 
 
 def load_cache_meta():
@@ -165,9 +345,12 @@ def load_cache_meta():
     try:
         mtime = os.path.getmtime(CACHE_META_FILE)
         if _cache_meta_memory is not None and mtime == _cache_meta_mtime:
+            _record_cache("memory", True)
             return _cache_meta_memory
+        _record_cache("memory", False)
         with open(CACHE_META_FILE, "r", encoding="utf-8") as f:
             out = json.load(f)
+        _record_cache("file", True)
         _cache_meta_memory = out
         _cache_meta_mtime = mtime
         return out
@@ -175,64 +358,330 @@ def load_cache_meta():
         return None
 
 
-def save_producer_full_cache(payload: dict):
+def load_partner_summary():
     """
-    保存全量缓存（仅 admin/cron 调用）。写入 Blob（跨实例共享）+ 文件，不删除。
-    payload: { producers, portfolio_cumulative_stats?, allocation_by_platform?, system_cutover_date?, last_updated_by? }
+    加载生产商管理页摘要索引：{ sid: { updated_at, partner, revenue, cashflow, exchange_rate } }
+    条目的 updated_at 与 manifest 一致时才有效（由调用方校验），不一致或缺失时回退到分片
+    1. 请求内复用（Flask g）
+    2. Blob 优先，否则文件（进程内按 mtime 复用）
+    """
+    global _summary_memory, _summary_mtime
+    cached = _g_get("_rt_partner_summary")
+    _record_cache("g", cached is not None)
+    if cached is not None:
+        return cached
+    index = None
+    try:
+        from kn_cache_storage import _use_blob, cache_get_json, BLOB_PATH_PARTNER_SUMMARY
+        if _use_blob():
+            index = cache_get_json(BLOB_PATH_PARTNER_SUMMARY)
+    except Exception:
+        pass
+    if index is None and os.path.isfile(PARTNER_SUMMARY_FILE):
+        try:
+            mtime = os.path.getmtime(PARTNER_SUMMARY_FILE)
+            if _summary_memory is not None and mtime == _summary_mtime:
+                _record_cache("memory", True)
+                index = _summary_memory
+            else:
+                _record_cache("memory", False)
+                with open(PARTNER_SUMMARY_FILE, "r", encoding="utf-8") as f:
+                    index = json.load(f)
+                _record_cache("file", True)
+                _summary_memory = index
+                _summary_mtime = mtime
+        except Exception:
+            index = None
+    index = (index or {}).get("producers") or {}
+    _g_set("_rt_partner_summary", index)
+    return index
+
+
+def _partner_summary_entry(sid: str, pc: dict, updated_at: str) -> dict:
+    from kn_partner_summary import build_partner_summary
+    return dict(build_partner_summary(pc, sid), updated_at=updated_at)
+
+
+def _save_partner_summary(producers: dict):
+    """写入摘要索引（Blob + 文件）；失败不影响缓存发布，列表页会回退到分片"""
+    global _summary_memory, _summary_mtime
+    _summary_memory = None
+    _summary_mtime = 0
+    index = {"updated_at": datetime.now().isoformat(), "producers": producers}
+    try:
+        from kn_cache_storage import _use_blob, cache_set_json, BLOB_PATH_PARTNER_SUMMARY
+        if _use_blob():
+            cache_set_json(BLOB_PATH_PARTNER_SUMMARY, index)
+    except Exception:
+        pass
+    try:
+        _ensure_cache_dir()
+        _write_json_atomic(PARTNER_SUMMARY_FILE, index)
+    except Exception:
+        pass
+
+
+def load_alert_state():
+    """
+    加载告警状态：{ sid: { updated_at, alerts, history, coverage } }（板块刷新时由 kn_alerts 增量评估写入）
+    1. 请求内复用（Flask g）
+    2. Blob 优先，否则文件（进程内按 mtime 复用）
     """
-    global _producer_cache_memory, _producer_cache_mtime, _cache_meta_memory, _cache_meta_mtime
-    _producer_cache_memory = None
-    _producer_cache_mtime = 0
+    global _alert_memory, _alert_mtime
+    cached = _g_get("_rt_alert_state")
+    _record_cache("g", cached is not None)
+    if cached is not None:
+        return cached
+    state = None
+    try:
+        from kn_cache_storage import _use_blob, cache_get_json, BLOB_PATH_ALERT_STATE
+        if _use_blob():
+            state = cache_get_json(BLOB_PATH_ALERT_STATE)
+    except Exception:
+        pass
+    if state is None and os.path.isfile(ALERT_STATE_FILE):
+        try:
+            mtime = os.path.getmtime(ALERT_STATE_FILE)
+            if _alert_memory is not None and mtime == _alert_mtime:
+                _record_cache("memory", True)
+                state = _alert_memory
+            else:
+                _record_cache("memory", False)
+                with open(ALERT_STATE_FILE, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+                _record_cache("file", True)
+                _alert_memory = state
+                _alert_mtime = mtime
+        except Exception:
+            state = None
+    state = (state or {}).get("producers") or {}
+    _g_set("_rt_alert_state", state)
+    return state
+
+
+def load_alert_state_for(spv_id) -> dict:
+    """单个生产商的告警状态（按 spv_id 归一化取键，partner_id 需先经 partner → spv 映射），无则 {}"""
+    return load_alert_state().get(_shard_key(spv_id)) or {}
+
+
+def _save_alert_state(producers: dict):
+    """写入告警状态（Blob + 文件）；失败不影响缓存发布"""
+    global _alert_memory, _alert_mtime
+    _alert_memory = None
+    _alert_mtime = 0
+    state = {"updated_at": datetime.now().isoformat(), "producers": producers}
+    try:
+        from kn_cache_storage import _use_blob, cache_set_json, BLOB_PATH_ALERT_STATE
+        if _use_blob():
+            cache_set_json(BLOB_PATH_ALERT_STATE, state)
+    except Exception:
+        pass
+    try:
+        _ensure_cache_dir()
+        _write_json_atomic(ALERT_STATE_FILE, state)
+    except Exception:
+        pass
+
+
+def _update_alert_state(updates: dict, keep=None):
+    """
+    合并生产商告警状态并写入；updates: { sid: 新状态 }，keep: 保留的生产商（默认全部）
+    告警评估失败时不写入，面板继续显示上一版状态
+    """
+    try:
+        state = dict(load_alert_state())
+        state.update({_shard_key(k): v for k, v in updates.items()})
+        if keep is not None:
+            keep = {_shard_key(k) for k in keep}
+            state = {k: v for k, v in state.items() if k in keep}
+        _save_alert_state(state)
+    except Exception:
+        pass
+
+
+def _save_shard(sid: str, pc: dict):
+    """写入单个分片（Blob + 文件）"""
+    try:
+        from kn_cache_storage import _use_blob, cache_set_json, blob_shard_path
+        if _use_blob():
+            cache_set_json(blob_shard_path(sid), pc)
+    except Exception as e:
+        import logging
+        logging.getLogger("kn_producer_cache").error("[save_shard] Blob 写入异常 sid=%s: %s", sid, e)
+        raise
+    _ensure_cache_dir()
+    _write_json_atomic(_shard_file(sid), pc)
+
+
+def _write_cache_meta(meta: dict):
+    """写入 cache_meta（Blob + 文件）"""
+    global _cache_meta_memory, _cache_meta_mtime
     _cache_meta_memory = None
     _cache_meta_mtime = 0
+    try:
+        from kn_cache_storage import _use_blob, cache_set_json, BLOB_PATH_META
+        if _use_blob():
+            cache_set_json(BLOB_PATH_META, meta)
+    except Exception:
+        pass
+    try:
+        _ensure_cache_dir()
+        _write_json_atomic(CACHE_META_FILE, meta)
+    except Exception:
+        pass
+
+
+def _save_manifest(manifest: dict, last_updated_by: str, keep_revalidating: bool = True):
+    """
+    写入 manifest 与 cache_meta（分片写完后再写，manifest 是提交点）
+    keep_revalidating: 保留 meta 中的后台刷新记录（单个板块更新时）；全量刷新后清空
+    """
+    global _manifest_memory, _manifest_mtime
+    _manifest_memory = None
+    _manifest_mtime = 0
+    meta = {
+        "last_updated": manifest.get("last_updated"),
+        "system_cutover_date": manifest.get("system_cutover_date") or "",
+        "last_updated_by": last_updated_by,
+    }
+    if keep_revalidating:
+        revalidating = (load_cache_meta() or {}).get("revalidating")
+        if revalidating:
+            meta["revalidating"] = revalidating
+    try:
+        from kn_cache_storage import _use_blob, cache_set_json, BLOB_PATH_MANIFEST
+        if _use_blob():
+            cache_set_json(BLOB_PATH_MANIFEST, manifest)
+    except Exception as e:
+        import logging
+        logging.getLogger("kn_producer_cache").error("[save_manifest] Blob 写入异常: %s", e)
+        raise
+    _ensure_cache_dir()
+    _write_json_atomic(MANIFEST_FILE, manifest, indent=2)
+    _write_cache_meta(meta)
+    _invalidate_request_cache()
+
+
+def save_producer_full_cache(payload: dict):
+    """
+    保存全量缓存（仅 admin/cron 调用）。写入 Blob（跨实例共享）+ 文件，不删除。
+    拆分为 manifest + 每个生产商一个分片，页面按需加载单个分片
+    payload: { producers, portfolio_cumulative_stats?, allocation_by_platform?, system_cutover_date?, last_updated_by?, watermarks? }
+    """
     now = datetime.now()
     last_updated = now.isoformat()
     system_cutover_date = payload.get("system_cutover_date")
     last_updated_by = payload.get("last_updated_by", "admin")  # "cron" | "admin"
-    data = {
+    producers = payload.get("producers", {})
+
+    manifest_producers = {}
+    summaries = {}
+    for spv_id, pc in producers.items():
+        sid = _shard_key(spv_id)
+        _save_shard(sid, pc)
+        manifest_producers[sid] = _producer_manifest_entry(pc, last_updated)
+        try:
+            summaries[sid] = _partner_summary_entry(sid, pc, last_updated)
+        except Exception:
+            pass
+    _save_partner_summary(summaries)
+    try:
+        from kn_alerts import evaluate_all
+        _update_alert_state(evaluate_all({_shard_key(k): v for k, v in producers.items()}, load_alert_state()),
+                            keep=set(manifest_producers))
+    except Exception:
+        pass
+    manifest = {
+        "version": MANIFEST_VERSION,
         "last_updated": last_updated,
         "system_cutover_date": system_cutover_date,
-        "producers": payload.get("producers", {}),
         "portfolio_cumulative_stats": payload.get("portfolio_cumulative_stats"),
         "allocation_by_platform": payload.get("allocation_by_platform"),
+        "producers": manifest_producers,
+        # 各 SPV 输入数据水位（见 kn_refresh_dag.spv_watermarks），下次全量刷新据此跳过未变化的生产商
+        "watermarks": payload.get("watermarks") or {},
     }
-    meta = {
-        "last_updated": last_updated,
-        "system_cutover_date": system_cutover_date or "",
-        "last_updated_by": last_updated_by,
-    }
+    _save_manifest(manifest, last_updated_by, keep_revalidating=False)
+
+    # 清理已下线生产商的本地分片
     try:
-        from kn_cache_storage import _use_blob, cache_set_json, BLOB_PATH_CACHE, BLOB_PATH_META
-        if _use_blob():
-            cache_set_json(BLOB_PATH_CACHE, data)
-            cache_set_json(BLOB_PATH_META, meta)
-    except Exception as e:
-        import logging
-        logging.getLogger("kn_producer_cache").error("[save_producer_full_cache] Blob 写入异常: %s", e)
-        raise
-    _ensure_cache_dir()
-    with open(CACHE_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+        keep = {os.path.basename(_shard_file(sid)) for sid in manifest_producers}
+        for f in os.listdir(SHARD_DIR):
+            if f.endswith(".json") and f not in keep:
+                os.remove(os.path.join(SHARD_DIR, f))
+    except Exception:
+        pass
+
+    # 每日归档：内容寻址 + 压缩，未变化的板块不重复存储（见 kn_cache_archive）
     try:
-        with open(CACHE_META_FILE, "w", encoding="utf-8") as f:
-            json.dump(meta, f, ensure_ascii=False)
+        from kn_cache_archive import archive_daily_snapshot, purge_daily_archive
+        archive_daily_snapshot({
+            "last_updated": last_updated,
+            "system_cutover_date": system_cutover_date,
+            "producers": producers,
+            "portfolio_cumulative_stats": payload.get("portfolio_cumulative_stats"),
+            "allocation_by_platform": payload.get("allocation_by_platform"),
+        }, now.strftime("%Y-%m-%d"))
+        purge_daily_archive()
     except Exception:
         pass
-    daily_path = os.path.join(DAILY_CACHE_DIR, f"producer_full_cache_{now.strftime('%Y-%m-%d')}.json")
+
+
+def save_producer_shard(spv_id: str, pc: dict, section: str = None, updated_by: str = "admin"):
+    """
+    仅更新单个生产商分片及 manifest 中对应条目（单个生产商刷新后调用），不重写其他分片
+    section: 本次更新的板块（risk/revenue/cashflow），仅刷新该板块的更新时间；None 表示全部
+    """
+    manifest = load_producer_manifest()
+    if not manifest:
+        return
+    if manifest.get("legacy"):
+        # 旧版整包缓存：整体迁移为分片格式
+        data, _ = load_producer_full_cache()
+        producers = dict((data or {}).get("producers") or {})
+        producers[_shard_key(spv_id)] = pc
+        save_producer_full_cache({
+            "producers": producers,
+            "portfolio_cumulative_stats": manifest.get("portfolio_cumulative_stats"),
+            "allocation_by_platform": manifest.get("allocation_by_platform"),
+            "system_cutover_date": manifest.get("system_cutover_date"),
+        })
+        return
+    sid = _shard_key(spv_id)
+    last_updated = datetime.now().isoformat()
+    _save_shard(sid, pc)
+    manifest = dict(manifest)
+    manifest["producers"] = dict(manifest.get("producers") or {})
+    old = manifest["producers"].get(sid) or {}
+    sections = None
+    if section and old:
+        sections = dict(old.get("sections") or {sec: old.get("updated_at") for sec in REVALIDATE_SECTIONS})
+        sections[section] = last_updated
+    manifest["producers"][sid] = _producer_manifest_entry(pc, last_updated, sections)
+    manifest["last_updated"] = last_updated
+    summaries = dict(load_partner_summary())
     try:
-        with open(daily_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        _purge_old_daily_cache()
+        summaries[sid] = _partner_summary_entry(sid, pc, last_updated)
+    except Exception:
+        summaries.pop(sid, None)
+    _save_partner_summary({k: v for k, v in summaries.items() if k in manifest["producers"]})
+    try:
+        from kn_alerts import evaluate_producer, rule_scopes_for_section
+        scopes = rule_scopes_for_section(section)
+        if scopes is None or scopes:
+            prev = load_alert_state().get(sid)
+            _update_alert_state({sid: evaluate_producer(pc, prev, scopes)}, keep=set(manifest["producers"]))
     except Exception:
         pass
+    _save_manifest(manifest, updated_by)
 
 
 def clear_refresh_log():
-    """清空刷新日志（Blob + 本地文件），每次刷新开始时调用"""
+    """清空刷新日志（Blob 开始新的分段 run + 本地文件），每次刷新开始时调用"""
     try:
-        from kn_cache_storage import _use_blob, cache_set, BLOB_PATH_LOG
+        from kn_cache_storage import _use_blob, refresh_log_writer
         if _use_blob():
-            cache_set(BLOB_PATH_LOG, "")
+            refresh_log_writer.start()
     except Exception:
         pass
     try:
@@ -243,29 +692,52 @@ def clear_refresh_log():
         pass
 
 
-def _append_log(logs: list, msg: str, truncate_first: bool = False):
-    """追加日志到 Blob（共享）+ 文件。truncate_first=True 时先清空再写入（每次刷新开始）"""
-    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+def resume_refresh_log():
+    """续写当前刷新日志（可续跑刷新的后续调用，不清空）"""
+    try:
+        from kn_cache_storage import _use_blob, refresh_log_writer
+        if _use_blob():
+            refresh_log_writer.resume()
+    except Exception:
+        pass
+
+
+def flush_refresh_log():
+    """把缓冲中的日志写入 Blob 段（刷新结束/异常时调用）"""
+    try:
+        from kn_cache_storage import _use_blob, refresh_log_writer
+        if _use_blob():
+            refresh_log_writer.flush()
+    except Exception:
+        pass
+
+
+def _append_log(logs: list, msg: str, truncate_first: bool = False, ts: str = None):
+    """
+    追加日志到 Blob（共享）+ 文件。truncate_first=True 时先清空再写入（每次刷新开始）
+    Blob 侧只写内存缓冲，按批写段对象；本地文件逐行追加
+    ts: 消息产生时间（并发刷新时缓冲后输出，保留原时间），默认当前时间
+    """
+    ts = ts or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     line = f"[{ts}] {msg}\n"
     logs.append(line.rstrip())
     try:
         _refresh_status["logs"] = list(logs)  # 供轮询实时获取
     except Exception:
         pass
+    sep = f"{'='*60}\n[{ts}] ===== 新刷新开始 =====\n"
     try:
-        from kn_cache_storage import _use_blob, cache_append, cache_set, BLOB_PATH_LOG
+        from kn_cache_storage import _use_blob, refresh_log_writer
         if _use_blob():
             if truncate_first:
-                sep = f"{'='*60}\n[{ts}] ===== 新刷新开始 =====\n"
-                cache_set(BLOB_PATH_LOG, sep + line)
+                refresh_log_writer.start(sep + line)
             else:
-                cache_append(BLOB_PATH_LOG, line, truncate_first=False)
+                refresh_log_writer.append(line)
     except Exception:
         pass
     try:
         _ensure_cache_dir()
         if truncate_first:
-            sep = f"{'='*60}\n[{ts}] ===== 新刷新开始 =====\n"
             with open(REFRESH_LOG_FILE, "w", encoding="utf-8") as f:
                 f.write(sep + line)
         else:
@@ -275,254 +747,214 @@ def _append_log(logs: list, msg: str, truncate_first: bool = False):
         pass
 
 
-def refresh_producer_full_cache(triggered_by: str = "admin"):
-    """
-    从数据库重新加载所有生产商的风控、收益、现金流数据并写入缓存
-    triggered_by: "admin" 手动刷新 | "cron" 定时刷新，日志中会标明来源
+# 全量刷新中每个生产商的板块任务，按序执行（现金流用收益的回款率，优先级用风控数据）
+PRODUCER_SECTIONS = ("risk", "revenue", "cashflow", "priority")
+_SECTION_KEYS = {"risk": "risk_data", "revenue": "revenue_data", "cashflow": "cashflow_data",
+                 "priority": "priority_indicators"}
+
+
+def _producer_rate(sid: str, prod: dict):
+    """生产商汇率与币种（环境变量 {SID}_EXCHANGE_RATE 优先），返回 (rate, currency)"""
+    rate = float(prod.get("exchange_rate", 1) or 1)
+    currency = (prod.get("currency") or "USD") or "USD"
+    env_key = f"{sid.upper()}_EXCHANGE_RATE"
+    if os.environ.get(env_key):
+        try:
+            rate = float(os.environ.get(env_key))
+        except (ValueError, TypeError):
+            pass
+    return rate, currency
 
-    刷新流程：
-    1. 缓存 get_latest_data_date，供 kn_revenue/kn_cashflow 复用
-    2. 加载生产商列表：load_producers_from_spv_config(skip_revenue_compute=True)，避免重复计算收益
-    3. 按生产商逐个：
-       - 风控：refresh_risk_cache -> load_risk_cache
-       - 收益：refresh_revenue_cache；若为空则回退 load_revenue_cache 或 prod.revenue_data（producers.json）
-       - 现金流：refresh_cashflow_cache；若为空则回退 load_cashflow_cache
-       - 优先级：load_priority_indicators_for_spv，无则 compute_priority_from_risk_data
-    4. 投资组合统计：load_invested_spv_ids、query_portfolio_cumulative_stats、load_all_spv_internal_params
-    5. 写入 producer_full_cache.json 及 cache_meta.json
 
-    返回: { "ok": True, "last_updated": "...", "system_cutover_date": "...", "producer_count": N, "logs": [...] } 或 { "error": "..." }
+def _producer_base(spv_id, prod: dict, plog) -> dict:
+    """
+    生产商分片的基础信息（汇率、币种、名称等），各板块为空，由 _refresh_producer_section 逐个填充
+    plog: 日志函数，由调用方缓冲后按生产商顺序输出
     """
-    logs = []
+    sid = str(spv_id).strip().lower()
+    rate, currency = _producer_rate(sid, prod)
+    plog(f"  {sid}: 汇率={rate}, 币种={currency}")
+    return {
+        "risk_data": [],
+        "revenue_data": [],
+        "cashflow_data": [],
+        "exchange_rate": rate,
+        "currency": currency,
+        "priority_indicators": None,
+        "id": sid,
+        "name": prod.get("name", sid),
+        "region": prod.get("region", prod.get("country", "-")),
+        "product_type": prod.get("product_type", "-"),
+        "status": prod.get("status", "active"),
+        "onboard_date": prod.get("onboard_date", "-"),
+        "contact": prod.get("contact", "-"),
+    }
+
+
+def _attach_coverage_series(priority_indicators, sid: str, risk_data, rate):
+    """覆盖倍数时间序列（kn_coverage）写入 priority_indicators.coverage_series，风控页直接绘图；失败时不写入"""
+    if not priority_indicators or not risk_data:
+        return
     try:
-        clear_refresh_log()
-        src_label = "Cron 定时触发" if triggered_by == "cron" else "Admin 手动触发"
-        _append_log(logs, f"{src_label} - 开始刷新全量缓存...", truncate_first=True)
-        try:
-            from kn_cache_storage import _use_blob
-            _append_log(logs, f"缓存后端: {'Blob（跨实例共享）' if _use_blob() else '文件'}")
-        except Exception:
-            _append_log(logs, "缓存后端: 文件")
+        from kn_coverage import load_coverage_series
+        series = load_coverage_series(sid, risk_data, rate)
+        if series:
+            priority_indicators["coverage_series"] = series
+    except Exception:
+        pass
 
-        # 0) 缓存最新数据日，供 kn_revenue/kn_cashflow 等复用，避免重复查询
-        from kn_data_utils import get_latest_data_date, set_refresh_latest_date, clear_refresh_latest_date
-        try:
-            _latest_dt = get_latest_data_date()
-            set_refresh_latest_date(_latest_dt)
-        except Exception:
-            pass
 
-        # 1) 测试数据库连接
-        _append_log(logs, "正在连接数据库...")
-        try:
-            from db_connect import get_connection
-            conn = get_connection()
-            cur = conn.cursor()
-            cur.execute("SELECT 1")
-            cur.fetchone()
-            cur.close()
-            conn.close()
-            _append_log(logs, "数据库连接成功")
-        except Exception as e:
-            _append_log(logs, f"数据库连接失败: {e}（将尝试从配置文件加载生产商）")
-
-        # 2) 加载生产商列表（skip_revenue_compute=True：后续会逐个 refresh_revenue_cache，避免重复计算）
-        _append_log(logs, "正在加载生产商配置...")
-        from spv_config import load_spv_config, load_producers_from_spv_config
-        db_producers = load_spv_config()
-        if db_producers:
-            _append_log(logs, f"从数据库 spv_config 表加载到 {len(db_producers)} 个生产商")
-        producers_raw = load_producers_from_spv_config(skip_revenue_compute=True)
-        if not producers_raw:
-            from app import load_producers
-            producers_raw = load_producers()
-            if producers_raw:
-                _append_log(logs, f"从配置文件 producers.json 加载到 {len(producers_raw)} 个生产商")
-        elif not db_producers:
-            _append_log(logs, f"从配置文件 producers.json 加载到 {len(producers_raw)} 个生产商")
-        if not producers_raw:
-            _append_log(logs, "错误: 无生产商数据")
-            return {"error": "无生产商数据", "logs": logs}
-
-        _append_log(logs, f"共 {len(producers_raw)} 个生产商，开始逐个加载风控/收益/现金流数据...")
-        producers_cache = {}
-        all_stat_dates = []
-        for spv_id, prod in producers_raw.items():
-            sid = str(spv_id).strip().lower()
-            rate = float(prod.get("exchange_rate", 1) or 1)
-            currency = (prod.get("currency") or "USD") or "USD"
-            env_key = f"{sid.upper()}_EXCHANGE_RATE"
-            if os.environ.get(env_key):
-                try:
-                    rate = float(os.environ.get(env_key))
-                except (ValueError, TypeError):
-                    pass
-            _append_log(logs, f"  {sid}: 汇率={rate}, 币种={currency}")
-
-            risk_data = []
-            try:
-                from kn_risk_cache import refresh_risk_cache, load_risk_cache
-                _append_log(logs, f"  {sid}: 风控数据查询中（连接数据库）...")
-                refresh_risk_cache(sid, rate, currency, log_fn=lambda m: _append_log(logs, f"    [风控] {m}"))
-                merged, _ = load_risk_cache(sid)
-                if merged:
-                    risk_data = merged
-                    for r in merged:
-                        sd = r.get("stat_date")
-                        if sd:
-                            all_stat_dates.append(sd)
-                _append_log(logs, f"  {sid}: 风控 {len(risk_data)} 条")
-            except Exception as e:
-                _append_log(logs, f"  {sid}: 风控失败 - {e}")
-
-            revenue_data = []
-            try:
-                from kn_revenue_cache import refresh_revenue_cache, load_revenue_cache
-                _append_log(logs, f"  {sid}: 收益数据查询中（连接数据库）...")
-                r = refresh_revenue_cache(sid, rate, currency, log_fn=lambda m: _append_log(logs, f"    [收益] {m}"))
-                if "revenue_data" in r and r["revenue_data"]:
-                    revenue_data = r["revenue_data"]
-                if not revenue_data:
-                    cached_rev, _ = load_revenue_cache(sid)
-                    if cached_rev:
-                        revenue_data = cached_rev
-                        _append_log(logs, f"  {sid}: 收益使用单独缓存 {len(revenue_data)} 条")
-                if not revenue_data and prod.get("revenue_data"):
-                    revenue_data = prod.get("revenue_data", [])
-                    _append_log(logs, f"  {sid}: 收益使用 producers 配置 {len(revenue_data)} 条")
-                _append_log(logs, f"  {sid}: 收益 {len(revenue_data)} 条")
-            except Exception as e:
-                _append_log(logs, f"  {sid}: 收益失败 - {e}")
-                try:
-                    from kn_revenue_cache import load_revenue_cache
-                    cached_rev, _ = load_revenue_cache(sid)
-                    if cached_rev:
-                        revenue_data = cached_rev
-                        _append_log(logs, f"  {sid}: 收益回退到单独缓存 {len(revenue_data)} 条")
-                except Exception:
-                    pass
-
-            coll_rate = 0.98
-            if revenue_data:
-                cr = revenue_data[-1].get("collection_rate", 0.98) or 0.98
-                coll_rate = cr if cr >= 0.5 else (revenue_data[-2].get("collection_rate", 0.98) or 0.98 if len(revenue_data) >= 2 else 0.98)
-            cashflow_data = []
-            try:
-                from kn_cashflow_cache import refresh_cashflow_cache, load_cashflow_cache
-                _append_log(logs, f"  {sid}: 现金流数据查询中（连接数据库）...")
-                r = refresh_cashflow_cache(sid, rate, currency, coll_rate, log_fn=lambda m: _append_log(logs, f"    [现金流] {m}"))
-                if "forecast" in r and r["forecast"]:
-                    cashflow_data = r["forecast"]
-                if not cashflow_data:
-                    cached_cf, _, _ = load_cashflow_cache(sid)
-                    if cached_cf:
-                        cashflow_data = cached_cf
-                        _append_log(logs, f"  {sid}: 现金流使用单独缓存 {len(cashflow_data)} 条")
-                _append_log(logs, f"  {sid}: 现金流 {len(cashflow_data)} 条")
-            except Exception as e:
-                _append_log(logs, f"  {sid}: 现金流失败 - {e}")
-                try:
-                    from kn_cashflow_cache import load_cashflow_cache
-                    cached_cf, _, _ = load_cashflow_cache(sid)
-                    if cached_cf:
-                        cashflow_data = cached_cf
-                        _append_log(logs, f"  {sid}: 现金流回退到单独缓存 {len(cashflow_data)} 条")
-                except Exception:
-                    pass
-
-            priority_indicators = None
-            try:
-                from spv_internal_params import load_priority_indicators_for_spv, compute_priority_from_risk_data
-                pi = load_priority_indicators_for_spv(sid, risk_data=risk_data, exchange_rate=rate)
-                if pi:
-                    priority_indicators = pi
-                elif risk_data:
-                    pi = compute_priority_from_risk_data(sid, risk_data, rate)
-                    if pi:
-                        priority_indicators = pi
-                if not priority_indicators:
-                    _append_log(logs, f"  {sid}: 优先级指标缺失（spv_internal_params 无数据且 risk_data 不足）")
-            except Exception as e:
-                _append_log(logs, f"  {sid}: 优先级指标加载失败 - {e}")
-
-            producers_cache[sid] = {
-                "risk_data": risk_data,
-                "revenue_data": revenue_data,
-                "cashflow_data": cashflow_data,
-                "exchange_rate": rate,
-                "currency": currency,
-                "priority_indicators": priority_indicators,
-                "id": sid,
-                "name": prod.get("name", sid),
-                "region": prod.get("region", prod.get("country", "-")),
-                "product_type": prod.get("product_type", "-"),
-                "status": prod.get("status", "active"),
-                "onboard_date": prod.get("onboard_date", "-"),
-                "contact": prod.get("contact", "-"),
-            }
-
-        # 投资组合累计统计与平台持仓
-        portfolio_cumulative_stats = None
-        allocation_by_platform = None
-        _append_log(logs, "正在从数据库加载投资组合统计与平台持仓...")
-        try:
-            from spv_internal_params import load_invested_spv_ids_for_portfolio, load_all_spv_internal_params_for_portfolio
-            from kn_risk_query import query_portfolio_cumulative_stats
-            spv_ids = load_invested_spv_ids_for_portfolio()
-            _append_log(logs, f"投资组合包含 {len(spv_ids)} 个生产商，查询累计统计中...")
-            portfolio_cumulative_stats = query_portfolio_cumulative_stats(spv_ids)
-            trades = load_all_spv_internal_params_for_portfolio()
-            _append_log(logs, f"投资组合统计加载完成，平台持仓 {len(trades) if trades else 0} 条")
-            if trades:
-                total_principal = sum(t.get("principal_amount") or 0 for t in trades)
-                allocation_by_platform = []
-                for t in trades:
-                    pct = (t.get("principal_amount") or 0) / total_principal if total_principal > 0 else 0
-                    agreed = t.get("agreed_rate") or 0
-                    agreed_pct = agreed * 100 if agreed <= 1 else agreed
-                    allocation_by_platform.append({
-                        "name": t.get("name") or t.get("spv_id") or "-",
-                        "value": t.get("principal_amount") or 0,
-                        "pct": pct,
-                        "type": t.get("product_type") or "-",
-                        "region": t.get("region") or "-",
-                        "principal_amount": t.get("principal_amount"),
-                        "agreed_rate": agreed_pct,
-                        "effective_date": t.get("effective_date") or "-",
-                    })
-        except Exception as e:
-            _append_log(logs, f"投资组合统计加载失败: {e}")
+def _refresh_producer_section(pc: dict, prod: dict, section: str, plog):
+    """
+    刷新单个生产商的一个板块（全量刷新的一个任务），结果写回 pc
+    section: risk | revenue | cashflow | priority
+    查询异常或 refresh_*_cache 返回 error 时抛出异常，不写回 pc：由任务队列（kn_refresh_job）重试，
+    仍失败则沿用上一版分片中的该板块，且该生产商不记录新水位
+    """
+    sid = pc["id"]
+    rate = pc.get("exchange_rate") or 1
+    currency = pc.get("currency") or "USD"
 
-        system_cutover_date = max(all_stat_dates) if all_stat_dates else ""
-        _append_log(logs, f"系统切日: {system_cutover_date or '(无)'}")
+    if section == "risk":
+        from kn_risk_cache import refresh_risk_cache, load_risk_cache
+        plog(f"  {sid}: 风控数据查询中（连接数据库）...")
+        r = refresh_risk_cache(sid, rate, currency, log_fn=lambda m: plog(f"    [风控] {m}"))
+        if r.get("error"):
+            raise RuntimeError(f"风控刷新失败: {r['error']}")
+        merged, _ = load_risk_cache(sid)
+        risk_data = merged or r.get("risk_data") or []
+        plog(f"  {sid}: 风控 {len(risk_data)} 条")
+        pc["risk_data"] = risk_data
 
-        _append_log(logs, "正在写入缓存文件...")
-        save_producer_full_cache({
-            "producers": producers_cache,
-            "portfolio_cumulative_stats": portfolio_cumulative_stats,
-            "allocation_by_platform": allocation_by_platform,
-            "system_cutover_date": system_cutover_date,
-            "last_updated_by": triggered_by,
-        })
-        last_updated = datetime.now().isoformat()
-        _append_log(logs, f"刷新完成，共 {len(producers_cache)} 个生产商")
-        return {
-            "ok": True,
-            "last_updated": last_updated,
-            "system_cutover_date": system_cutover_date,
-            "last_updated_by": triggered_by,
-            "producer_count": len(producers_cache),
-            "logs": logs,
-        }
+    elif section == "revenue":
+        from kn_revenue_cache import refresh_revenue_cache
+        plog(f"  {sid}: 收益数据查询中（连接数据库）...")
+        r = refresh_revenue_cache(sid, rate, currency, log_fn=lambda m: plog(f"    [收益] {m}"))
+        revenue_data = r.get("revenue_data") or []
+        if r.get("error"):
+            # 数据库无数据的生产商以 producers.json 配置为准；其余视为失败（重试 / 沿用上一版）
+            if not prod.get("revenue_data"):
+                raise RuntimeError(f"收益刷新失败: {r['error']}")
+            revenue_data = prod.get("revenue_data", [])
+            plog(f"  {sid}: 收益使用 producers 配置 {len(revenue_data)} 条")
+        plog(f"  {sid}: 收益 {len(revenue_data)} 条")
+        pc["revenue_data"] = revenue_data
+
+    elif section == "cashflow":
+        revenue_data = pc.get("revenue_data") or []
+        coll_rate = 0.98
+        if revenue_data:
+            cr = revenue_data[-1].get("collection_rate", 0.98) or 0.98
+            coll_rate = cr if cr >= 0.5 else (revenue_data[-2].get("collection_rate", 0.98) or 0.98 if len(revenue_data) >= 2 else 0.98)
+        from kn_cashflow_cache import refresh_cashflow_cache, load_cashflow_cache
+        plog(f"  {sid}: 现金流数据查询中（连接数据库）...")
+        r = refresh_cashflow_cache(sid, rate, currency, coll_rate, log_fn=lambda m: plog(f"    [现金流] {m}"))
+        if r.get("error"):
+            raise RuntimeError(f"现金流刷新失败: {r['error']}")
+        cashflow_data = r.get("forecast") or []
+        if not cashflow_data:
+            cached_cf, _, _ = load_cashflow_cache(sid)
+            if cached_cf:
+                cashflow_data = cached_cf
+                plog(f"  {sid}: 现金流使用单独缓存 {len(cashflow_data)} 条")
+        plog(f"  {sid}: 现金流 {len(cashflow_data)} 条")
+        pc["cashflow_data"] = cashflow_data
+
+    elif section == "priority":
+        risk_data = pc.get("risk_data") or []
+        from spv_internal_params import load_priority_indicators_for_spv, compute_priority_from_risk_data
+        priority_indicators = load_priority_indicators_for_spv(sid, risk_data=risk_data, exchange_rate=rate) or None
+        if not priority_indicators and risk_data:
+            priority_indicators = compute_priority_from_risk_data(sid, risk_data, rate) or None
+        if not priority_indicators:
+            plog(f"  {sid}: 优先级指标缺失（spv_internal_params 无数据且 risk_data 不足）")
+        _attach_coverage_series(priority_indicators, sid, risk_data, rate)
+        pc["priority_indicators"] = priority_indicators
+
+    else:
+        raise ValueError(f"未知板块: {section}")
+    return pc
+
+
+def _refresh_portfolio(log):
+    """
+    投资组合累计统计与平台持仓（全量刷新最后一步，所有生产商任务完成后执行）
+    返回: (portfolio_cumulative_stats, allocation_by_platform)
+    """
+    portfolio_cumulative_stats = None
+    allocation_by_platform = None
+    log("正在从数据库加载投资组合统计与平台持仓...")
+    try:
+        from spv_internal_params import load_invested_spv_ids_for_portfolio, load_all_spv_internal_params_for_portfolio
+        from kn_risk_query import query_portfolio_cumulative_stats
+        spv_ids = load_invested_spv_ids_for_portfolio()
+        log(f"投资组合包含 {len(spv_ids)} 个生产商，查询累计统计中...")
+        portfolio_cumulative_stats = query_portfolio_cumulative_stats(spv_ids)
+        trades = load_all_spv_internal_params_for_portfolio()
+        log(f"投资组合统计加载完成，平台持仓 {len(trades) if trades else 0} 条")
+        if trades:
+            total_principal = sum(t.get("principal_amount") or 0 for t in trades)
+            allocation_by_platform = []
+            for t in trades:
+                pct = (t.get("principal_amount") or 0) / total_principal if total_principal > 0 else 0
+                agreed = t.get("agreed_rate") or 0
+                agreed_pct = agreed * 100 if agreed <= 1 else agreed
+                allocation_by_platform.append({
+                    "name": t.get("name") or t.get("spv_id") or "-",
+                    "value": t.get("principal_amount") or 0,
+                    "pct": pct,
+                    "type": t.get("product_type") or "-",
+                    "region": t.get("region") or "-",
+                    "principal_amount": t.get("principal_amount"),
+                    "agreed_rate": agreed_pct,
+                    "effective_date": t.get("effective_date") or "-",
+                })
     except Exception as e:
-        _append_log(logs, f"错误: {e}")
-        return {"error": str(e), "logs": logs}
-    finally:
-        try:
-            from kn_data_utils import clear_refresh_latest_date
-            clear_refresh_latest_date()
-        except Exception:
-            pass
+        log(f"投资组合统计加载失败: {e}")
+    return portfolio_cumulative_stats, allocation_by_platform
+
+
+def refresh_producer_full_cache(triggered_by: str = "admin", resume: bool = False, time_budget: int = None):
+    """
+    从数据库重新加载所有生产商的风控、收益、现金流数据并写入缓存
+    triggered_by: "admin" 手动刷新 | "cron" 定时刷新，日志中会标明来源
+    resume: True 时继续未完成的刷新任务（cron 无未完成任务且今天未刷新时开始新任务）；False 开始新任务
+    time_budget: 本次调用的时间预算（秒），默认 REFRESH_TIME_BUDGET_SECONDS，0 表示不限
+
+    刷新是持久化的 (生产商, 板块) 任务队列（见 kn_refresh_job），每个任务完成即写检查点，
+    超过时间预算时返回 pending，下次调用从检查点继续：
+    1. 新任务：加载生产商列表（load_producers_from_spv_config(skip_revenue_compute=True)），生成任务队列
+    2. 每次调用开启共享中间结果（kn_refresh_dag），缓存 get_latest_data_date
+    3. 按生产商（REFRESH_WORKERS 个线程并发，日志按生产商顺序输出）依次执行板块任务：
+       - 风控：refresh_risk_cache -> load_risk_cache
+       - 收益：refresh_revenue_cache；数据库无数据时仅 producers.json 配置了 revenue_data 的生产商回退到配置
+       - 现金流：refresh_cashflow_cache；预测为空则回退 load_cashflow_cache
+       - 优先级：load_priority_indicators_for_spv，无则 compute_priority_from_risk_data；
+         附覆盖倍数时间序列（kn_coverage，参数历史整次刷新只查一次）
+       查询异常或 refresh_*_cache 返回 error 即任务失败：重试 REFRESH_TASK_MAX_ATTEMPTS 次，
+       仍失败则沿用上一版分片中的该板块，该生产商保留上次水位（下次刷新重算）
+    4. 投资组合统计：load_invested_spv_ids、query_portfolio_cumulative_stats、load_all_spv_internal_params
+    5. 一次性发布：写入各生产商分片、manifest 及 cache_meta.json
+
+    单飞：Admin / Cron / 其他实例同时触发时只执行一份（kn_refresh_lease 租约），
+    本进程内的并发调用等待同一结果，其他实例正在刷新时返回 in_progress（附进行中任务的 pending）
+
+    返回: { "ok": True, "last_updated": "...", "system_cutover_date": "...", "producer_count": N, "logs": [...] }
+         未完成时 { "ok": True, "pending": 剩余任务数, "job_id": "...", "logs": [...] }；
+         他处刷新中 { "ok": True, "in_progress": True, "coalesced": True, "holder": {...}, "pending": N }；或 { "error": "..." }
+    """
+    from kn_refresh_job import run_refresh_job, load_job, _pending_tasks
+    from kn_refresh_lease import single_flight
+    result = single_flight(
+        "full_refresh",
+        lambda: run_refresh_job(triggered_by=triggered_by, resume=resume, time_budget=time_budget),
+        ttl=REFRESH_LEASE_SECONDS,
+    )
+    if result.get("in_progress"):
+        job = load_job() or {}
+        result = dict(result, job_id=job.get("job_id"), logs=[],
+                      pending=_pending_tasks(job) if job.get("status") == "running" else 1)
+    return result
 
 
 def _get_producer_config(spv_id):
@@ -534,19 +966,17 @@ def _get_producer_config(spv_id):
         return None
 
 
-def update_producer_risk_in_full_cache(spv_id: str, exchange_rate: float = 1, currency: str = "USD"):
+def update_producer_risk_in_full_cache(spv_id: str, exchange_rate: float = 1, currency: str = "USD",
+                                       updated_by: str = "admin"):
     """
-    刷新单个生产商的风控数据后，同步更新 producer_full_cache 中该生产商的 risk_data 和 priority_indicators。
+    刷新单个生产商的风控数据后，同步更新该生产商分片中的 risk_data 和 priority_indicators。
     供 api_refresh_risk 调用，确保页面刷新后显示最新数据。
     """
-    data, _ = load_producer_full_cache()
-    if not data:
-        return
-    producers = data.get("producers", {})
     sid = str(spv_id or "").strip().lower()
-    pc = producers.get(spv_id) or producers.get(sid)
+    pc = load_producer_shard(sid)
     if not pc:
         return
+    pc = dict(pc)
     try:
         from kn_risk_cache import load_risk_cache
         merged, _ = load_risk_cache(sid)
@@ -564,33 +994,26 @@ def update_producer_risk_in_full_cache(spv_id: str, exchange_rate: float = 1, cu
                     priority_indicators = pi
         except Exception:
             pass
+        _attach_coverage_series(priority_indicators, sid, pc.get("risk_data") or [], exchange_rate)
         pc["priority_indicators"] = priority_indicators
         pc["exchange_rate"] = exchange_rate
         pc["currency"] = currency
-        producers[sid] = pc
-        save_producer_full_cache({
-            "producers": producers,
-            "portfolio_cumulative_stats": data.get("portfolio_cumulative_stats"),
-            "allocation_by_platform": data.get("allocation_by_platform"),
-            "system_cutover_date": data.get("system_cutover_date"),
-        })
+        save_producer_shard(sid, pc, section="risk", updated_by=updated_by)
     except Exception:
         pass
 
 
-def update_producer_revenue_in_full_cache(spv_id: str, exchange_rate: float = 1, currency: str = "USD"):
+def update_producer_revenue_in_full_cache(spv_id: str, exchange_rate: float = 1, currency: str = "USD",
+                                          updated_by: str = "admin"):
     """
-    刷新单个生产商的收益数据后，同步更新 producer_full_cache 中该生产商的 revenue_data 及汇率。
+    刷新单个生产商的收益数据后，同步更新该生产商分片中的 revenue_data 及汇率。
     供 api_refresh_revenue 调用，确保页面刷新后显示最新数据。
     """
-    data, _ = load_producer_full_cache()
-    if not data:
-        return
-    producers = data.get("producers", {})
     sid = str(spv_id or "").strip().lower()
-    pc = producers.get(spv_id) or producers.get(sid)
+    pc = load_producer_shard(sid)
     if not pc:
         return
+    pc = dict(pc)
     try:
         from kn_revenue_cache import load_revenue_cache
         cached_rev, _ = load_revenue_cache(sid)
@@ -598,30 +1021,22 @@ def update_producer_revenue_in_full_cache(spv_id: str, exchange_rate: float = 1,
             pc["revenue_data"] = cached_rev
         pc["exchange_rate"] = exchange_rate or 1
         pc["currency"] = currency or "USD"
-        producers[sid] = pc
-        save_producer_full_cache({
-            "producers": producers,
-            "portfolio_cumulative_stats": data.get("portfolio_cumulative_stats"),
-            "allocation_by_platform": data.get("allocation_by_platform"),
-            "system_cutover_date": data.get("system_cutover_date"),
-        })
+        save_producer_shard(sid, pc, section="revenue", updated_by=updated_by)
     except Exception:
         pass
 
 
-def update_producer_cashflow_in_full_cache(spv_id: str, exchange_rate: float = 1, currency: str = "USD"):
+def update_producer_cashflow_in_full_cache(spv_id: str, exchange_rate: float = 1, currency: str = "USD",
+                                           updated_by: str = "admin"):
     """
-    刷新单个生产商的现金流数据后，同步更新 producer_full_cache 中该生产商的 cashflow_data 及汇率。
+    刷新单个生产商的现金流数据后，同步更新该生产商分片中的 cashflow_data 及汇率。
     供 api_refresh_cashflow 调用，确保页面刷新后显示最新数据。
     """
-    data, _ = load_producer_full_cache()
-    if not data:
-        return
-    producers = data.get("producers", {})
     sid = str(spv_id or "").strip().lower()
-    pc = producers.get(spv_id) or producers.get(sid)
+    pc = load_producer_shard(sid)
     if not pc:
         return
+    pc = dict(pc)
     try:
         from kn_cashflow_cache import load_cashflow_cache
         cached_cf, _, _ = load_cashflow_cache(sid)
@@ -629,23 +1044,178 @@ def update_producer_cashflow_in_full_cache(spv_id: str, exchange_rate: float = 1
             pc["cashflow_data"] = cached_cf
         pc["exchange_rate"] = exchange_rate or 1
         pc["currency"] = currency or "USD"
-        producers[sid] = pc
-        save_producer_full_cache({
-            "producers": producers,
-            "portfolio_cumulative_stats": data.get("portfolio_cumulative_stats"),
-            "allocation_by_platform": data.get("allocation_by_platform"),
-            "system_cutover_date": data.get("system_cutover_date"),
-        })
+        save_producer_shard(sid, pc, section="cashflow", updated_by=updated_by)
     except Exception:
         pass
 
 
+# ---------- stale-while-revalidate：过期板块照常返回，后台单次刷新 ----------
+_revalidate_lock = threading.Lock()
+_revalidate_inflight = set()  # (sid, section)，本进程内单飞
+_revalidate_checked = {}  # (sid, section) -> 上次检查时间（time.monotonic），本进程内节流
+_revalidate_queue = []
+_revalidate_worker = None
+
+
+def refresh_producer_section(spv_id: str, section: str, updated_by: str = "revalidate",
+                             exchange_rate: float = None, currency: str = None):
+    """
+    从数据库刷新单个生产商的一个板块并写回分片（/api/partner/<id>/refresh-* 与后台 revalidate 共用）
+    section: risk | revenue | cashflow；返回 refresh_*_cache 的结果
+    exchange_rate / currency: 不传时取 manifest 中的值（无则取生产商配置）
+    单飞：同一 (生产商, 板块) 的手动刷新与后台刷新并发时只执行一次，
+    其他实例正在刷新时返回 { in_progress, coalesced, holder }
+    """
+    sid = _shard_key(spv_id)
+    if section not in REVALIDATE_SECTIONS:
+        return {"error": f"未知板块: {section}"}
+    from kn_refresh_lease import single_flight
+    return single_flight(
+        f"section_{sid}_{section}",
+        lambda: _refresh_producer_section_now(sid, section, updated_by, exchange_rate, currency),
+        ttl=REVALIDATE_LEASE_SECONDS,
+    )
+
+
+def _refresh_producer_section_now(sid: str, section: str, updated_by: str, exchange_rate=None, currency=None):
+    entry = ((load_producer_manifest() or {}).get("producers") or {}).get(sid) or {}
+    cfg = _get_producer_config(sid) if not entry else None
+    rate = float(exchange_rate or entry.get("exchange_rate") or (cfg or {}).get("exchange_rate") or 1)
+    currency = currency or entry.get("currency") or (cfg or {}).get("currency") or "USD"
+    if section == "risk":
+        from kn_risk_cache import refresh_risk_cache
+        result = refresh_risk_cache(sid, rate, currency)
+        if "error" not in result:
+            update_producer_risk_in_full_cache(sid, rate, currency, updated_by=updated_by)
+    elif section == "revenue":
+        from kn_revenue_cache import refresh_revenue_cache
+        result = refresh_revenue_cache(sid, rate, currency)
+        if "error" not in result:
+            update_producer_revenue_in_full_cache(sid, rate, currency, updated_by=updated_by)
+    elif section == "cashflow":
+        coll_rate = 0.98
+        try:
+            from kn_revenue_cache import load_revenue_cache
+            cached_rev, _ = load_revenue_cache(sid)
+            if cached_rev:
+                cr = cached_rev[-1].get("collection_rate", 0.98) or 0.98
+                coll_rate = cr if cr >= 0.5 else (cached_rev[-2].get("collection_rate", 0.98) or 0.98 if len(cached_rev) >= 2 else 0.98)
+        except Exception:
+            pass
+        from kn_cashflow_cache import refresh_cashflow_cache
+        result = refresh_cashflow_cache(sid, rate, currency, coll_rate)
+        if "error" not in result:
+            update_producer_cashflow_in_full_cache(sid, rate, currency, updated_by=updated_by)
+    return result
+
+
+def _section_age_seconds(spv_id: str, section: str):
+    """分片板块距上次更新的秒数；manifest 无该生产商时返回 None"""
+    entry = ((load_producer_manifest() or {}).get("producers") or {}).get(_shard_key(spv_id))
+    if not entry:
+        return None
+    ts = (entry.get("sections") or {}).get(section) or entry.get("updated_at")
+    try:
+        return (datetime.now() - datetime.fromisoformat(ts)).total_seconds()
+    except Exception:
+        return None
+
+
+def _record_revalidation(key: str, info: dict = None):
+    """在 cache_meta.revalidating 中记录/清除某板块的后台刷新状态（跨实例可见）"""
+    meta = dict(load_cache_meta() or {})
+    revalidating = dict(meta.get("revalidating") or {})
+    if info is None:
+        revalidating.pop(key, None)
+    else:
+        revalidating[key] = info
+    meta["revalidating"] = revalidating
+    _write_cache_meta(meta)
+
+
+def _revalidate_run():
+    """后台线程：依次处理队列中的板块刷新，队列空时退出"""
+    global _revalidate_worker
+    import logging
+    while True:
+        with _revalidate_lock:
+            if not _revalidate_queue:
+                _revalidate_worker = None
+                return
+            sid, section = _revalidate_queue.pop(0)
+        key = f"{sid}:{section}"
+        try:
+            result = refresh_producer_section(sid, section)
+            if "error" in (result or {}):
+                raise RuntimeError(result["error"])
+            if result.get("in_progress"):
+                continue  # 其他实例正在刷新该板块，由其完成后更新记录
+            _record_revalidation(key, None)
+        except Exception as e:
+            logging.getLogger("kn_producer_cache").warning("[revalidate] %s 失败: %s", key, e)
+            _record_revalidation(key, {"status": "error", "error": str(e)[:200],
+                                       "finished_at": datetime.now().isoformat()})
+        finally:
+            with _revalidate_lock:
+                _revalidate_inflight.discard((sid, section))
+
+
+def schedule_revalidate(spv_id: str, section: str, max_age: int = None) -> bool:
+    """
+    板块过期（或缺失）时安排一次后台刷新，立即返回；请求本身不等待数据库
+    - 本进程内同一 (生产商, 板块) 每 REVALIDATE_THROTTLE_SECONDS 秒最多检查一次（先于任何 manifest / Blob 读写）
+    - 同一 (生产商, 板块) 本进程内只排队一次；cache_meta 中他处刷新未超时（REVALIDATE_LEASE_SECONDS）也不重复
+    - Serverless 响应后线程会被终止，不安排也不记录，过期板块由 Cron 全量刷新更新
+    返回是否新安排了刷新
+    """
+    global _revalidate_worker
+    if _IS_SERVERLESS:
+        return False
+    sid = _shard_key(spv_id)
+    if not sid or section not in REVALIDATE_SECTIONS:
+        return False
+    now = time.monotonic()
+    with _revalidate_lock:
+        last = _revalidate_checked.get((sid, section))
+        if last is not None and now - last < REVALIDATE_THROTTLE_SECONDS:
+            return False
+        _revalidate_checked[(sid, section)] = now
+    age = _section_age_seconds(sid, section)
+    if age is not None and age < (CACHE_STALE_SECONDS if max_age is None else max_age):
+        return False
+    key = f"{sid}:{section}"
+    with _revalidate_lock:
+        if (sid, section) in _revalidate_inflight:
+            return False
+        _revalidate_inflight.add((sid, section))
+    rec = ((load_cache_meta() or {}).get("revalidating") or {}).get(key) or {}
+    try:
+        started = datetime.fromisoformat(rec.get("started_at") or "")
+        if rec.get("status") == "running" and (datetime.now() - started).total_seconds() < REVALIDATE_LEASE_SECONDS:
+            with _revalidate_lock:
+                _revalidate_inflight.discard((sid, section))
+            return False
+    except (TypeError, ValueError):
+        pass
+    _record_revalidation(key, {"status": "running", "started_at": datetime.now().isoformat(),
+                               "age_seconds": int(age) if age is not None else None})
+    with _revalidate_lock:
+        _revalidate_queue.append((sid, section))
+        if _revalidate_worker is None:
+            _revalidate_worker = threading.Thread(target=_revalidate_run, daemon=True)
+            _revalidate_worker.start()
+    return True
+
+
 def load_refresh_log():
     """从 Blob 或文件读取刷新日志（最后 2000 行，Blob 优先实现跨实例共享）"""
     try:
-        from kn_cache_storage import _use_blob, cache_get, BLOB_PATH_LOG
+        from kn_cache_storage import _use_blob, cache_get, read_segmented_log, BLOB_PATH_LOG
         if _use_blob():
-            raw = cache_get(BLOB_PATH_LOG)
+            lines = read_segmented_log(2000)
+            if lines:
+                return lines
+            raw = cache_get(BLOB_PATH_LOG)  # 旧版单文件日志
             if raw:
                 lines = raw.strip().split("\n")
                 lines = [ln + "\n" for ln in lines]
@@ -673,12 +1243,14 @@ def get_refresh_status():
     return dict(_refresh_status)
 
 
-def refresh_producer_full_cache_async():
+def refresh_producer_full_cache_async(resume: bool = False):
     """
     刷新全量缓存。
     - 本地：后台线程执行，立即返回，可轮询状态
     - Vercel：同步执行。Serverless 在响应返回后函数终止，后台线程会被杀死，
-      必须同步执行才能保证缓存文件写入成功。
+      必须同步执行才能保证缓存文件写入成功。单次调用受时间预算限制，未完成时结果含 pending，
+      由页面以 resume=True 再次调用（或下一次 cron）继续
+    resume: True 时继续未完成的刷新任务
     """
     global _refresh_status
     if _refresh_status.get("running"):
@@ -690,7 +1262,7 @@ def refresh_producer_full_cache_async():
         _refresh_status["result"] = None
         _refresh_status["logs"] = []
         try:
-            result = refresh_producer_full_cache()
+            result = refresh_producer_full_cache(resume=resume)
             _refresh_status["running"] = False
             _refresh_status["result"] = result
             _refresh_status["logs"] = result.get("logs", [])
@@ -709,7 +1281,7 @@ def refresh_producer_full_cache_async():
         try:
             from app import app
             with app.app_context():
-                result = refresh_producer_full_cache()
+                result = refresh_producer_full_cache(resume=resume)
             _refresh_status["running"] = False
             _refresh_status["result"] = result
             _refresh_status["logs"] = result.get("logs", [])
@@ -0,0 +1,336 @@
+"""
+全量刷新共享中间结果 - 命名阶段（stage）+ 显式依赖 + 记忆化
+- 一次全量刷新内，各模块（kn_risk_query / kn_vintage / kn_collection / kn_revenue / kn_cashflow / spv_internal_params）
+  反复用到的中间结果（表清单、最新数据日、各 SPV 的 stat_date、活跃贷款、还款计划月汇总、spv_config）只计算一次
+- 刷新开始 begin_run()，结束 end_run()；无活动 run 时 current_run() 返回 None，各模块按原逻辑自行查询
+- 阶段依赖：
+    public_tables ─┬─ calc_tables ─┬─ latest_data_date ─┐
+                   │               └─ spv_stat_dates(spv) ┴─ active_loans(spv) ─ schedule_by_month(spv)
+                   ├─ spv_config_rows
+                   ├─ spv_internal_params_latest
+                   ├─ spv_internal_params_history（覆盖倍数时间序列，按生效日匹配）
+                   └─ spv_watermarks（与 calc_tables 一起，变更检测用）
+"""
+import logging
+import threading
+import time
+
+log = logging.getLogger("kn_refresh_dag")
+
+_STAGES = {}  # name -> (fn, deps, keyed)
+_current = None
+
+
+def stage(name: str, deps=(), keyed: bool = False):
+    """
+    注册阶段。fn(*key, **{dep: value}) -> 结果
+    keyed=True 表示按参数（如 spv_id）分别记忆化；依赖若也是 keyed，则以同一参数求值
+    """
+    def deco(fn):
+        _STAGES[name] = (fn, tuple(deps), keyed)
+        return fn
+    return deco
+
+
+class RefreshRun:
+    """一次刷新内的阶段结果表，线程安全：并发生产商请求同一阶段时只有一个线程计算，其余等待复用"""
+
+    def __init__(self):
+        self._values = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.stats = {}  # name -> {"computed", "hits", "seconds"}
+
+    def _stat(self, name):
+        return self.stats.setdefault(name, {"computed": 0, "hits": 0, "seconds": 0.0})
+
+    def get(self, name: str, *key):
+        fn, deps, keyed = _STAGES[name]
+        k = (name,) + (key if keyed else ())
+        while True:
+            with self._lock:
+                if k in self._values:
+                    self._stat(name)["hits"] += 1
+                    return self._values[k]
+                ev = self._pending.get(k)
+                if ev is None:
+                    ev = threading.Event()
+                    self._pending[k] = ev
+                    break
+            ev.wait()  # 其他线程正在计算；失败时重新竞争计算
+        try:
+            kwargs = {}
+            for dep in deps:
+                kwargs[dep] = self.get(dep, *key) if _STAGES[dep][2] else self.get(dep)
+            t0 = time.time()
+            from kn_refresh_profile import profile_stage
+            with profile_stage("*", f"dag:{name}"):
+                value = fn(*(key if keyed else ()), **kwargs)
+            with self._lock:
+                self._values[k] = value
+                st = self._stat(name)
+                st["computed"] += 1
+                st["seconds"] += time.time() - t0
+            return value
+        finally:
+            with self._lock:
+                self._pending.pop(k, None)
+            ev.set()
+
+    def summary(self) -> str:
+        """各阶段计算/复用次数，供刷新日志输出"""
+        parts = [f"{n}: 计算{s['computed']} 复用{s['hits']}" for n, s in sorted(self.stats.items())]
+        return "；".join(parts)
+
+
+def begin_run() -> RefreshRun:
+    """开始一次刷新（全局可见，线程池中的生产商任务共享）"""
+    global _current
+    _current = RefreshRun()
+    return _current
+
+
+def end_run():
+    global _current
+    _current = None
+
+
+def current_run():
+    """当前刷新的 RefreshRun，无则 None"""
+    return _current
+
+
+def _query(sql, params=None):
+    from db_connect import get_connection
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        return cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
+
+# ---------- 阶段定义 ----------
+
+@stage("public_tables")
+def _public_tables():
+    """public schema 下全部表名（替代逐表 information_schema 检查）"""
+    rows = _query("SELECT table_name FROM information_schema.tables WHERE table_schema='public'")
+    return frozenset(r[0] for r in rows if r and r[0])
+
+
+@stage("calc_tables", deps=("public_tables",))
+def _calc_tables(public_tables):
+    """存在的 calc_overdue 月分区表，按时间升序"""
+    from kn_data_utils import get_calc_table
+    candidates = [get_calc_table(y, m) for y in [2024, 2025, 2026, 2027] for m in range(1, 13)]
+    return [t for t in candidates if t in public_tables]
+
+
+@stage("latest_data_date", deps=("calc_tables",))
+def _latest_data_date(calc_tables):
+    """系统最新数据日：从最新分区往前找第一个有数据的表（分区按 stat_date 月份划分）"""
+    from db_connect import get_connection
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        for tbl in reversed(calc_tables):
+            try:
+                cur.execute(f"SELECT MAX(stat_date)::date FROM {tbl}")
+                row = cur.fetchone()
+            except Exception:
+                conn.rollback()
+                continue
+            if row and row[0]:
+                dt = row[0]
+                return dt.date() if hasattr(dt, "date") else dt
+        return None
+    finally:
+        cur.close()
+        conn.close()
+
+
+@stage("spv_stat_dates", deps=("calc_tables",), keyed=True)
+def _spv_stat_dates(spv_id, calc_tables):
+    """
+    该 SPV 全部 stat_date（降序，YYYY-MM-DD）及所在分区：[(date_str, table), ...]
+    供可用日期、月末快照日、活跃贷款快照等复用
+    """
+    from db_connect import get_connection
+    conn = get_connection()
+    cur = conn.cursor()
+    out = []
+    try:
+        for tbl in calc_tables:
+            try:
+                cur.execute(f"SELECT DISTINCT stat_date::date FROM {tbl} WHERE spv_id = %s", (spv_id,))
+                out.extend((str(r[0])[:10], tbl) for r in cur.fetchall() if r and r[0])
+            except Exception:
+                conn.rollback()
+                continue
+    finally:
+        cur.close()
+        conn.close()
+    out.sort(reverse=True)
+    return out
+
+
+@stage("active_loans", deps=("latest_data_date", "spv_stat_dates"), keyed=True)
+def _active_loans(spv_id, latest_data_date, spv_stat_dates):
+    """
+    最新数据日及之前、该 SPV 最近快照中的活跃贷款（loan_status 1,2）
+    返回: { "stat_date", "table", "loan_ids" }
+    """
+    as_of = latest_data_date.strftime("%Y-%m-%d") if latest_data_date else None
+    snap = next(((d, t) for d, t in spv_stat_dates if as_of is None or d <= as_of), None)
+    if not snap:
+        return {"stat_date": None, "table": None, "loan_ids": []}
+    rows = _query(
+        f"SELECT loan_id FROM {snap[1]} WHERE spv_id = %s AND loan_status IN (1, 2) AND stat_date::date = %s",
+        (spv_id, snap[0]),
+    )
+    return {"stat_date": snap[0], "table": snap[1], "loan_ids": [r[0] for r in rows if r and r[0]]}
+
+
+@stage("schedule_by_month", deps=("latest_data_date", "active_loans"), keyed=True)
+def _schedule_by_month(spv_id, latest_data_date, active_loans):
+    """
+    还款计划按月汇总（jsonb 只展开一次），同时满足收益与现金流：
+    { month: { "due_all": 全部贷款应还本息, "principal_active": 活跃贷款未来应还本金,
+               "interest_active": 活跃贷款未来应还利息, "loan_count_active": 活跃贷款笔数 } }
+    未来 = due_date 晚于最新数据日
+    """
+    from datetime import date
+    as_of = (latest_data_date or date.today()).strftime("%Y-%m-%d")
+    rows = _query("""
+        SELECT to_char((elem->>'due_date')::date, 'YYYY-MM') AS m,
+            SUM((COALESCE(elem->>'principal', elem->>'principal_due', '0'))::numeric +
+                (COALESCE(elem->>'interest', elem->>'interest_due', '0'))::numeric) AS due_all,
+            SUM((COALESCE(elem->>'principal', elem->>'principal_due', '0'))::numeric)
+                FILTER (WHERE act.is_active AND (elem->>'due_date')::date > %s::date) AS principal_active,
+            SUM((COALESCE(elem->>'interest', elem->>'interest_due', '0'))::numeric)
+                FILTER (WHERE act.is_active AND (elem->>'due_date')::date > %s::date) AS interest_active,
+            COUNT(DISTINCT rl.loan_id)
+                FILTER (WHERE act.is_active AND (elem->>'due_date')::date > %s::date) AS loan_count_active
+        FROM raw_loan rl
+        CROSS JOIN LATERAL (SELECT rl.loan_id = ANY(%s) AS is_active) act
+        CROSS JOIN LATERAL jsonb_array_elements(COALESCE(rl.repayment_schedule->'schedule', '[]'::jsonb)) elem
+        WHERE rl.spv_id = %s AND elem->>'due_date' IS NOT NULL
+        GROUP BY 1
+    """, (as_of, as_of, as_of, list(active_loans.get("loan_ids") or []), spv_id))
+    out = {}
+    for m, due_all, p_act, i_act, lc in rows:
+        if m:
+            out[m] = {
+                "due_all": float(due_all or 0),
+                "principal_active": float(p_act or 0),
+                "interest_active": float(i_act or 0),
+                "loan_count_active": int(lc or 0),
+            }
+    return out
+
+
+@stage("spv_config_rows", deps=("public_tables",))
+def _spv_config_rows(public_tables):
+    """spv_config 全表（列名小写），{ spv_id 原值: rec }；表不存在时为空"""
+    if "spv_config" not in public_tables:
+        return {}
+    from db_connect import get_connection
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT * FROM spv_config")
+        cols = [d[0].lower() for d in cur.description]
+        out = {}
+        for row in cur.fetchall():
+            rec = dict(zip(cols, row))
+            key = rec.get("spv_id") or rec.get("id")
+            if key:
+                out[str(key)] = rec
+        return out
+    finally:
+        cur.close()
+        conn.close()
+
+
+@stage("spv_internal_params_latest", deps=("public_tables",))
+def _spv_internal_params_latest(public_tables):
+    """spv_internal_params 每个 SPV 最新一条（DISTINCT ON），{ spv_id 原值: rec }；表不存在时为空"""
+    if "spv_internal_params" not in public_tables:
+        return {}
+    from db_connect import get_connection
+    from spv_internal_params import fetch_latest_params
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        return fetch_latest_params(conn, cur)
+    finally:
+        cur.close()
+        conn.close()
+
+
+@stage("spv_internal_params_history", deps=("public_tables",))
+def _spv_internal_params_history(public_tables):
+    """spv_internal_params 全部记录按 effective_date 升序，{ spv_id 原值: [rec, ...] }；表不存在时为空"""
+    if "spv_internal_params" not in public_tables:
+        return {}
+    from db_connect import get_connection
+    from kn_coverage import fetch_params_history
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        return fetch_params_history(conn, cur)
+    finally:
+        cur.close()
+        conn.close()
+
+
+# 变更检测按 SPV 扫描的最新 calc_overdue 分区数（跨月时新分区可能尚无数据，故取最近两个）
+WATERMARK_RECENT_PARTITIONS = 2
+
+
+@stage("spv_watermarks", deps=("public_tables", "calc_tables"))
+def _spv_watermarks(public_tables, calc_tables):
+    """
+    各 SPV 输入数据水位（变更检测用），calc_overdue 只扫描最近分区：
+    - 最近 WATERMARK_RECENT_PARTITIONS 个 calc_overdue 分区按 SPV 一条 GROUP BY：最大 stat_date 与行数
+    - raw_loan / raw_repayment 按 SPV 一条 GROUP BY：最大放款时间 / 还款日与行数
+      （收益直接读 raw 表，新增或回补的放款、还款都会改变该 SPV 的行数或最大日期）
+    - spv_internal_params（小表）按 SPV GROUP BY
+    { spv_id 小写: { calc_max_stat_date, calc_rows, loan_max_disbursement_time, loan_rows,
+                    repay_max_date, repay_rows, params_max_effective_date, params_rows } }
+    值均转为字符串/整数，便于与上次发布时的水位直接比较
+    """
+    out = {}
+
+    def _merge(rows, max_key, rows_key):
+        for sid, mx, n in rows:
+            if not sid:
+                continue
+            w = out.setdefault(sid, {})
+            mx = str(mx) if mx is not None else None
+            if mx is not None and (w.get(max_key) is None or mx > w[max_key]):
+                w[max_key] = mx
+            w[rows_key] = w.get(rows_key, 0) + int(n or 0)
+
+    recent = calc_tables[-WATERMARK_RECENT_PARTITIONS:]
+    for tbl in recent:
+        _merge(_query(f"SELECT LOWER(TRIM(spv_id)), MAX(stat_date)::date, COUNT(*) FROM {tbl} GROUP BY 1"),
+               "calc_max_stat_date", "calc_rows")
+    if "raw_loan" in public_tables:
+        _merge(_query("SELECT LOWER(TRIM(spv_id)), MAX(disbursement_time), COUNT(*) FROM raw_loan GROUP BY 1"),
+               "loan_max_disbursement_time", "loan_rows")
+    if "raw_repayment" in public_tables:
+        _merge(_query("SELECT LOWER(TRIM(spv_id)), MAX(repayment_date), COUNT(*) FROM raw_repayment GROUP BY 1"),
+               "repay_max_date", "repay_rows")
+    if "spv_internal_params" in public_tables:
+        try:
+            rows = _query("SELECT LOWER(TRIM(spv_id)), MAX(effective_date), COUNT(*) FROM spv_internal_params GROUP BY 1")
+        except Exception:
+            # 无 effective_date 列时只比较行数
+            rows = _query("SELECT LOWER(TRIM(spv_id)), NULL, COUNT(*) FROM spv_internal_params GROUP BY 1")
+        _merge(rows, "params_max_effective_date", "params_rows")
+
+    return out
@@ -0,0 +1,475 @@
+"""
+可续跑的全量刷新 - 持久化任务队列 + 检查点 + 时间预算
+- 一次全量刷新拆为 (生产商, 板块) 任务：risk → revenue → cashflow → priority（同一生产商内按序执行）
+- 任务状态（refresh_job/job.json）与各生产商已完成板块（refresh_job/staging/<sid>.json）写入缓存后端（Blob 优先，否则文件）
+- 每次调用在时间预算（REFRESH_TIME_BUDGET_SECONDS）内处理任务，到时保存检查点返回 pending，下次调用（cron / admin 继续）从检查点续跑
+- 任务失败重试 REFRESH_TASK_MAX_ATTEMPTS 次，仍失败则沿用上一版分片中的该板块，不拖垮整个刷新
+- 全部生产商任务完成后：投资组合统计 → 一次性发布（save_producer_full_cache，manifest 为提交点），未完成的刷新不会发布半份缓存
+- 变更检测：新任务开始时比较各 SPV 输入数据水位（kn_refresh_dag.spv_watermarks + 汇率/币种）与上次发布时记录的水位，
+  未变化的生产商任务标记为 skipped，发布时沿用上一版分片，并在刷新日志中列出
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from kn_producer_cache import CACHE_DIR, _IS_SERVERLESS, PRODUCER_SECTIONS, _SECTION_KEYS, _PRODUCER_INFO_KEYS
+
+# 单次调用的时间预算（秒）：serverless 默认 240，给 maxDuration 300 留出发布与收尾时间；本地默认 0（不限）
+REFRESH_TIME_BUDGET_SECONDS = int(os.getenv("REFRESH_TIME_BUDGET_SECONDS", "240" if _IS_SERVERLESS else "0") or 0)
+REFRESH_TASK_MAX_ATTEMPTS = int(os.getenv("REFRESH_TASK_MAX_ATTEMPTS", "2") or 2)
+# 输入数据未变化的生产商跳过重算（0 关闭，每次全部重算）
+REFRESH_SKIP_UNCHANGED = os.getenv("REFRESH_SKIP_UNCHANGED", "1").strip().lower() not in ("0", "false", "no")
+JOB_DIR = os.path.join(CACHE_DIR, "refresh_job")
+JOB_FILE = os.path.join(JOB_DIR, "job.json")
+STAGING_DIR = os.path.join(JOB_DIR, "staging")
+JOB_PROFILE_FILE = os.path.join(JOB_DIR, "profile.json")
+
+
+def _staging_file(sid: str) -> str:
+    return os.path.join(STAGING_DIR, f"{sid}.json")
+
+
+def _read_json(blob_path: str, file_path: str):
+    """Blob 优先，否则文件；无则 None"""
+    try:
+        from kn_cache_storage import _use_blob, cache_get_json
+        if _use_blob():
+            return cache_get_json(blob_path)
+    except Exception:
+        pass
+    if not os.path.isfile(file_path):
+        return None
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def _write_json(blob_path: str, file_path: str, data):
+    """写入 Blob + 文件（Blob 写入失败抛异常，检查点不能静默丢失）"""
+    from kn_cache_storage import _use_blob, cache_set_json
+    from kn_producer_cache import _write_json_atomic
+    if _use_blob() and not cache_set_json(blob_path, data):
+        raise RuntimeError(f"Blob 写入失败: {blob_path}")
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    _write_json_atomic(file_path, data)
+
+
+def load_job():
+    """当前（或最近一次）刷新任务，无则 None"""
+    from kn_cache_storage import BLOB_PATH_JOB
+    return _read_json(BLOB_PATH_JOB, JOB_FILE)
+
+
+def _save_job(job: dict):
+    from kn_cache_storage import BLOB_PATH_JOB
+    job["updated_at"] = datetime.now().isoformat()
+    _write_json(BLOB_PATH_JOB, JOB_FILE, job)
+
+
+def _load_staged(sid: str):
+    from kn_cache_storage import blob_staging_path
+    return _read_json(blob_staging_path(sid), _staging_file(sid))
+
+
+def _save_staged(sid: str, pc: dict):
+    from kn_cache_storage import blob_staging_path
+    _write_json(blob_staging_path(sid), _staging_file(sid), pc)
+
+
+def _load_job_profile():
+    """续跑时读取之前调用累计的性能统计（kn_refresh_profile）"""
+    from kn_cache_storage import BLOB_PATH_JOB_PROFILE
+    return _read_json(BLOB_PATH_JOB_PROFILE, JOB_PROFILE_FILE)
+
+
+def _save_job_profile(state: dict):
+    from kn_cache_storage import BLOB_PATH_JOB_PROFILE
+    _write_json(BLOB_PATH_JOB_PROFILE, JOB_PROFILE_FILE, state)
+
+
+def _clear_staging():
+    """删除暂存的生产商板块（发布后或开始新任务时）"""
+    try:
+        from kn_cache_storage import _use_blob, _blob_list_folder, _blob_delete, BLOB_STAGING_PREFIX
+        if _use_blob():
+            objs = _blob_list_folder(BLOB_STAGING_PREFIX, force=True)
+            _blob_delete([b.get("url") for b in objs.values() if b.get("url")])
+    except Exception:
+        pass
+    try:
+        if os.path.isdir(STAGING_DIR):
+            for f in os.listdir(STAGING_DIR):
+                os.remove(os.path.join(STAGING_DIR, f))
+    except Exception:
+        pass
+
+
+def _pending_tasks(job: dict) -> int:
+    """未完成任务数（生产商板块 + 投资组合/发布）"""
+    n = sum(1 for entry in job["producers"].values()
+            for t in entry["tasks"].values() if t["state"] == "pending")
+    return n + (0 if job.get("published") else 1)
+
+
+def _new_job(triggered_by: str, log):
+    """开始新刷新：测试数据库连接、加载生产商列表、生成任务队列；无生产商返回 None"""
+    log("正在连接数据库...")
+    try:
+        from db_connect import get_connection
+        conn = get_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.fetchone()
+        cur.close()
+        conn.close()
+        log("数据库连接成功")
+    except Exception as e:
+        log(f"数据库连接失败: {e}（将尝试从配置文件加载生产商）")
+
+    # skip_revenue_compute=True：后续会逐个 refresh_revenue_cache，避免重复计算
+    log("正在加载生产商配置...")
+    from spv_config import load_spv_config, load_producers_from_spv_config
+    db_producers = load_spv_config()
+    if db_producers:
+        log(f"从数据库 spv_config 表加载到 {len(db_producers)} 个生产商")
+    producers_raw = load_producers_from_spv_config(skip_revenue_compute=True)
+    if not producers_raw:
+        from app import load_producers
+        producers_raw = load_producers()
+        if producers_raw:
+            log(f"从配置文件 producers.json 加载到 {len(producers_raw)} 个生产商")
+    elif not db_producers:
+        log(f"从配置文件 producers.json 加载到 {len(producers_raw)} 个生产商")
+    if not producers_raw:
+        return None
+
+    # 变更检测：本次水位 vs 上次发布时的水位（查询失败时不跳过任何生产商）
+    from kn_producer_cache import _producer_rate, load_producer_manifest
+    watermarks = None
+    try:
+        from kn_refresh_dag import current_run
+        run = current_run()
+        if run is not None:
+            watermarks = run.get("spv_watermarks")
+    except Exception as e:
+        log(f"输入数据水位查询失败，本次不跳过生产商: {e}")
+    prev_manifest = load_producer_manifest() or {}
+    prev_watermarks = prev_manifest.get("watermarks") or {}
+    prev_producers = prev_manifest.get("producers") or {}
+
+    _clear_staging()
+    now = datetime.now()
+    job = {
+        "job_id": now.strftime("%Y%m%d%H%M%S") + "_" + uuid.uuid4().hex[:8],
+        "status": "running",
+        "triggered_by": triggered_by,
+        "created_at": now.isoformat(),
+        "invocations": 0,
+        "order": [],
+        "producers": {},
+        "published": False,
+    }
+    skipped = []
+    for spv_id, prod in producers_raw.items():
+        sid = str(spv_id).strip().lower()
+        wm = None
+        if watermarks is not None:
+            rate, currency = _producer_rate(sid, prod)
+            wm = dict(watermarks.get(sid) or {}, exchange_rate=rate, currency=currency)
+        unchanged = (REFRESH_SKIP_UNCHANGED and wm is not None and sid in prev_producers
+                     and prev_watermarks.get(sid) == wm)
+        job["order"].append(sid)
+        job["producers"][sid] = {
+            # 生产商配置随任务保存，续跑时不再重新加载（保证同一次刷新内配置一致）
+            "prod": json.loads(json.dumps(prod, ensure_ascii=False, default=str)),
+            "tasks": {sec: {"state": "skipped" if unchanged else "pending", "attempts": 0} for sec in PRODUCER_SECTIONS},
+            "watermark": wm,
+            "prev_watermark": prev_watermarks.get(sid),
+        }
+        if unchanged:
+            skipped.append(sid)
+    job["skipped"] = skipped
+    if skipped:
+        log(f"输入数据无变化，跳过 {len(skipped)} 个生产商（沿用上一版缓存）: {', '.join(skipped)}")
+    elif watermarks is not None:
+        log("所有生产商输入数据均有变化或无上次水位，全部重算")
+    _save_job(job)
+    return job
+
+
+def _run_producer(job: dict, sid: str, deadline, plog, lock):
+    """
+    执行单个生产商剩余的板块任务，每完成一个写检查点（先暂存结果，再更新任务状态）
+    到达时间预算或任务失败待重试时提前返回
+    """
+    from kn_producer_cache import _producer_base, _refresh_producer_section, load_producer_shard
+    from kn_refresh_profile import profile_stage
+    entry = job["producers"][sid]
+    prod = entry["prod"]
+    pc = _load_staged(sid)
+    if pc is None:
+        pc = _producer_base(sid, prod, plog)
+    for sec in PRODUCER_SECTIONS:
+        task = entry["tasks"][sec]
+        if task["state"] != "pending":
+            continue
+        if deadline is not None and time.time() >= deadline:
+            return
+        t0 = time.time()
+        try:
+            with profile_stage(sid, sec):
+                _refresh_producer_section(pc, prod, sec, plog)
+            state = "done"
+        except Exception as e:
+            with lock:
+                task["attempts"] += 1
+                task["error"] = str(e)
+                attempts = task["attempts"]
+            plog(f"  {sid}: {sec} 任务失败（第 {attempts} 次）- {e}")
+            if attempts < REFRESH_TASK_MAX_ATTEMPTS:
+                with lock:
+                    _save_job(job)
+                return  # 下一轮 / 下次调用重试，后续板块依赖本板块，暂不执行
+            old = None
+            try:
+                old = load_producer_shard(sid)
+            except Exception:
+                pass
+            key = _SECTION_KEYS[sec]
+            if old and key in old:
+                pc[key] = old[key]
+                plog(f"  {sid}: {sec} 保留上一版缓存")
+            state = "failed"
+        _save_staged(sid, pc)
+        with lock:
+            # 任务字典属于共享 job，其他线程在锁内序列化，所有修改都在锁内进行
+            task["state"] = state
+            task["seconds"] = round(time.time() - t0, 2)
+            if state == "done":
+                task.pop("error", None)
+            _save_job(job)
+
+
+def _publish(job: dict, triggered_by: str, log):
+    """所有生产商任务结束后：投资组合统计 + 一次性写入分片与 manifest"""
+    from kn_producer_cache import _refresh_portfolio, load_producer_shard, save_producer_full_cache
+    from kn_refresh_profile import profile_stage
+    with profile_stage("*", "portfolio"):
+        portfolio_cumulative_stats, allocation_by_platform = _refresh_portfolio(log)
+
+    producers_cache = {}
+    all_stat_dates = []
+    watermarks = {}
+    for sid in job["order"]:
+        entry = job["producers"][sid]
+        pc = _load_staged(sid)
+        if pc is None:
+            try:
+                pc = load_producer_shard(sid)
+            except Exception:
+                pc = None
+            if pc and all(t["state"] == "skipped" for t in entry["tasks"].values()):
+                # 跳过的生产商：板块沿用上一版，基础信息（名称、状态等）取本次配置
+                from kn_producer_cache import _producer_base
+                base = _producer_base(sid, entry["prod"], lambda m: None)
+                pc = dict(pc, **{k: base[k] for k in _PRODUCER_INFO_KEYS if k in base})
+        if not pc:
+            continue
+        producers_cache[sid] = pc
+        # 仅所有板块都成功（或整体跳过）的生产商记录本次水位；否则保留上次水位，下次刷新会重算
+        ok = all(t["state"] in ("done", "skipped") for t in entry["tasks"].values())
+        wm = entry.get("watermark") if ok else entry.get("prev_watermark")
+        if wm is not None:
+            watermarks[sid] = wm
+        all_stat_dates.extend(r.get("stat_date") for r in (pc.get("risk_data") or []) if r.get("stat_date"))
+
+    system_cutover_date = max(all_stat_dates) if all_stat_dates else ""
+    log(f"系统切日: {system_cutover_date or '(无)'}")
+    log("正在写入缓存文件...")
+    with profile_stage("*", "publish"):
+        save_producer_full_cache({
+            "producers": producers_cache,
+            "portfolio_cumulative_stats": portfolio_cumulative_stats,
+            "allocation_by_platform": allocation_by_platform,
+            "system_cutover_date": system_cutover_date,
+            "last_updated_by": triggered_by,
+            "watermarks": watermarks,
+        })
+    return producers_cache, system_cutover_date
+
+
+def run_refresh_job(triggered_by: str = "admin", resume: bool = False, time_budget: int = None) -> dict:
+    """
+    执行（或续跑）全量刷新任务，供 refresh_producer_full_cache 调用
+    resume=True：有未完成任务则续跑；否则 cron 在今天尚未完成刷新时开始新任务，admin 直接返回
+    resume=False：放弃未完成任务，开始新任务
+    time_budget: 本次调用时间预算（秒），None 取 REFRESH_TIME_BUDGET_SECONDS，0 不限
+    """
+    from kn_producer_cache import (REFRESH_WORKERS, _append_log, flush_refresh_log, resume_refresh_log,
+                                   load_cache_meta)
+    t_start = time.time()
+    budget = REFRESH_TIME_BUDGET_SECONDS if time_budget is None else time_budget
+    deadline = t_start + budget if budget and budget > 0 else None
+    logs = []
+
+    def log(msg, ts=None):
+        _append_log(logs, msg, ts=ts)
+
+    refresh_run = None
+    profiler = None
+    try:
+        job = load_job()
+        active = job if job and job.get("status") == "running" else None
+        if resume and not active:
+            today = datetime.now().strftime("%Y-%m-%d")
+            if triggered_by != "cron" or (job and str(job.get("created_at") or "")[:10] == today):
+                meta = load_cache_meta() or {}
+                return {"ok": True, "idle": True, "pending": 0, "last_updated": meta.get("last_updated"),
+                        "system_cutover_date": meta.get("system_cutover_date"),
+                        "last_updated_by": meta.get("last_updated_by"), "logs": logs}
+
+        # 开启共享中间结果；缓存最新数据日，供 kn_revenue/kn_cashflow 等复用，避免重复查询（新任务的变更检测也在此 run 内）
+        from kn_refresh_dag import begin_run
+        refresh_run = begin_run()
+        # 性能统计：续跑时接着之前调用的累计结果
+        from kn_refresh_profile import RefreshProfiler, profile_stage
+        profiler = RefreshProfiler(_load_job_profile() if (resume and active) else None)
+        profiler.start()
+        from kn_data_utils import get_latest_data_date, set_refresh_latest_date
+        try:
+            set_refresh_latest_date(get_latest_data_date())
+        except Exception:
+            pass
+
+        src_label = "Cron 定时触发" if triggered_by == "cron" else "Admin 手动触发"
+        if resume and active:
+            resume_refresh_log()
+            job = active
+            log(f"{src_label} - 继续刷新任务 {job['job_id']}（第 {job.get('invocations', 0) + 1} 次调用，"
+                f"剩余 {_pending_tasks(job)} 个任务）")
+        else:
+            _append_log(logs, f"{src_label} - 开始刷新全量缓存...", truncate_first=True)
+            try:
+                from kn_cache_storage import _use_blob
+                log(f"缓存后端: {'Blob（跨实例共享）' if _use_blob() else '文件'}")
+            except Exception:
+                log("缓存后端: 文件")
+            with profile_stage("*", "setup"):
+                job = _new_job(triggered_by, log)
+            if not job:
+                log("错误: 无生产商数据")
+                return {"error": "无生产商数据", "logs": logs}
+        job["invocations"] = job.get("invocations", 0) + 1
+        if deadline is not None:
+            log(f"本次时间预算 {budget} 秒")
+
+        lock = threading.Lock()
+        todo = [sid for sid in job["order"]
+                if any(t["state"] == "pending" for t in job["producers"][sid]["tasks"].values())]
+        workers = max(1, min(REFRESH_WORKERS, len(todo) or 1))
+        if todo:
+            log(f"共 {len(job['order'])} 个生产商，待处理 {len(todo)} 个，开始加载风控/收益/现金流数据（并发 {workers}）...")
+
+        def _run(sid, live=False):
+            # live=True 时日志直接输出；否则缓冲 (时间, 消息)，由主线程按生产商顺序输出
+            buf = []
+
+            def plog(msg):
+                if live:
+                    log(msg)
+                else:
+                    buf.append((datetime.now().strftime("%Y-%m-%d %H:%M:%S"), msg))
+            try:
+                _run_producer(job, sid, deadline, plog, lock)
+            except Exception as e:
+                plog(f"  {sid}: 刷新失败 - {e}")
+            return buf
+
+        # 失败待重试的任务在下一轮重跑；每轮每个生产商至少完成或失败一个任务，轮数有上限
+        for _ in range(REFRESH_TASK_MAX_ATTEMPTS * len(PRODUCER_SECTIONS)):
+            todo = [sid for sid in job["order"]
+                    if any(t["state"] == "pending" for t in job["producers"][sid]["tasks"].values())]
+            if not todo or (deadline is not None and time.time() >= deadline):
+                break
+            if workers == 1:
+                for sid in todo:
+                    _run(sid, live=True)
+            else:
+                from concurrent.futures import ThreadPoolExecutor
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="refresh") as executor:
+                    futures = [executor.submit(_run, sid) for sid in todo]
+                    for fut in futures:  # 按生产商原顺序输出
+                        for ts, msg in fut.result():
+                            log(msg, ts=ts)
+
+        pending = _pending_tasks(job) - 1
+        if pending > 0 or (deadline is not None and time.time() >= deadline):
+            _save_job(job)
+            profiler.stop()
+            try:
+                _save_job_profile(profiler.to_state())
+            except Exception:
+                pass
+            log(f"本次调用用时 {time.time() - t_start:.0f} 秒，剩余 {_pending_tasks(job)} 个任务，下次调用继续")
+            if refresh_run.stats:
+                log(f"共享中间结果 - {refresh_run.summary()}")
+            return {"ok": True, "pending": _pending_tasks(job), "job_id": job["job_id"],
+                    "last_updated_by": triggered_by, "logs": logs}
+
+        failed = [f"{sid}/{sec}" for sid in job["order"]
+                  for sec, t in job["producers"][sid]["tasks"].items() if t["state"] == "failed"]
+        if failed:
+            log(f"以下任务失败，已沿用上一版缓存: {', '.join(failed)}")
+        producers_cache, system_cutover_date = _publish(job, triggered_by, log)
+        job["published"] = True
+        job["status"] = "done"
+        job["finished_at"] = datetime.now().isoformat()
+        _save_job(job)
+        _clear_staging()
+        last_updated = datetime.now().isoformat()
+        profiler.stop()
+        try:
+            from kn_refresh_profile import build_report, save_profile_report
+            report = build_report(profiler, job)
+            save_profile_report(report)
+            tot = report["totals"]
+            slowest = report["stage_totals"][0]["stage"] if report["stage_totals"] else "-"
+            log(f"性能报告: 耗时 {tot['wall']:.1f} 秒（{report['invocations']} 次调用），数据库 {tot['db']:.1f} 秒，"
+                f"查询 {tot['queries']} 条，{tot['rows']} 行，约 {tot['bytes'] / 1024:.0f} KB；最慢阶段 {slowest}")
+        except Exception as e:
+            log(f"性能报告生成失败: {e}")
+        if refresh_run.stats:
+            log(f"共享中间结果 - {refresh_run.summary()}")
+        log(f"刷新完成，共 {len(producers_cache)} 个生产商（{job['invocations']} 次调用）")
+        return {
+            "ok": True,
+            "last_updated": last_updated,
+            "system_cutover_date": system_cutover_date,
+            "last_updated_by": triggered_by,
+            "producer_count": len(producers_cache),
+            "pending": 0,
+            "logs": logs,
+        }
+    except Exception as e:
+        log(f"错误: {e}")
+        return {"error": str(e), "logs": logs}
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        flush_refresh_log()
+        try:
+            from kn_data_utils import clear_refresh_latest_date
+            clear_refresh_latest_date()
+        except Exception:
+            pass
+        if refresh_run is not None:
+            try:
+                from kn_refresh_dag import end_run
+                end_run()
+            except Exception:
+                pass
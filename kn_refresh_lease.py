@@ -0,0 +1,269 @@
+"""
+刷新单飞（single-flight）协调 - 同一份刷新在多个触发源、多个实例间只执行一次
+- 租约：Blob 模式（多实例）用 PostgreSQL 租约行 refresh_lease（name 主键，建表见 config/refresh_lease表结构说明.md，
+  运行时不建表）；本地用文件锁（leases/<name>.lock，fcntl.flock）
+  Blob 不支持条件写，不再用 Blob 对象做租约：获取为单条 INSERT ... ON CONFLICT DO UPDATE ... WHERE 已过期，
+  由数据库行锁保证同一时刻只有一个实例拿到（compare-and-swap），无写后读回的竞态窗口
+- 租约记录 owner / run_id / expires_at，持有期间后台线程按 TTL 的 1/3 续约；实例崩溃后租约过期可被接管
+- 续约 / 释放均以 run_id 为条件：租约已过期被他人接管时不覆盖对方（续约失败记 lost，停止心跳）
+- 合并（coalescing）：本进程内同名刷新正在执行时，后来的调用等待并复用同一结果；
+  其他实例持有租约时立即返回 { in_progress, coalesced, holder }，由调用方附着到进行中的刷新（轮询状态 / 下次续跑）
+- 租约不可用（表未建、数据库连不上）时记警告并退化为仅本进程单飞，刷新照常执行，结果附 lease_unavailable
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from kn_producer_cache import CACHE_DIR
+
+log = logging.getLogger("kn_refresh_lease")
+
+LEASE_DIR = os.path.join(CACHE_DIR, "leases")
+LEASE_TABLE = "refresh_lease"
+# 本实例标识：主机名 + 进程号 + 随机后缀（同一主机多进程、serverless 复用容器均可区分）
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+_flights = {}  # name -> _Flight（本进程内进行中的刷新）
+_flights_lock = threading.Lock()
+
+
+def _db_execute(sql: str, params=None, fetch: bool = False):
+    """租约表上执行单条语句并提交，返回 fetchone() 或 rowcount"""
+    from db_connect import get_connection
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        out = cur.fetchone() if fetch else cur.rowcount
+        conn.commit()
+        cur.close()
+        return out
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        conn.close()
+
+
+def _safe_name(name: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in str(name))
+
+
+def _expired(rec: dict) -> bool:
+    try:
+        return datetime.fromisoformat(rec.get("expires_at") or "") <= datetime.now()
+    except (TypeError, ValueError):
+        return True
+
+
+class Lease:
+    """已获得的租约；renew() 延长有效期，release() 释放"""
+
+    def __init__(self, name: str, ttl: int, run_id: str):
+        self.name = _safe_name(name)
+        self.ttl = ttl
+        self.run_id = run_id
+        self._acquired_at = datetime.now().isoformat()
+        self._fd = None  # 本地文件锁句柄
+        self._stop = threading.Event()
+        self._heartbeat = None
+        self.lost = False  # 续约时发现租约已被他人接管
+
+    def _record(self) -> dict:
+        now = datetime.now()
+        return {"owner": INSTANCE_ID, "run_id": self.run_id, "name": self.name,
+                "acquired_at": self._acquired_at, "expires_at": (now + timedelta(seconds=self.ttl)).isoformat()}
+
+    # ---------- 数据库租约行（Blob / 多实例） ----------
+    def _acquire_db(self):
+        """
+        返回 None 表示获得；否则返回当前持有者记录
+        行不存在或已过期时才写入（本 run 重入视为已持有）；时间均取数据库 now()，不受实例时钟偏差影响
+        """
+        row = _db_execute(f"""
+            INSERT INTO {LEASE_TABLE} (name, owner, run_id, acquired_at, expires_at, released)
+            VALUES (%s, %s, %s, now(), now() + %s * interval '1 second', FALSE)
+            ON CONFLICT (name) DO UPDATE
+                SET owner = EXCLUDED.owner, run_id = EXCLUDED.run_id, acquired_at = EXCLUDED.acquired_at,
+                    expires_at = EXCLUDED.expires_at, released = FALSE
+                WHERE {LEASE_TABLE}.expires_at <= now() OR {LEASE_TABLE}.run_id = EXCLUDED.run_id
+            RETURNING run_id
+        """, (self.name, INSTANCE_ID, self.run_id, self.ttl), fetch=True)
+        if row and row[0] == self.run_id:
+            return None
+        cur = _db_execute(
+            f"SELECT owner, run_id, acquired_at, expires_at FROM {LEASE_TABLE} WHERE name = %s",
+            (self.name,), fetch=True)
+        if not cur:
+            return {"owner": "unknown"}
+        return {"owner": cur[0], "run_id": cur[1],
+                "acquired_at": cur[2].isoformat() if cur[2] else None,
+                "expires_at": cur[3].isoformat() if cur[3] else None}
+
+    def _renew_db(self) -> bool:
+        n = _db_execute(f"""
+            UPDATE {LEASE_TABLE} SET expires_at = now() + %s * interval '1 second'
+            WHERE name = %s AND run_id = %s AND NOT released
+        """, (self.ttl, self.name, self.run_id))
+        return bool(n)
+
+    def _release_db(self):
+        _db_execute(f"""
+            UPDATE {LEASE_TABLE} SET expires_at = now(), released = TRUE
+            WHERE name = %s AND run_id = %s
+        """, (self.name, self.run_id))
+
+    # ---------- 本地文件锁 ----------
+    def _acquire_file(self):
+        os.makedirs(LEASE_DIR, exist_ok=True)
+        info_path = self._info_path()
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+        if fcntl is not None:
+            fd = os.open(os.path.join(LEASE_DIR, f"{self.name}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return self._read_file_info(info_path) or {"owner": "unknown"}
+            self._fd = fd
+        else:
+            # 无 fcntl（Windows）：退化为带过期时间的租约文件
+            cur = self._read_file_info(info_path)
+            if cur and cur.get("owner") != INSTANCE_ID and not _expired(cur):
+                return cur
+        from kn_producer_cache import _write_json_atomic
+        _write_json_atomic(info_path, self._record())
+        return None
+
+    @staticmethod
+    def _read_file_info(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def _info_path(self) -> str:
+        return os.path.join(LEASE_DIR, f"{self.name}.json")
+
+    def _owns_file(self) -> bool:
+        """本地租约信息文件仍属于本 run（无 fcntl 时可能已过期被他人接管）"""
+        cur = self._read_file_info(self._info_path()) or {}
+        return cur.get("run_id") == self.run_id
+
+    def acquire(self):
+        """尝试获得租约：返回 None 表示成功，否则返回持有者记录 { owner, run_id, expires_at }"""
+        from kn_cache_storage import _use_blob
+        holder = self._acquire_db() if _use_blob() else self._acquire_file()
+        if holder is None:
+            self._heartbeat = threading.Thread(target=self._renew_loop, daemon=True)
+            self._heartbeat.start()
+        return holder
+
+    def renew(self) -> bool:
+        """续约；租约已不属于本 run 时返回 False（不覆盖新持有者）"""
+        from kn_cache_storage import _use_blob
+        if _use_blob():
+            ok = self._renew_db()
+        else:
+            ok = self._owns_file()
+            if ok:
+                from kn_producer_cache import _write_json_atomic
+                _write_json_atomic(self._info_path(), self._record())
+        if not ok:
+            self.lost = True
+            log.warning("[租约] %s 续约失败：租约已被其他实例接管（run_id=%s）", self.name, self.run_id)
+        return ok
+
+    def _renew_loop(self):
+        while not self._stop.wait(max(1, self.ttl / 3)):
+            try:
+                if not self.renew():
+                    return
+            except Exception as e:
+                log.warning("[租约] %s 续约异常: %s", self.name, e)
+
+    def release(self):
+        self._stop.set()
+        try:
+            from kn_cache_storage import _use_blob
+            if _use_blob():
+                self._release_db()
+            elif self._owns_file():
+                from kn_producer_cache import _write_json_atomic
+                released = dict(self._record(), expires_at=datetime.now().isoformat(), released=True)
+                _write_json_atomic(self._info_path(), released)
+        except Exception as e:
+            log.warning("[租约] %s 释放失败（到期后自动失效）: %s", self.name, e)
+        if self._fd is not None:
+            try:
+                import fcntl
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            except Exception:
+                pass
+            os.close(self._fd)
+            self._fd = None
+
+
+class _Flight:
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.done = threading.Event()
+        self.result = None
+
+
+def single_flight(name: str, fn, ttl: int = 600):
+    """
+    以租约 name 单飞执行 fn()，返回 fn 的结果（dict）
+    - 本进程内已有同名执行：等待其完成，返回同一结果（附 coalesced=True）
+    - 其他实例/进程持有租约：不执行，返回 { ok, in_progress, coalesced, holder }
+    - 获取租约出错（租约表不存在、数据库不可达）：记警告，仅按本进程单飞执行，结果附 lease_unavailable
+    fn() 自身的异常照常抛出
+    """
+    with _flights_lock:
+        flight = _flights.get(name)
+        owner = flight is None
+        if owner:
+            flight = _Flight(datetime.now().strftime("%Y%m%d%H%M%S") + "_" + uuid.uuid4().hex[:8])
+            _flights[name] = flight
+    if not owner:
+        flight.done.wait()
+        return dict(flight.result or {}, coalesced=True)
+
+    lease = Lease(name, ttl, flight.run_id)
+    lease_error = None
+    try:
+        try:
+            holder = lease.acquire()
+        except Exception as e:
+            log.warning("[租约] %s 获取失败，仅按本进程单飞执行: %s", name, e)
+            lease, holder, lease_error = None, None, str(e)
+        if holder is not None:
+            flight.result = {"ok": True, "in_progress": True, "coalesced": True,
+                             "holder": {k: holder.get(k) for k in ("owner", "run_id", "acquired_at", "expires_at")}}
+            return flight.result
+        try:
+            flight.result = fn()
+        finally:
+            if lease is not None:
+                lease.release()
+        if lease_error and isinstance(flight.result, dict):
+            flight.result = dict(flight.result, lease_unavailable=lease_error)
+        return flight.result
+    except Exception as e:
+        flight.result = {"error": str(e)}
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(name, None)
+        flight.done.set()
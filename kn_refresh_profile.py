@@ -0,0 +1,222 @@
+"""
+全量刷新性能分析 - 按 (生产商, 阶段) 统计墙钟时间、数据库时间、查询数、行数、字节数，并记录每条 SQL
+- 通过 db_connect.add_query_observer 收集刷新期间的查询，按执行线程当前所在阶段归属（生产商任务在线程池中并发）
+- 共享中间结果（kn_refresh_dag）的计算单独记为 ("*", "dag:<阶段>")，不计入触发它的生产商
+- 报告 refresh_profile.json 与 cache_meta.json 同目录（Blob: rt_risk/refresh_profile.json），上一份另存为 refresh_profile_prev.json 供对比
+- 可续跑刷新跨多次调用：未完成时的累计结果保存在 refresh_job/profile.json，发布时生成最终报告
+"""
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+from kn_producer_cache import CACHE_DIR
+
+PROFILE_TOP_N = int(os.getenv("REFRESH_PROFILE_TOP_N", "20") or 20)
+PROFILE_FILE = os.path.join(CACHE_DIR, "refresh_profile.json")
+PROFILE_PREV_FILE = os.path.join(CACHE_DIR, "refresh_profile_prev.json")
+_MAX_SQL_LEN = 400
+_MAX_SQL_KEYS = 500  # 按 SQL 汇总时最多保留的语句数（按耗时）
+_SHARED = "*"  # 非单个生产商的阶段（准备、共享中间结果、投资组合、发布）
+
+_current = None
+
+
+def current_profiler():
+    """当前刷新的 RefreshProfiler，无则 None"""
+    return _current
+
+
+def profile_stage(producer: str, name: str):
+    """有活动 profiler 时返回其 stage 上下文，否则空上下文"""
+    prof = _current
+    return prof.stage(producer, name) if prof is not None else nullcontext()
+
+
+def _normalize_sql(sql: str) -> str:
+    return re.sub(r"\s+", " ", sql or "").strip()[:_MAX_SQL_LEN]
+
+
+def _empty_stat():
+    return {"wall": 0.0, "db": 0.0, "queries": 0, "rows": 0, "bytes": 0}
+
+
+class RefreshProfiler:
+    """一次刷新任务的性能统计；state 为上次调用保存的累计结果（续跑时传入）"""
+
+    def __init__(self, state: dict = None):
+        state = state or {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._loose = []  # 不在任何阶段内的查询
+        self._t0 = None
+        self.wall_seconds = float(state.get("wall_seconds") or 0)
+        self.invocations = int(state.get("invocations") or 0)
+        self.stages = {(s["producer"], s["stage"]): {k: s[k] for k in _empty_stat()}
+                       for s in state.get("stages") or []}
+        self.top_queries = list(state.get("top_queries") or [])
+        self.by_sql = {q["sql"]: dict(q) for q in state.get("by_sql") or []}
+
+    def start(self):
+        global _current
+        from db_connect import add_query_observer
+        _current = self
+        self._t0 = time.perf_counter()
+        self.invocations += 1
+        add_query_observer(self._on_query, needs_caller=True)
+
+    def stop(self):
+        """结束本次调用的统计（可重复调用）"""
+        global _current
+        if self._t0 is None:
+            return
+        from db_connect import remove_query_observer
+        remove_query_observer(self._on_query)
+        self.wall_seconds += time.perf_counter() - self._t0
+        self._t0 = None
+        if _current is self:
+            _current = None
+        with self._lock:
+            loose, self._loose = self._loose, []
+        if loose:
+            self._add(_SHARED, "other", 0.0, loose)
+
+    def _on_query(self, rec):
+        ctx = getattr(self._local, "ctx", None)
+        if ctx is not None:
+            ctx.append(rec)
+        else:
+            with self._lock:
+                self._loose.append(rec)
+
+    @contextmanager
+    def stage(self, producer: str, name: str):
+        """统计一个阶段：墙钟时间 + 本线程在阶段内执行的查询（嵌套阶段的查询只计入最内层）"""
+        outer = getattr(self._local, "ctx", None)
+        recs = []
+        self._local.ctx = recs
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - t0
+            self._local.ctx = outer
+            self._add(producer, name, wall, recs)
+
+    def _add(self, producer, name, wall, recs):
+        with self._lock:
+            st = self.stages.setdefault((producer, name), _empty_stat())
+            st["wall"] += wall
+            for r in recs:
+                st["db"] += r["seconds"]
+                st["queries"] += 1
+                st["rows"] += r["rows"]
+                st["bytes"] += r["bytes"]
+                sql = _normalize_sql(r["sql"])
+                agg = self.by_sql.setdefault(sql, {"sql": sql, "caller": r.get("caller"), "count": 0, "seconds": 0.0,
+                                                   "max_seconds": 0.0, "rows": 0, "bytes": 0})
+                agg["count"] += 1
+                agg["seconds"] += r["seconds"]
+                agg["max_seconds"] = max(agg["max_seconds"], r["seconds"])
+                agg["rows"] += r["rows"]
+                agg["bytes"] += r["bytes"]
+                if len(self.top_queries) < PROFILE_TOP_N or r["seconds"] > self.top_queries[-1]["seconds"]:
+                    self.top_queries.append({"sql": sql, "caller": r.get("caller"), "producer": producer, "stage": name,
+                                             "seconds": r["seconds"], "rows": r["rows"], "bytes": r["bytes"]})
+                    self.top_queries.sort(key=lambda q: -q["seconds"])
+                    del self.top_queries[PROFILE_TOP_N:]
+
+    def to_state(self) -> dict:
+        """可 JSON 序列化的累计结果（续跑时保存，发布时生成报告）"""
+        with self._lock:
+            by_sql = sorted(self.by_sql.values(), key=lambda q: -q["seconds"])[:_MAX_SQL_KEYS]
+            return {
+                "wall_seconds": round(self.wall_seconds, 3),
+                "invocations": self.invocations,
+                "stages": [dict(producer=p, stage=n, **{k: (round(v, 4) if isinstance(v, float) else v)
+                                                          for k, v in st.items()})
+                           for (p, n), st in self.stages.items()],
+                "top_queries": list(self.top_queries),
+                "by_sql": by_sql,
+            }
+
+
+def build_report(prof: RefreshProfiler, job: dict) -> dict:
+    """
+    生成刷新性能报告：
+    { job_id, triggered_by, started_at, finished_at, invocations, totals, stage_totals, producers,
+      stages, top_queries, top_sql }
+    """
+    state = prof.to_state()
+    totals = _empty_stat()
+    stage_totals = {}
+    producers = {}
+    for s in state["stages"]:
+        for k in ("db", "queries", "rows", "bytes"):
+            totals[k] += s[k]
+        agg = stage_totals.setdefault(s["stage"], dict(_empty_stat(), stage=s["stage"], count=0))
+        agg["count"] += 1
+        if s["producer"] != _SHARED:
+            p = producers.setdefault(s["producer"], dict(_empty_stat(), producer=s["producer"]))
+            for k in _empty_stat():
+                p[k] += s[k]
+        for k in _empty_stat():
+            agg[k] += s[k]
+    totals["wall"] = state["wall_seconds"]
+    return {
+        "job_id": job.get("job_id"),
+        "triggered_by": job.get("triggered_by"),
+        "started_at": job.get("created_at"),
+        "finished_at": datetime.now().isoformat(),
+        "invocations": state["invocations"],
+        "totals": totals,
+        "stage_totals": sorted(stage_totals.values(), key=lambda s: -s["wall"]),
+        "producers": sorted(producers.values(), key=lambda s: -s["wall"]),
+        "stages": sorted(state["stages"], key=lambda s: -s["wall"]),
+        "top_queries": state["top_queries"][:PROFILE_TOP_N],
+        "top_sql": state["by_sql"][:PROFILE_TOP_N],
+    }
+
+
+def compare_reports(report: dict, prev: dict) -> dict:
+    """
+    本次与上一次报告对比：{ totals: {k: {cur, prev, delta_pct}}, stages: [{stage, cur, prev, delta_pct}] }
+    delta_pct 为相对上次的变化百分比（上次为 0 时为 None）
+    """
+    if not report or not prev:
+        return {}
+
+    def _delta(cur, old):
+        return {"cur": cur, "prev": old, "delta_pct": ((cur - old) / old * 100) if old else None}
+
+    totals = {k: _delta((report.get("totals") or {}).get(k, 0), (prev.get("totals") or {}).get(k, 0))
+              for k in _empty_stat()}
+    prev_stages = {s["stage"]: s for s in prev.get("stage_totals") or []}
+    stages = []
+    for s in report.get("stage_totals") or []:
+        old = prev_stages.get(s["stage"]) or {}
+        stages.append(dict(_delta(s["wall"], old.get("wall", 0)), stage=s["stage"],
+                           db=s["db"], prev_db=old.get("db", 0)))
+    return {"prev_job_id": prev.get("job_id"), "prev_finished_at": prev.get("finished_at"),
+            "totals": totals, "stages": stages}
+
+
+def save_profile_report(report: dict):
+    """写入本次报告，原报告另存为上一份（Blob + 文件）"""
+    from kn_cache_storage import BLOB_PATH_PROFILE, BLOB_PATH_PROFILE_PREV
+    from kn_refresh_job import _write_json
+    prev = load_profile_report()
+    if prev:
+        _write_json(BLOB_PATH_PROFILE_PREV, PROFILE_PREV_FILE, prev)
+    _write_json(BLOB_PATH_PROFILE, PROFILE_FILE, report)
+
+
+def load_profile_report(previous: bool = False):
+    """读取最近一次（previous=True 时为上一次）刷新性能报告，无则 None"""
+    from kn_cache_storage import BLOB_PATH_PROFILE, BLOB_PATH_PROFILE_PREV
+    from kn_refresh_job import _read_json
+    if previous:
+        return _read_json(BLOB_PATH_PROFILE_PREV, PROFILE_PREV_FILE)
+    return _read_json(BLOB_PATH_PROFILE, PROFILE_FILE)
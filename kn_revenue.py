@@ -8,11 +8,31 @@ import logging
 from datetime import datetime
 from decimal import Decimal
 
-from kn_data_utils import get_calc_table
+from kn_data_utils import get_calc_table, list_calc_tables, table_exists
 
 log = logging.getLogger("kn_revenue")
 
 
+def _shared_stat_dates(spv_id: str):
+    """全量刷新中该 SPV 的 [(stat_date, 分区表), ...]（降序），非刷新时 None"""
+    try:
+        from kn_refresh_dag import current_run
+        run = current_run()
+        return run.get("spv_stat_dates", spv_id) if run is not None else None
+    except Exception:
+        return None
+
+
+def _shared_schedule_by_month(spv_id: str):
+    """全量刷新中该 SPV 的还款计划月汇总（与现金流共用），非刷新时 None"""
+    try:
+        from kn_refresh_dag import current_run
+        run = current_run()
+        return run.get("schedule_by_month", spv_id) if run is not None else None
+    except Exception:
+        return None
+
+
 def _get_months_with_data(spv_id: str = "kn"):
     """获取有数据的月份列表（YYYY-MM），按时间升序。优化：批量查 information_schema"""
     try:
@@ -47,15 +67,15 @@ def _get_months_with_data(spv_id: str = "kn"):
                 months.add(r[0])
     except Exception:
         pass
-    # 从 calc_overdue 表：批量获取存在的表名，再只查存在的表
-    tables_to_check = [get_calc_table(y, m) for y in [2024, 2025, 2026, 2027] for m in range(1, 13)]
-    placeholders = ",".join(["%s"] * len(tables_to_check))
+    # 从 calc_overdue 表：全量刷新中复用 spv_stat_dates 阶段；否则批量获取存在的表名，再只查存在的表
+    stat_dates = _shared_stat_dates(spv_id)
+    if stat_dates is not None:
+        months.update(d[:7] for d, _ in stat_dates)
+        cur.close()
+        conn.close()
+        return sorted(months) if months else []
     try:
-        cur.execute(
-            f"SELECT table_name FROM information_schema.tables WHERE table_schema='public' AND table_name IN ({placeholders})",
-            tables_to_check
-        )
-        existing_tables = [r[0] for r in cur.fetchall() if r and r[0]]
+        existing_tables = list_calc_tables(cur)
         for tbl in existing_tables:
             try:
                 cur.execute(
@@ -153,26 +173,32 @@ def compute_revenue_data(spv_id: str = "kn"):
         log.warning("[收益] 回收汇总失败: %s", e)
 
     expected_due_by_month = {}
-    try:
-        cur.execute("""
-            WITH due_by_month AS (
-                SELECT to_char((elem->>'due_date')::date, 'YYYY-MM') AS m,
-                    SUM((COALESCE(elem->>'principal', elem->>'principal_due', '0'))::numeric +
-                        (COALESCE(elem->>'interest', elem->>'interest_due', '0'))::numeric) AS due_amt
-                FROM raw_loan rl
-                CROSS JOIN LATERAL jsonb_array_elements(COALESCE(rl.repayment_schedule->'schedule', '[]'::jsonb)) elem
-                WHERE rl.spv_id = %s AND elem->>'due_date' IS NOT NULL
-                GROUP BY 1
-            )
-            SELECT m, COALESCE(SUM(due_amt), 0) FROM due_by_month GROUP BY m
-        """, (spv_id,))
-        for r in cur.fetchall():
-            if r[0]:
-                expected_due_by_month[r[0]] = float(r[1] or 0)
-    except Exception as e:
-        log.warning("[收益] 应回收汇总失败: %s", e)
+    shared_schedule = _shared_schedule_by_month(spv_id)
+    if shared_schedule is not None:
+        # 全量刷新中复用 schedule_by_month 阶段（与现金流共用一次还款计划展开）
+        expected_due_by_month = {m: v["due_all"] for m, v in shared_schedule.items()}
+    else:
+        try:
+            cur.execute("""
+                WITH due_by_month AS (
+                    SELECT to_char((elem->>'due_date')::date, 'YYYY-MM') AS m,
+                        SUM((COALESCE(elem->>'principal', elem->>'principal_due', '0'))::numeric +
+                            (COALESCE(elem->>'interest', elem->>'interest_due', '0'))::numeric) AS due_amt
+                    FROM raw_loan rl
+                    CROSS JOIN LATERAL jsonb_array_elements(COALESCE(rl.repayment_schedule->'schedule', '[]'::jsonb)) elem
+                    WHERE rl.spv_id = %s AND elem->>'due_date' IS NOT NULL
+                    GROUP BY 1
+                )
+                SELECT m, COALESCE(SUM(due_amt), 0) FROM due_by_month GROUP BY m
+            """, (spv_id,))
+            for r in cur.fetchall():
+                if r[0]:
+                    expected_due_by_month[r[0]] = float(r[1] or 0)
+        except Exception as e:
+            log.warning("[收益] 应回收汇总失败: %s", e)
 
     log.info("[收益] 逐月计算在贷余额与指标...")
+    month_end_dates = _shared_stat_dates(spv_id)
     result = []
     for i, month_str in enumerate(months):
         y, m = int(month_str[:4]), int(month_str[5:7])
@@ -196,25 +222,27 @@ def compute_revenue_data(spv_id: str = "kn"):
         calc_tbl = get_calc_table(y, m)
         outstanding_balance = 0
         try:
-            cur.execute(
-                "SELECT 1 FROM information_schema.tables WHERE table_schema='public' AND table_name = %s",
-                (calc_tbl,)
-            )
-            if cur.fetchone():
+            if month_end_dates is not None:
+                # 全量刷新中：月末快照日直接取自 spv_stat_dates 阶段
+                d = next((d for d, t in month_end_dates if t == calc_tbl and d <= last_day), None)
+                max_dt = (d,) if d else None
+            elif table_exists(cur, calc_tbl):
                 cur.execute(f"""
                     SELECT MAX(stat_date)::date FROM {calc_tbl}
                     WHERE spv_id = %s AND stat_date::date <= %s::date
                 """, (spv_id, last_day))
                 max_dt = cur.fetchone()
-                if max_dt and max_dt[0]:
-                    cur.execute(f"""
-                        SELECT COALESCE(SUM(outstanding_principal), 0)
-                        FROM {calc_tbl}
-                        WHERE spv_id = %s AND loan_status IN (1, 2) AND stat_date::date = %s
-                    """, (spv_id, max_dt[0]))
-                    row = cur.fetchone()
-                    if row:
-                        outstanding_balance = float(row[0] or 0)
+            else:
+                max_dt = None
+            if max_dt and max_dt[0]:
+                cur.execute(f"""
+                    SELECT COALESCE(SUM(outstanding_principal), 0)
+                    FROM {calc_tbl}
+                    WHERE spv_id = %s AND loan_status IN (1, 2) AND stat_date::date = %s
+                """, (spv_id, max_dt[0]))
+                row = cur.fetchone()
+                if row:
+                    outstanding_balance = float(row[0] or 0)
         except Exception:
             pass
 
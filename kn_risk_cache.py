@@ -1,6 +1,7 @@
 """
 生产商风控数据统一缓存 - 核心指标、DPD、Vintage 等一次性缓存
 打开页面时直接读缓存，无需访问数据库；用户点击刷新时从 DB 拉取并更新缓存
+仅保存本币一份；金额字段见 MONEY_FIELDS，USD 在展示/导出时用 risk_row_to_usd 按需换算
 """
 import json
 import logging
@@ -12,10 +13,22 @@ log = logging.getLogger("kn_risk_cache")
 BASE_DIR = os.path.dirname(__file__)
 # Vercel/AWS Lambda 等 serverless 仅 /tmp 可写，与 kn_producer_cache 保持一致
 _IS_SERVERLESS = bool(os.getenv("VERCEL") or os.getenv("AWS_LAMBDA_FUNCTION_NAME") or os.getenv("LAMBDA_TASK_ROOT"))
-_CACHE_BASE = os.path.join("/tmp", "rt_risk_cache") if _IS_SERVERLESS else os.path.join(BASE_DIR, "config", "cache")
+_CACHE_BASE = os.getenv("RT_RISK_CACHE_DIR") or (
+    os.path.join("/tmp", "rt_risk_cache") if _IS_SERVERLESS else os.path.join(BASE_DIR, "config", "cache"))
 CACHE_DIR = _CACHE_BASE
 CACHE_FILE_PREFIX = "risk_cache_"
 
+# 金额字段清单：顶层字段 + 嵌套列表中的字段，换算 USD 时只处理这些列
+MONEY_FIELDS = {
+    "": ("cumulative_disbursement", "cumulative_extension", "current_balance", "cash", "m0_balance",
+         "m0_accrued_interest", "all_accrued_interest", "all_remaining_interest"),
+    "dpd_distribution": ("balance",),
+    "vintage_data": ("disbursement_amount", "current_balance"),
+    "collection_report": ("due_amount", "d0_into_collection", "d1_into_collection", "d3_into_collection",
+                          "d7_into_collection", "d30_into_collection", "d60_into_collection", "d90_into_collection",
+                          "d1_recovery", "d3_recovery", "d7_recovery", "d30_recovery", "d60_recovery", "d90_recovery"),
+}
+
 
 def _cache_path(spv_id: str) -> str:
     os.makedirs(CACHE_DIR, exist_ok=True)
@@ -31,10 +44,42 @@ def _to_usd(val, rate):
         return val
 
 
+def risk_row_to_usd(row: dict, rate: float) -> dict:
+    """
+    返回单行 risk_data 的 USD 视图：仅复制并换算 MONEY_FIELDS 中的列，其余字段与原行共享引用（不 deepcopy）
+    """
+    if not isinstance(row, dict):
+        return row
+    out = dict(row)
+    out.pop("_usd", None)
+    for k in MONEY_FIELDS[""]:
+        if k in out:
+            out[k] = _to_usd(out[k], rate)
+    for list_key, keys in MONEY_FIELDS.items():
+        items = out.get(list_key) if list_key else None
+        if not items:
+            continue
+        converted = []
+        for item in items:
+            if isinstance(item, dict):
+                item = dict(item)
+                for k in keys:
+                    if k in item:
+                        item[k] = _to_usd(item[k], rate)
+            converted.append(item)
+        out[list_key] = converted
+    return out
+
+
+def risk_data_to_usd(risk_data: list, rate: float) -> list:
+    """整份 risk_data 的 USD 视图（导出/API 需要时调用）"""
+    return [risk_row_to_usd(r, rate) for r in (risk_data or [])]
+
+
 def load_risk_cache(spv_id: str):
     """
-    从缓存加载 risk_data（含 local currency 如 MXN 和 USD 两部分）
-    返回: (risk_data_merged, last_updated)，每行含 _usd 子对象
+    从缓存加载 risk_data（本币）
+    返回: (risk_data, last_updated)；USD 由调用方按需用 risk_row_to_usd 换算
     """
     path = _cache_path(spv_id)
     if not os.path.exists(path):
@@ -43,22 +88,17 @@ def load_risk_cache(spv_id: str):
         with open(path, "r", encoding="utf-8") as f:
             data = json.load(f)
         local_data = data.get("risk_data", [])
-        usd_data = data.get("risk_data_usd", [])
         if not local_data:
             return None, data.get("last_updated")
-        if usd_data and len(usd_data) == len(local_data):
-            for i, row in enumerate(local_data):
-                row["_usd"] = usd_data[i] if i < len(usd_data) else {}
-        else:
-            for row in local_data:
-                row["_usd"] = {}
+        for row in local_data:
+            row.pop("_usd", None)  # 旧版缓存中的 USD 副本
         return local_data, data.get("last_updated")
     except Exception:
         return None, None
 
 
-def save_risk_cache(spv_id: str, risk_data_local: list, risk_data_usd: list, currency: str = "USD", exchange_rate: float = 1):
-    """保存 local currency（如 MXN）和 USD 两部分到缓存"""
+def save_risk_cache(spv_id: str, risk_data_local: list, currency: str = "USD", exchange_rate: float = 1):
+    """保存本币 risk_data 到缓存，附金额字段清单供换算"""
     path = _cache_path(spv_id)
     os.makedirs(CACHE_DIR, exist_ok=True)
     with open(path, "w", encoding="utf-8") as f:
@@ -67,14 +107,14 @@ def save_risk_cache(spv_id: str, risk_data_local: list, risk_data_usd: list, cur
             "currency": currency,
             "exchange_rate": exchange_rate,
             "last_updated": datetime.now().isoformat(),
+            "money_fields": {k or "_row": list(v) for k, v in MONEY_FIELDS.items()},
             "risk_data": risk_data_local,
-            "risk_data_usd": risk_data_usd,
         }, f, ensure_ascii=False, indent=2)
 
 
 def refresh_risk_cache(spv_id: str, exchange_rate: float = 1, currency: str = "USD", log_fn=None):
     """
-    从数据库计算 risk_data，同时保存 local currency（如 MXN）和 USD 两部分
+    从数据库计算 risk_data，仅保存本币一份（USD 读取时换算）
     返回: { "ok": True, "risk_data": [...], "last_updated": "..." } 或 { "error": "..." }
     """
     def _log(msg):
@@ -84,8 +124,10 @@ def refresh_risk_cache(spv_id: str, exchange_rate: float = 1, currency: str = "U
     _log(f"开始刷新 spv_id={spv_id}")
     try:
         from kn_risk_query import query_kn_core_metrics, get_available_stat_dates
-        from kn_vintage import compute_vintage_data
-        from copy import deepcopy
+        from kn_vintage import (
+            compute_vintage_batch, load_vintage_cache_entries, load_vintage_triangle, refresh_vintage_triangle,
+            save_vintage_cache_entries,
+        )
     except ImportError as e:
         log.warning("[风控缓存] 模块导入失败: %s", e)
         return {"error": f"模块导入失败: {e}"}
@@ -100,6 +142,34 @@ def refresh_risk_cache(spv_id: str, exchange_rate: float = 1, currency: str = "U
     if not dates:
         dates = ["2026-02-25"]
 
+    # 历史 MOB 三角：只追加缺失 / 最新月份的对角线，供各日期 vintage_data 的 mobN_rate 使用
+    try:
+        tri = refresh_vintage_triangle(spv_id, log_fn=log_fn)
+        triangle = tri.get("triangle") if tri.get("ok") else load_vintage_triangle(spv_id)
+        if tri.get("error"):
+            _log(tri["error"])
+    except Exception as e:
+        _log(f"Vintage 三角刷新失败: {e}")
+        triangle = None
+    triangle = triangle or {}
+
+    # vintage_data：非最新日期复用按日期缓存的结果，最新日期与缺失日期一次批量计算（共用 cohort 放款汇总）
+    try:
+        cached = load_vintage_cache_entries(spv_id)
+    except Exception:
+        cached = {}
+    keys = [str(d)[:10] for d in dates]
+    vintage_by_date = {k: cached[k] for k in keys[1:] if isinstance(cached.get(k), list)}
+    todo = [k for k in keys if k not in vintage_by_date]
+    _log(f"Vintage 计算 {len(todo)} 个日期，复用缓存 {len(vintage_by_date)} 个")
+    try:
+        fresh = {k: v for k, v in compute_vintage_batch(spv_id, todo, triangle).items() if isinstance(v, list)}
+        if fresh:
+            save_vintage_cache_entries(spv_id, fresh)
+        vintage_by_date.update(fresh)
+    except Exception as e:
+        _log(f"Vintage 计算失败: {e}")
+
     risk_data_local = []
     last_error = None
     try:
@@ -109,21 +179,13 @@ def refresh_risk_cache(spv_id: str, exchange_rate: float = 1, currency: str = "U
             if "error" in row:
                 last_error = row.get("error", "未知错误")
                 continue
-            try:
-                vintage = compute_vintage_data(spv_id, d)
-                row["vintage_data"] = vintage if isinstance(vintage, list) else []
-            except Exception as e:
-                row["vintage_data"] = []
+            row["vintage_data"] = vintage_by_date.get(str(d)[:10], [])
             risk_data_local.append(row)
 
         if not risk_data_local:
             row = query_kn_core_metrics(stat_date=dates[0], spv_id=spv_id)
             if "error" not in row:
-                try:
-                    vintage = compute_vintage_data(spv_id, dates[0])
-                    row["vintage_data"] = vintage if isinstance(vintage, list) else []
-                except Exception:
-                    row["vintage_data"] = []
+                row["vintage_data"] = vintage_by_date.get(keys[0], [])
                 risk_data_local = [row]
             else:
                 last_error = row.get("error", "未知错误")
@@ -134,33 +196,16 @@ def refresh_risk_cache(spv_id: str, exchange_rate: float = 1, currency: str = "U
         return {"error": last_error or f"无可用数据 (spv_id={spv_id})"}
 
     rate = exchange_rate or 1
-    risk_data_usd = []
-    for row in risk_data_local:
-        r = deepcopy(row)
-        r["cumulative_disbursement"] = _to_usd(r.get("cumulative_disbursement"), rate)
-        r["cumulative_extension"] = _to_usd(r.get("cumulative_extension"), rate)
-        r["current_balance"] = _to_usd(r.get("current_balance"), rate)
-        r["cash"] = _to_usd(r.get("cash"), rate)
-        r["m0_balance"] = _to_usd(r.get("m0_balance"), rate)
-        r["m0_accrued_interest"] = _to_usd(r.get("m0_accrued_interest"), rate)
-        r["all_accrued_interest"] = _to_usd(r.get("all_accrued_interest"), rate)
-        r["all_remaining_interest"] = _to_usd(r.get("all_remaining_interest"), rate)
-        for d in r.get("dpd_distribution", []):
-            d["balance"] = _to_usd(d.get("balance"), rate)
-        for v in r.get("vintage_data", []):
-            for k in ("disbursement_amount", "current_balance"):
-                if k in v:
-                    v[k] = _to_usd(v[k], rate)
-        for c in r.get("collection_report", []):
-            for k in ("due_amount", "d0_into_collection", "d1_into_collection", "d3_into_collection",
-                      "d7_into_collection", "d30_into_collection", "d60_into_collection", "d90_into_collection",
-                      "d1_recovery", "d3_recovery", "d7_recovery", "d30_recovery", "d60_recovery", "d90_recovery"):
-                if k in c:
-                    c[k] = _to_usd(c[k], rate)
-        risk_data_usd.append(r)
-
     _log(f"保存缓存，共 {len(risk_data_local)} 条")
-    save_risk_cache(spv_id, risk_data_local, risk_data_usd, currency, rate)
+    save_risk_cache(spv_id, risk_data_local, currency, rate)
+    # 月末迁移矩阵：已完结期间复用缓存，只重算最新一期
+    try:
+        from kn_roll_rate import refresh_roll_rates
+        rr = refresh_roll_rates(spv_id, log_fn=log_fn)
+        if rr.get("error"):
+            _log(rr["error"])
+    except Exception as e:
+        _log(f"迁移矩阵刷新失败: {e}")
     return {
         "ok": True,
         "risk_data": risk_data_local,
@@ -4,7 +4,7 @@ spv_id=kn，stat_date 按日筛选
 """
 import logging
 
-from kn_data_utils import get_calc_table
+from kn_data_utils import get_calc_table, list_calc_tables, table_exists
 
 log = logging.getLogger("kn_risk_query")
 
@@ -185,34 +185,38 @@ def get_available_stat_dates(spv_id: str = "kn", limit: int = 30):
     优化：先批量获取存在的表名，再只对存在的表查 stat_date，减少 information_schema 查询
     返回: [ "2026-02-25", "2026-02-24", ... ] 或 []
     """
+    dates = None
     try:
-        from db_connect import get_connection
-        conn = get_connection()
+        from kn_refresh_dag import current_run
+        run = current_run()
+        if run is not None:
+            # 全量刷新中复用 spv_stat_dates 阶段（现金流/收益也用同一结果）
+            dates = [d for d, _ in run.get("spv_stat_dates", spv_id)]
     except Exception:
-        return []
-    cur = conn.cursor()
-    # 一次查询获取所有 calc_overdue 表名
-    tables_to_check = [f"calc_overdue_y{y}m{m:02d}" for y in [2024, 2025, 2026, 2027] for m in range(1, 13)]
-    placeholders = ",".join(["%s"] * len(tables_to_check))
-    cur.execute(
-        f"SELECT table_name FROM information_schema.tables WHERE table_schema='public' AND table_name IN ({placeholders})",
-        tables_to_check
-    )
-    existing_tables = [r[0] for r in cur.fetchall() if r and r[0]]
-    dates = []
-    for table in existing_tables:
+        dates = None
+    if dates is None:
         try:
-            cur.execute(
-                f"SELECT DISTINCT stat_date::text FROM {table} WHERE spv_id = %s ORDER BY stat_date DESC LIMIT %s",
-                (spv_id, limit)
-            )
-            for r in cur.fetchall():
-                if r and r[0]:
-                    dates.append(r[0][:10])
+            from db_connect import get_connection
+            conn = get_connection()
         except Exception:
-            continue
-    cur.close()
-    conn.close()
+            return []
+        cur = conn.cursor()
+        # 一次查询获取所有 calc_overdue 表名
+        existing_tables = list_calc_tables(cur)
+        dates = []
+        for table in existing_tables:
+            try:
+                cur.execute(
+                    f"SELECT DISTINCT stat_date::text FROM {table} WHERE spv_id = %s ORDER BY stat_date DESC LIMIT %s",
+                    (spv_id, limit)
+                )
+                for r in cur.fetchall():
+                    if r and r[0]:
+                        dates.append(r[0][:10])
+            except Exception:
+                continue
+        cur.close()
+        conn.close()
     # 去重并排序
     seen = set()
     out = []
@@ -264,11 +268,7 @@ def query_kn_core_metrics(stat_date: str, spv_id: str = "kn"):
     cur = conn.cursor()
 
     # 检查表是否存在
-    cur.execute(
-        "SELECT 1 FROM information_schema.tables WHERE table_schema='public' AND table_name = %s",
-        (table,)
-    )
-    if not cur.fetchone():
+    if not table_exists(cur, table):
         cur.close()
         conn.close()
         return {"error": f"表 {table} 不存在"}
@@ -511,11 +511,7 @@ def query_loans_by_dpd_bucket(spv_id: str, stat_date: str, bucket: str, page: in
 
     cur = conn.cursor()
     try:
-        cur.execute(
-            "SELECT 1 FROM information_schema.tables WHERE table_schema='public' AND table_name = %s",
-            (table,)
-        )
-        if not cur.fetchone():
+        if not table_exists(cur, table):
             return [], 0
     except Exception:
         cur.close()
@@ -635,11 +631,7 @@ def query_loans_by_vintage_month(spv_id: str, stat_date: str, disbursement_month
 
     cur = conn.cursor()
     try:
-        cur.execute(
-            "SELECT 1 FROM information_schema.tables WHERE table_schema='public' AND table_name = %s",
-            (table,)
-        )
-        if not cur.fetchone():
+        if not table_exists(cur, table):
             return [], 0
     except Exception:
         cur.close()
@@ -735,11 +727,7 @@ def query_loans_by_maturity_month(spv_id: str, stat_date: str, maturity_month: s
 
     cur = conn.cursor()
     try:
-        cur.execute(
-            "SELECT 1 FROM information_schema.tables WHERE table_schema='public' AND table_name = %s",
-            (table,)
-        )
-        if not cur.fetchone():
+        if not table_exists(cur, table):
             return [], 0
     except Exception:
         cur.close()
@@ -883,7 +871,7 @@ def _load_collection_report(stat_date: str, spv_id: str):
 
 
 def _load_vintage_for_row(stat_date: str, spv_id: str):
-    """加载 vintage_data：优先缓存（需 stat_date 匹配），无则返回空"""
+    """加载 vintage_data：按 stat_date 读取缓存（每个 SPV 保留多个日期），无则返回空"""
     try:
         from kn_vintage import load_vintage_cache
         cached = load_vintage_cache(spv_id, stat_date)
@@ -894,34 +882,48 @@ def _load_vintage_for_row(stat_date: str, spv_id: str):
     return []
 
 
+def resolve_latest_stat_date(spv_id: str):
+    """
+    该 SPV 缓存中的最新 stat_date：优先生产商摘要索引（partner_summary，请求内 / 进程内复用，需与 manifest 版本一致），
+    否则取分片或单独风控缓存中 risk_data 的最大 stat_date；均无时返回 None
+    """
+    try:
+        from kn_producer_cache import load_partner_summary, load_producer_manifest
+        entry = ((load_producer_manifest() or {}).get("producers") or {}).get(spv_id) or {}
+        row = load_partner_summary().get(spv_id) or {}
+        latest = (row.get("partner") or {}).get("latest") or {}
+        if entry and row.get("updated_at") == entry.get("updated_at") and latest.get("stat_date") not in (None, "", "-"):
+            return str(latest["stat_date"])[:10]
+    except Exception:
+        pass
+    try:
+        from kn_producer_cache import get_risk_data_from_full_cache
+        risk_data, cache_exists = get_risk_data_from_full_cache(spv_id)
+        if not cache_exists:
+            from kn_risk_cache import load_risk_cache
+            risk_data, _ = load_risk_cache(spv_id)
+        dates = [r.get("stat_date") for r in (risk_data or []) if r.get("stat_date")]
+        if dates:
+            return str(max(dates))[:10]
+    except Exception:
+        pass
+    return None
+
+
 def get_loan_overdue_info(loan_id: str, spv_id: str, stat_date: str = None):
     """从 calc_overdue 获取 loan 的 dpd、loan_status、outstanding_principal"""
     try:
         from datetime import datetime
         from db_connect import get_connection
         if not stat_date:
-            try:
-                from kn_producer_cache import get_risk_data_from_full_cache
-                risk_data, cache_exists = get_risk_data_from_full_cache(spv_id)
-                if not cache_exists:
-                    from kn_risk_cache import load_risk_cache
-                    risk_data, _ = load_risk_cache(spv_id)
-                if risk_data:
-                    latest = sorted(risk_data, key=lambda r: r.get("stat_date", ""), reverse=True)[0]
-                    stat_date = latest.get("stat_date", "")
-            except Exception:
-                pass
+            stat_date = resolve_latest_stat_date(spv_id)
         if not stat_date:
             return {}
         dt = datetime.strptime(stat_date[:10], "%Y-%m-%d")
         table = get_calc_table(dt)
         conn = get_connection()
         cur = conn.cursor()
-        cur.execute(
-            "SELECT 1 FROM information_schema.tables WHERE table_schema='public' AND table_name = %s",
-            (table,)
-        )
-        if not cur.fetchone():
+        if not table_exists(cur, table):
             cur.close()
             conn.close()
             return {}
@@ -1024,18 +1026,22 @@ def get_customer_info(customer_id: str):
         raw = {cols[i]: row[i] for i in range(len(cols))}
         cur.close()
         conn.close()
-        # 映射到展示字段：rating_a->credit_rating，其余按列名取（industry/region/education 等）
-        result = {}
-        if "rating_a" in raw and raw["rating_a"] is not None:
-            result["credit_rating"] = str(raw["rating_a"]).strip() or "-"
-        else:
-            result["credit_rating"] = "-"
-        for k in ("industry", "region", "education", "age", "gender"):
-            if k in raw and raw[k] is not None:
-                result[k] = str(raw[k]).strip() or "-"
-            else:
-                result[k] = "-"
-        return result
+        return customer_display_fields(raw)
     except Exception:
         pass
     return {}
+
+
+def customer_display_fields(raw: dict) -> dict:
+    """raw_customer 行 -> 展示字段：rating_a->credit_rating，其余按列名取（industry/region/education 等）"""
+    result = {}
+    if "rating_a" in raw and raw["rating_a"] is not None:
+        result["credit_rating"] = str(raw["rating_a"]).strip() or "-"
+    else:
+        result["credit_rating"] = "-"
+    for k in ("industry", "region", "education", "age", "gender"):
+        if k in raw and raw[k] is not None:
+            result[k] = str(raw[k]).strip() or "-"
+        else:
+            result[k] = "-"
+    return result
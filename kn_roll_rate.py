@@ -0,0 +1,266 @@
+"""
+DPD 档位迁移矩阵（Roll Rate）- 基于 calc_overdue 分区，loan_id 自连接计算两日之间各档位（M0 ... M6+）的迁移
+- 任意两个 stat_date：compute_transition（日期格式、先后与分区存在性不合法时抛 ValueError）；
+  非月末期间的已完结结果另存 adhoc，最多 ROLL_RATE_ADHOC_MAX 个（最早写入的先淘汰）
+- 月末对月末：相邻月末快照日（每月最大 stat_date，最新月为最新数据日）两两成对，所有待算期间合成一条 UNION ALL 查询
+- 流转率（flow rate）时间序列：M0→M1、M1→M2 ... 按起始档位余额计算
+- 已完结期间（终点不在最新数据月）结果不变，缓存到 Blob（rt_risk/roll_rate/{spv_id}.json，Vercel 各实例共享）
+  与本地文件（roll_rate_cache_{spv_id}.json）；刷新时只重算最新一期（上月末 → 最新数据日）及缓存中缺失的期间
+"""
+import logging
+import os
+from datetime import datetime
+
+from kn_data_utils import get_cache_dir, get_calc_table, get_spv_stat_dates, month_end_dates
+
+log = logging.getLogger("kn_roll_rate")
+
+CACHE_DIR = get_cache_dir()
+CACHE_FILE_PREFIX = "roll_rate_cache_"
+# 任意期间（非月末对月末）迁移矩阵的缓存上限
+ROLL_RATE_ADHOC_MAX = int(os.getenv("ROLL_RATE_ADHOC_MAX", "32") or 32)
+
+# 与 kn_risk_query 的 DPD 分布一致；closed 为终点日已结清 / 不在活跃状态的贷款
+DPD_BUCKETS = ("M0", "M1", "M2", "M3", "M4", "M5", "M6+")
+TO_BUCKETS = DPD_BUCKETS + ("closed",)
+
+
+def _bucket_sql(col: str) -> str:
+    return f"""CASE
+                WHEN {col} = 0 THEN 'M0'
+                WHEN {col} BETWEEN 1 AND 30 THEN 'M1'
+                WHEN {col} BETWEEN 31 AND 60 THEN 'M2'
+                WHEN {col} BETWEEN 61 AND 90 THEN 'M3'
+                WHEN {col} BETWEEN 91 AND 120 THEN 'M4'
+                WHEN {col} BETWEEN 121 AND 150 THEN 'M5'
+                ELSE 'M6+'
+            END"""
+
+
+def _pair_key(from_date: str, to_date: str) -> str:
+    return f"{from_date[:10]}|{to_date[:10]}"
+
+
+def _transition_sql(n_pairs: int) -> str:
+    """n 个日期对的迁移汇总，每对一次 loan_id 自连接（LEFT JOIN：终点日缺失视为 closed），UNION ALL 一次执行"""
+    parts = []
+    for i in range(n_pairs):
+        parts.append(f"""
+        SELECT {i} AS pair_idx,
+            {_bucket_sql('a.dpd')} AS from_bucket,
+            CASE WHEN b.loan_id IS NULL OR b.loan_status NOT IN (1, 2) THEN 'closed'
+                 ELSE {_bucket_sql('b.dpd')} END AS to_bucket,
+            COUNT(*) AS loan_count,
+            COALESCE(SUM(a.outstanding_principal), 0) AS from_balance
+        FROM {{from_table_{i}}} a
+        LEFT JOIN {{to_table_{i}}} b ON b.loan_id = a.loan_id AND b.spv_id = a.spv_id AND b.stat_date = %s
+        WHERE a.spv_id = %s AND a.stat_date = %s AND a.loan_status IN (1, 2)
+        GROUP BY 2, 3""")
+    return "\nUNION ALL".join(parts)
+
+
+def _build_matrix(from_date: str, to_date: str, rows) -> dict:
+    """迁移汇总行 [(from_bucket, to_bucket, loan_count, from_balance)] -> 矩阵（余额、笔数、余额占比）与流转率"""
+    balance = {b: {t: 0.0 for t in TO_BUCKETS} for b in DPD_BUCKETS}
+    count = {b: {t: 0 for t in TO_BUCKETS} for b in DPD_BUCKETS}
+    for fb, tb, lc, bal in rows:
+        if fb in balance and tb in balance[fb]:
+            balance[fb][tb] += float(bal or 0)
+            count[fb][tb] += int(lc or 0)
+    rate = {}
+    for b in DPD_BUCKETS:
+        total = sum(balance[b].values())
+        rate[b] = {t: round(v / total, 6) if total else None for t, v in balance[b].items()}
+    flow = {}
+    for i, b in enumerate(DPD_BUCKETS[:-1]):
+        nxt = DPD_BUCKETS[i + 1]
+        flow[f"{b}->{nxt}"] = rate[b][nxt]
+    return {
+        "from_date": from_date[:10],
+        "to_date": to_date[:10],
+        "balance": {b: {t: round(v, 2) for t, v in row.items()} for b, row in balance.items()},
+        "count": count,
+        "rate": rate,
+        "flow": flow,
+        "computed_at": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def compute_transitions(spv_id: str, pairs, cur=None) -> dict:
+    """
+    批量计算多个日期对的迁移矩阵（一条查询）
+    pairs: [(from_date, to_date), ...]，日期 YYYY-MM-DD；各自所在 calc_overdue 分区由日期推出
+    cur: 复用已有游标（不关闭）；None 时自行建立连接
+    返回: { "from|to": matrix }
+    """
+    pairs = [(str(a)[:10], str(b)[:10]) for a, b in pairs]
+    if not pairs:
+        return {}
+    sql = _transition_sql(len(pairs))
+    tables = {}
+    params = []
+    for i, (a, b) in enumerate(pairs):
+        tables[f"from_table_{i}"] = get_calc_table(a)
+        tables[f"to_table_{i}"] = get_calc_table(b)
+        params += [b, spv_id, a]
+    sql = sql.format(**tables)
+
+    conn = None
+    own = cur is None
+    if own:
+        from db_connect import get_connection
+        conn = get_connection()
+        cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    finally:
+        if own:
+            cur.close()
+            conn.close()
+    by_pair = {}
+    for idx, fb, tb, lc, bal in rows:
+        by_pair.setdefault(int(idx), []).append((fb, tb, lc, bal))
+    return {_pair_key(a, b): _build_matrix(a, b, by_pair.get(i, [])) for i, (a, b) in enumerate(pairs)}
+
+
+def parse_period(from_date: str, to_date: str):
+    """校验期间：两个 YYYY-MM-DD 且 from < to，返回规范化的 (from, to)，否则抛 ValueError"""
+    try:
+        a = datetime.strptime(str(from_date or "").strip(), "%Y-%m-%d").strftime("%Y-%m-%d")
+        b = datetime.strptime(str(to_date or "").strip(), "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise ValueError("日期格式应为 YYYY-MM-DD")
+    if a >= b:
+        raise ValueError("起始日期须早于结束日期")
+    return a, b
+
+
+def cached_transition(cache: dict, from_date: str, to_date: str):
+    """缓存中的迁移矩阵（月末期间或任意期间），无则 None"""
+    key = _pair_key(from_date, to_date)
+    cache = cache or {}
+    return (cache.get("transitions") or {}).get(key) or (cache.get("adhoc") or {}).get(key)
+
+
+def latest_transition(cache: dict):
+    """流转率序列最后一期（最新月末 → 最新数据日）的矩阵，无则 None"""
+    series = (cache or {}).get("series") or []
+    if not series:
+        return None
+    return ((cache.get("transitions") or {}).get(_pair_key(series[-1]["from_date"], series[-1]["to_date"])))
+
+
+def compute_transition(spv_id: str, from_date: str, to_date: str) -> dict:
+    """
+    任意两个 stat_date 之间的迁移矩阵；已缓存则直接返回
+    日期不合法或所在 calc_overdue 分区不存在时抛 ValueError
+    终点早于最新数据月的结果写入 adhoc 缓存（最多 ROLL_RATE_ADHOC_MAX 个）
+    """
+    from_date, to_date = parse_period(from_date, to_date)
+    key = _pair_key(from_date, to_date)
+    cache = load_roll_rate_cache(spv_id) or {}
+    hit = cached_transition(cache, from_date, to_date)
+    if hit is not None:
+        return hit
+    from db_connect import get_connection
+    from kn_data_utils import table_exists
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        missing = sorted({t for t in (get_calc_table(from_date), get_calc_table(to_date)) if not table_exists(cur, t)})
+        if missing:
+            cur.close()
+            raise ValueError(f"无该日期的数据分区: {', '.join(missing)}")
+        matrix = compute_transitions(spv_id, [(from_date, to_date)], cur=cur)[key]
+        cur.close()
+    finally:
+        conn.close()
+    latest = cache.get("latest_date") or ""
+    if latest and to_date[:7] < latest[:7]:
+        adhoc = dict(cache.get("adhoc") or {})
+        adhoc[key] = matrix
+        while len(adhoc) > ROLL_RATE_ADHOC_MAX:
+            adhoc.pop(next(iter(adhoc)))
+        try:
+            save_roll_rate_cache(spv_id, dict(cache, adhoc=adhoc))
+        except Exception as e:
+            log.warning("[迁移矩阵] 缓存写入失败 spv_id=%s %s: %s", spv_id, key, e)
+    return matrix
+
+
+def month_end_pairs(stat_dates) -> list:
+    ends = month_end_dates(stat_dates)
+    return list(zip(ends, ends[1:]))
+
+
+def _cache_path(spv_id: str) -> str:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, f"{CACHE_FILE_PREFIX}{spv_id}.json")
+
+
+def load_roll_rate_cache(spv_id: str):
+    """
+    加载迁移矩阵缓存（Blob 优先，否则本地文件）：
+    { spv_id, latest_date, last_updated, transitions: { "from|to": matrix }, series: [...] }，无缓存时返回 None
+    """
+    from kn_cache_storage import blob_roll_rate_path
+    from kn_refresh_job import _read_json
+    return _read_json(blob_roll_rate_path(spv_id), _cache_path(spv_id))
+
+
+def save_roll_rate_cache(spv_id: str, data: dict):
+    """写入 Blob + 本地文件（Blob 写入失败抛异常）"""
+    from kn_cache_storage import blob_roll_rate_path
+    from kn_refresh_job import _write_json
+    _write_json(blob_roll_rate_path(spv_id), _cache_path(spv_id), data)
+
+
+def flow_rate_series(transitions: dict, pairs) -> list:
+    """按月末期间顺序的流转率时间序列：[{ from_date, to_date, "M0->M1": r, ... }, ...]"""
+    out = []
+    for a, b in pairs:
+        m = transitions.get(_pair_key(a, b))
+        if m:
+            out.append(dict({"from_date": a, "to_date": b}, **m.get("flow", {})))
+    return out
+
+
+def refresh_roll_rates(spv_id: str, log_fn=None) -> dict:
+    """
+    刷新月末对月末迁移矩阵：已缓存的已完结期间直接复用，缺失期间与最新一期合并为一条查询计算
+    返回: { "ok": True, "computed": N, "reused": M, "series": [...] } 或 { "error": "..." }
+    """
+    def _log(msg):
+        log.info("[迁移矩阵] %s", msg)
+        if log_fn:
+            log_fn(msg)
+    try:
+        pairs = month_end_pairs(get_spv_stat_dates(spv_id))
+    except Exception as e:
+        return {"error": f"获取 stat_date 失败 ({spv_id}): {e}"}
+    if not pairs:
+        return {"ok": True, "computed": 0, "reused": 0, "series": []}
+
+    latest_month = pairs[-1][1][:7]
+    prev = load_roll_rate_cache(spv_id) or {}
+    cached = prev.get("transitions") or {}
+    # 已完结期间：终点不在最新数据月；最新一期每次重算
+    completed = {k: v for k, v in cached.items() if k.split("|")[1][:7] < latest_month}
+    todo = [(a, b) for a, b in pairs if b[:7] == latest_month or _pair_key(a, b) not in completed]
+    try:
+        computed = compute_transitions(spv_id, todo)
+    except Exception as e:
+        return {"error": f"迁移矩阵计算失败 ({spv_id}): {e}"}
+    transitions = dict(completed, **computed)
+    series = flow_rate_series(transitions, pairs)
+    save_roll_rate_cache(spv_id, {
+        "spv_id": spv_id,
+        "latest_date": pairs[-1][1],
+        "last_updated": datetime.now().isoformat(),
+        "transitions": transitions,
+        "series": series,
+        "adhoc": {k: v for k, v in (prev.get("adhoc") or {}).items() if k.split("|")[1][:7] < latest_month},
+    })
+    _log(f"{len(pairs)} 个月末期间：计算 {len(todo)}，复用 {len(pairs) - len(todo)}")
+    return {"ok": True, "computed": len(todo), "reused": len(pairs) - len(todo), "series": series}
@@ -1,46 +1,39 @@
 """
 KN Vintage 账龄分析 - 从 calc_overdue、raw_loan 计算，结果缓存到本地文件
 Vercel/serverless 下使用 /tmp/rt_risk_cache，与其它缓存模块一致
+
+历史 MOB 三角（vintage_triangle_{spv_id}.json）：cohort（放款月）× MOB -> 余额、DPD1+/7+/30+ 余额、笔数
+- 每个月末快照日（每月最大 stat_date，最新月为最新数据日）对应三角的一条对角线，由该月分区一条 GROUP BY 查询得到
+- 刷新时只追加缺失月份的对角线，并重算快照日变化的月份（即最新数据月）；已完结月份不再查询
+- compute_vintage_data 的 mob1~mob12_rate 从三角读取（不访问 DB），当前 MOB 仍用实时 DPD1+ 率
+
+vintage_data 缓存（vintage_cache_{spv_id}.json）按 stat_date 存多条，最多 VINTAGE_CACHE_MAX_ENTRIES 条，LRU 淘汰；
+多日期计算（compute_vintage_batch）共用一次 cohort 放款汇总查询
 """
 import json
 import os
 from datetime import datetime
 from decimal import Decimal
 
-from kn_data_utils import get_calc_table, get_cache_dir
+from kn_data_utils import get_calc_table, get_cache_dir, get_spv_stat_dates, month_end_dates, table_exists
 
 CACHE_DIR = get_cache_dir()
 CACHE_FILE_PREFIX = "vintage_cache_"
+# 每个 SPV 按 stat_date 保留的 vintage_data 条数（LRU 淘汰）；风控刷新每次最多 3 个日期，日期选择器最多 30 个
+VINTAGE_CACHE_MAX_ENTRIES = int(os.getenv("VINTAGE_CACHE_MAX_ENTRIES", "30") or 30)
+TRIANGLE_FILE_PREFIX = "vintage_triangle_"
+TRIANGLE_MAX_MOB = 12
+# 三角单元格中的余额字段；rate 指标 dpd1 / dpd7 / dpd30 = {指标}_balance / balance
+TRIANGLE_METRICS = ("dpd1", "dpd7", "dpd30")
 
 
-def compute_vintage_data(spv_id: str, stat_date: str):
-    """
-    从 calc_overdue + raw_loan 计算 vintage_data
-    返回: [ { disbursement_month, disbursement_amount, current_balance, dpd1_rate, ... }, ... ]
-    """
-    try:
-        from db_connect import get_connection
-        conn = get_connection()
-    except Exception as e:
-        return {"error": str(e)}
-
-    try:
-        table = get_calc_table(stat_date)
-    except (ValueError, TypeError):
-        return {"error": f"无效 stat_date: {stat_date}"}
+def _mob(cohort: str, month: str) -> int:
+    """账龄月数：month（YYYY-MM）- cohort（YYYY-MM）"""
+    return (int(month[:4]) - int(cohort[:4])) * 12 + int(month[5:7]) - int(cohort[5:7])
 
-    cur = conn.cursor()
-    # 检查表存在
-    cur.execute(
-        "SELECT 1 FROM information_schema.tables WHERE table_schema='public' AND table_name = %s",
-        (table,)
-    )
-    if not cur.fetchone():
-        cur.close()
-        conn.close()
-        return {"error": f"表 {table} 不存在"}
 
-    # 1. 各 cohort 的 disbursement 汇总（raw_loan）
+def fetch_cohort_disbursements(cur, spv_id: str) -> dict:
+    """各 cohort 的 disbursement 汇总（raw_loan，与 stat_date 无关，多个日期共用一次查询）"""
     cur.execute("""
         SELECT
             to_char(disbursement_time::date, 'YYYY-MM') AS disbursement_month,
@@ -52,9 +45,49 @@ def compute_vintage_data(spv_id: str, stat_date: str):
         GROUP BY 1
         ORDER BY 1
     """, (spv_id,))
-    disb_rows = {r[0]: {"disbursement_amount": r[1], "disbursement_count": r[2], "borrower_count": r[3]} for r in cur.fetchall()}
+    return {r[0]: {"disbursement_amount": r[1], "disbursement_count": r[2], "borrower_count": r[3]} for r in cur.fetchall()}
+
+
+def compute_vintage_data(spv_id: str, stat_date: str, triangle: dict = None, disb_rows: dict = None, cur=None):
+    """
+    从 calc_overdue + raw_loan 计算 vintage_data
+    triangle: 历史 MOB 三角（load_vintage_triangle 结果），None 时从缓存文件加载；
+              早于当前 MOB 的 mobN_rate 取三角中该 cohort 在 MOB N 月末的 DPD1+ 率
+    disb_rows: fetch_cohort_disbursements 结果，None 时查询；cur: 复用已有游标（不关闭）
+    返回: [ { disbursement_month, disbursement_amount, current_balance, dpd1_rate, ... }, ... ]
+    """
+    try:
+        table = get_calc_table(stat_date)
+    except (ValueError, TypeError):
+        return {"error": f"无效 stat_date: {stat_date}"}
 
-    # 2. 各 cohort 的余额与 DPD 分布（calc_overdue + raw_loan）
+    conn = None
+    own = cur is None
+    if own:
+        try:
+            from db_connect import get_connection
+            conn = get_connection()
+        except Exception as e:
+            return {"error": str(e)}
+        cur = conn.cursor()
+    try:
+        # 检查表存在
+        if not table_exists(cur, table):
+            return {"error": f"表 {table} 不存在"}
+        # 1. 各 cohort 的 disbursement 汇总（raw_loan）
+        if disb_rows is None:
+            disb_rows = fetch_cohort_disbursements(cur, spv_id)
+        balance_rows = _query_cohort_balances(cur, table, spv_id, stat_date)
+    finally:
+        if own:
+            cur.close()
+            conn.close()
+    return _build_vintage_rows(stat_date, balance_rows, disb_rows, triangle if triangle is not None
+                               else load_vintage_triangle(spv_id))
+
+
+def _query_cohort_balances(cur, table: str, spv_id: str, stat_date: str) -> list:
+    """各 cohort 在 stat_date 的余额与 DPD 分布（calc_overdue + raw_loan）"""
     cur.execute(f"""
         SELECT
             to_char(r.disbursement_time::date, 'YYYY-MM') AS disbursement_month,
@@ -70,12 +103,12 @@ def compute_vintage_data(spv_id: str, stat_date: str):
         GROUP BY 1
         ORDER BY 1
     """, (stat_date[:10], spv_id))
-    balance_rows = cur.fetchall()
+    return cur.fetchall()
 
-    cur.close()
-    conn.close()
 
-    # 3. 合并并计算 DPD 率、MOB 率
+def _build_vintage_rows(stat_date: str, balance_rows, disb_rows: dict, triangle) -> list:
+    """合并 cohort 余额与放款汇总，计算 DPD 率、MOB 率"""
+    history = triangle_rates(triangle, "dpd1") if triangle else {}
     stat_dt = datetime.strptime(stat_date[:10], "%Y-%m-%d")
     vintage_data = []
     for row in balance_rows:
@@ -103,9 +136,12 @@ def compute_vintage_data(spv_id: str, stat_date: str):
             mob = 0
 
         mob_rates = {}
-        for i in range(1, 13):
+        cohort_hist = history.get(dm) or {}
+        for i in range(1, TRIANGLE_MAX_MOB + 1):
             if i == mob:
                 mob_rates[f"mob{i}_rate"] = dpd1_rate  # 当前 MOB 的逾期率用 DPD1+ 近似
+            elif i < mob:
+                mob_rates[f"mob{i}_rate"] = cohort_hist.get(i)  # 历史 MOB：三角中该 MOB 月末的 DPD1+ 率
             else:
                 mob_rates[f"mob{i}_rate"] = None
 
@@ -127,42 +163,118 @@ def compute_vintage_data(spv_id: str, stat_date: str):
     return vintage_data
 
 
+def compute_vintage_batch(spv_id: str, stat_dates, triangle: dict = None) -> dict:
+    """
+    多个 stat_date 的 vintage_data：一个连接，cohort 放款汇总只查一次，每个日期一条余额查询
+    返回: { stat_date: vintage_data 或 {"error": "..."} }
+    """
+    stat_dates = [str(d)[:10] for d in stat_dates]
+    if not stat_dates:
+        return {}
+    if triangle is None:
+        triangle = load_vintage_triangle(spv_id)
+    try:
+        from db_connect import get_connection
+        conn = get_connection()
+    except Exception as e:
+        return {d: {"error": str(e)} for d in stat_dates}
+    cur = conn.cursor()
+    out = {}
+    try:
+        disb_rows = fetch_cohort_disbursements(cur, spv_id)
+        for d in stat_dates:
+            try:
+                out[d] = compute_vintage_data(spv_id, d, triangle or {}, disb_rows, cur)
+            except Exception as e:
+                conn.rollback()
+                out[d] = {"error": str(e)}
+    finally:
+        cur.close()
+        conn.close()
+    return out
+
+
 def _cache_path(spv_id: str) -> str:
     os.makedirs(CACHE_DIR, exist_ok=True)
     return os.path.join(CACHE_DIR, f"{CACHE_FILE_PREFIX}{spv_id}.json")
 
 
-def load_vintage_cache(spv_id: str, stat_date: str = None):
+def _read_cache_file(spv_id: str) -> dict:
     """
-    从缓存文件加载 vintage_data
-    stat_date: 若指定，仅当缓存 stat_date 匹配时返回；否则返回缓存内容
-    返回: vintage_data 或 None
+    缓存文件：{ spv_id, last_updated, entries: { stat_date: vintage_data } }，entries 按最近使用排序（最后为最新）
+    兼容旧格式（单个 stat_date + vintage_data）；无缓存或损坏时返回空结构
     """
     path = _cache_path(spv_id)
     if not os.path.exists(path):
-        return None
+        return {"spv_id": spv_id, "entries": {}}
     try:
         with open(path, "r", encoding="utf-8") as f:
             data = json.load(f)
-        cached_stat = data.get("stat_date", "")[:10] if data.get("stat_date") else ""
-        if stat_date and cached_stat != stat_date[:10]:
-            return None
-        return data.get("vintage_data")
     except Exception:
+        return {"spv_id": spv_id, "entries": {}}
+    if "entries" not in data:
+        old = data.get("stat_date") and data.get("vintage_data")
+        data = {"spv_id": spv_id, "last_updated": data.get("last_updated"),
+                "entries": {data["stat_date"][:10]: data["vintage_data"]} if old else {}}
+    return data
+
+
+def _write_cache_file(spv_id: str, data: dict):
+    path = _cache_path(spv_id)
+    entries = data.get("entries") or {}
+    # 有界保留：超出 VINTAGE_CACHE_MAX_ENTRIES 时淘汰最久未使用的日期
+    if len(entries) > VINTAGE_CACHE_MAX_ENTRIES:
+        data["entries"] = dict(list(entries.items())[-VINTAGE_CACHE_MAX_ENTRIES:])
+    data["last_updated"] = datetime.now().isoformat()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def load_vintage_cache(spv_id: str, stat_date: str = None):
+    """
+    从缓存文件加载 vintage_data
+    stat_date: 若指定，返回该日期的缓存（命中时标记为最近使用）；否则返回最近使用的一条
+    返回: vintage_data 或 None
+    """
+    data = _read_cache_file(spv_id)
+    entries = data.get("entries") or {}
+    if not entries:
+        return None
+    if not stat_date:
+        return entries[next(reversed(entries))]
+    key = stat_date[:10]
+    if key not in entries:
         return None
+    if next(reversed(entries)) != key:
+        # LRU：命中的日期移到末尾（已是最近使用时不写文件）
+        entries[key] = entries.pop(key)
+        try:
+            _write_cache_file(spv_id, data)
+        except Exception:
+            pass
+    return entries[key]
+
+
+def load_vintage_cache_entries(spv_id: str) -> dict:
+    """全部已缓存日期：{ stat_date: vintage_data }（不改变使用顺序）"""
+    return dict(_read_cache_file(spv_id).get("entries") or {})
 
 
 def save_vintage_cache(spv_id: str, stat_date: str, vintage_data: list):
-    """将 vintage_data 写入缓存"""
-    path = _cache_path(spv_id)
-    os.makedirs(CACHE_DIR, exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump({
-            "spv_id": spv_id,
-            "stat_date": stat_date[:10],
-            "last_updated": datetime.now().isoformat(),
-            "vintage_data": vintage_data,
-        }, f, ensure_ascii=False, indent=2)
+    """将 vintage_data 写入缓存（该日期标记为最近使用）"""
+    save_vintage_cache_entries(spv_id, {stat_date: vintage_data})
+
+
+def save_vintage_cache_entries(spv_id: str, results: dict):
+    """批量写入 { stat_date: vintage_data }，一次读写文件；按传入顺序标记为最近使用"""
+    data = _read_cache_file(spv_id)
+    entries = data.setdefault("entries", {})
+    for d, vintage_data in results.items():
+        entries.pop(d[:10], None)
+        entries[d[:10]] = vintage_data
+    _write_cache_file(spv_id, data)
 
 
 def refresh_vintage_cache(spv_id: str, stat_date: str):
@@ -175,3 +287,134 @@ def refresh_vintage_cache(spv_id: str, stat_date: str):
         return result
     save_vintage_cache(spv_id, stat_date, result)
     return {"ok": True, "vintage_data": result}
+
+
+def _triangle_path(spv_id: str) -> str:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, f"{TRIANGLE_FILE_PREFIX}{spv_id}.json")
+
+
+def load_vintage_triangle(spv_id: str):
+    """
+    加载历史 MOB 三角：{ spv_id, last_updated, month_ends: { YYYY-MM: stat_date },
+    cells: { cohort: { "mob": { stat_date, balance, dpd1_balance, dpd7_balance, dpd30_balance, loan_count } } } }
+    无缓存时返回 None
+    """
+    path = _triangle_path(spv_id)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def save_vintage_triangle(spv_id: str, data: dict):
+    path = _triangle_path(spv_id)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _query_diagonal(cur, spv_id: str, stat_date: str) -> dict:
+    """某个月末快照日的三角对角线：该月分区一条查询，按 cohort 汇总余额与 DPD 余额"""
+    cur.execute(f"""
+        SELECT
+            to_char(r.disbursement_time::date, 'YYYY-MM') AS disbursement_month,
+            COUNT(*) AS loan_count,
+            COALESCE(SUM(c.outstanding_principal), 0) AS balance,
+            COALESCE(SUM(CASE WHEN c.dpd >= 1 THEN c.outstanding_principal ELSE 0 END), 0) AS dpd1_balance,
+            COALESCE(SUM(CASE WHEN c.dpd >= 7 THEN c.outstanding_principal ELSE 0 END), 0) AS dpd7_balance,
+            COALESCE(SUM(CASE WHEN c.dpd >= 30 THEN c.outstanding_principal ELSE 0 END), 0) AS dpd30_balance
+        FROM {get_calc_table(stat_date)} c
+        JOIN raw_loan r ON r.loan_id = c.loan_id AND r.spv_id = c.spv_id
+        WHERE c.stat_date = %s AND c.spv_id = %s AND c.loan_status IN (1, 2)
+        GROUP BY 1
+    """, (stat_date, spv_id))
+    out = {}
+    for dm, cnt, bal, d1, d7, d30 in cur.fetchall():
+        if not dm:
+            continue
+        out[dm] = {
+            "stat_date": stat_date,
+            "balance": round(float(bal or 0), 2),
+            "dpd1_balance": round(float(d1 or 0), 2),
+            "dpd7_balance": round(float(d7 or 0), 2),
+            "dpd30_balance": round(float(d30 or 0), 2),
+            "loan_count": int(cnt or 0),
+        }
+    return out
+
+
+def refresh_vintage_triangle(spv_id: str, log_fn=None) -> dict:
+    """
+    增量刷新历史 MOB 三角：缺失月份与快照日变化的月份（最新数据月）各一条查询，其余对角线复用缓存
+    返回: { "ok": True, "computed": N, "reused": M, "triangle": {...} } 或 { "error": "..." }
+    """
+    def _log(msg):
+        if log_fn:
+            log_fn(msg)
+    try:
+        ends = month_end_dates(get_spv_stat_dates(spv_id))
+    except Exception as e:
+        return {"error": f"获取 stat_date 失败 ({spv_id}): {e}"}
+
+    store = load_vintage_triangle(spv_id) or {}
+    month_ends = dict(store.get("month_ends") or {})
+    cells = {c: dict(v) for c, v in (store.get("cells") or {}).items()}
+    todo = [d for d in ends if month_ends.get(d[:7]) != d]
+    if todo:
+        try:
+            from db_connect import get_connection
+            conn = get_connection()
+        except Exception as e:
+            return {"error": str(e)}
+        cur = conn.cursor()
+        try:
+            for d in todo:
+                month = d[:7]
+                diagonal = _query_diagonal(cur, spv_id, d)
+                # 先移除该月旧对角线（已结清的 cohort 不再出现）
+                for cohort, row in cells.items():
+                    row.pop(str(_mob(cohort, month)), None)
+                for cohort, cell in diagonal.items():
+                    mob = _mob(cohort, month)
+                    if mob >= 0:
+                        cells.setdefault(cohort, {})[str(mob)] = cell
+                month_ends[month] = d
+        except Exception as e:
+            return {"error": f"Vintage 三角计算失败 ({spv_id}): {e}"}
+        finally:
+            cur.close()
+            conn.close()
+
+    triangle = {
+        "spv_id": spv_id,
+        "last_updated": datetime.now().isoformat(),
+        "month_ends": month_ends,
+        "cells": {c: v for c, v in sorted(cells.items()) if v},
+    }
+    if todo or not store:
+        save_vintage_triangle(spv_id, triangle)
+    _log(f"Vintage 三角 {len(ends)} 个月末：计算 {len(todo)}，复用 {len(ends) - len(todo)}")
+    return {"ok": True, "computed": len(todo), "reused": len(ends) - len(todo), "triangle": triangle}
+
+
+def triangle_rates(triangle: dict, metric: str = "dpd30", max_mob: int = TRIANGLE_MAX_MOB) -> dict:
+    """
+    三角单元格 -> 比率：{ cohort: { mob(int): {metric}_balance / balance } }，仅 MOB 1 ~ max_mob；
+    余额为 0 的单元格为 None
+    """
+    out = {}
+    for cohort, row in ((triangle or {}).get("cells") or {}).items():
+        rates = {}
+        for mob, cell in row.items():
+            m = int(mob)
+            if 1 <= m <= max_mob:
+                bal = float(cell.get("balance") or 0)
+                rates[m] = float(cell.get(f"{metric}_balance") or 0) / bal if bal else None
+        if rates:
+            out[cohort] = rates
+    return out
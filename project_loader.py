@@ -3,7 +3,7 @@
 每个项目的 default currency 来自 spv_config.currency
 """
 from spv_config import load_producers_from_spv_config
-from spv_internal_params import load_priority_indicators_for_spv
+from spv_internal_params import load_priority_indicators_batch
 
 
 def load_projects_with_internal_params(skip_revenue_compute=False, skip_priority_indicators=False, json_only=False):
@@ -11,26 +11,21 @@ def load_projects_with_internal_params(skip_revenue_compute=False, skip_priority
     加载项目列表：spv_config 为主，与 spv_internal_params 交叉校验
     返回: { spv_id: { id, name, region, currency, exchange_rate, ..., priority_indicators?, ... }, ... }
     skip_revenue_compute=True: 跳过 compute_revenue_data（DB），用于已有全量缓存时加速
-    skip_priority_indicators=True: 跳过 load_priority_indicators_for_spv（DB），用于列表页加速
+    skip_priority_indicators=True: 跳过优先级指标（DB），用于列表页加速
     json_only=True: 仅从 producers.json 读取，完全避免 DB
     """
     producers = load_producers_from_spv_config(skip_revenue_compute=skip_revenue_compute, json_only=json_only)
     if not producers:
         return {}
 
+    active = {spv_id: p for spv_id, p in producers.items()
+              if not (p.get("status") and str(p.get("status")).lower() not in ("active", ""))}
+    # 全部项目的优先级指标一次批量计算（两条查询），不再逐个 SPV 查询
+    priority = {} if skip_priority_indicators else load_priority_indicators_batch(list(active), fallback=False)
     out = {}
-    for spv_id, p in producers.items():
-        if p.get("status") and str(p.get("status")).lower() not in ("active", ""):
-            continue
+    for spv_id, p in active.items():
         proj = dict(p)
-        if not skip_priority_indicators:
-            pi = load_priority_indicators_for_spv(spv_id)
-            if pi:
-                proj["priority_indicators"] = pi
-            else:
-                proj["priority_indicators"] = None
-        else:
-            proj["priority_indicators"] = None
+        proj["priority_indicators"] = priority.get(spv_id) or None
         out[spv_id] = proj
     return out
 
@@ -1,13 +1,26 @@
 """
 风控数据查询模块 - 连接 PostgreSQL 执行 Loan 与放款查询
+- query_loan_360：贷款详情页单次往返查询（同合同贷款、还款计划、还款记录、逾期状态、客户），
+  进程内 LRU 缓存（带 TTL），按 (spv_id, loan_id, stat_date) 命中
 """
+import copy
 import json
 import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, date
 from decimal import Decimal
 
 BASE_DIR = os.path.dirname(__file__)
 SCHEMA_PATH = os.path.join(BASE_DIR, "config", "query_schema.json")
+# loan-360 进程内 LRU 条数与有效期（秒）；stat_date 在键中，新数据日自然换键，
+# 同一数据日重刷（还款记录、客户信息更新）由 TTL 兜底
+LOAN_360_CACHE_SIZE = int(os.getenv("LOAN_360_CACHE_SIZE", "256") or 256)
+LOAN_360_CACHE_TTL = float(os.getenv("LOAN_360_CACHE_TTL", "300") or 300)
+
+_loan_360_cache = OrderedDict()  # (spv_id, loan_id, stat_date) -> (写入时间 monotonic, result)
+_loan_360_lock = threading.Lock()
 
 from kn_data_utils import serialize_for_json
 
@@ -26,6 +39,45 @@ def get_db():
         return None
 
 
+def _schedule_from_jsonb(term_months, rs_json, sched_cfg, sched_cols):
+    """raw_loan.repayment_schedule（jsonb）-> 按期次补齐的还款计划（缺失期次各字段为 None）"""
+    jsonb_path = sched_cfg.get("jsonb_path", "schedule")
+    keys = sched_cfg.get("jsonb_keys", {"period_no": "term", "due_date": "due_date", "principal_due": "principal", "interest_due": "interest", "total_due": "total"})
+    schedule_arr = (rs_json or {}).get(jsonb_path, []) if isinstance(rs_json, dict) else []
+    sched_by_term = {}
+    for elem in schedule_arr:
+        if not isinstance(elem, dict):
+            continue
+        t = elem.get(keys["period_no"])
+        if t is not None:
+            try:
+                term_no = int(t)
+            except (TypeError, ValueError):
+                continue
+            sched_by_term[term_no] = {
+                "period_no": term_no,
+                "due_date": elem.get(keys["due_date"]),
+                "principal_due": elem.get(keys["principal_due"]),
+                "interest_due": elem.get(keys["interest_due"]),
+                "total_due": elem.get(keys["total_due"]),
+            }
+    total_periods = None
+    if term_months is not None:
+        try:
+            total_periods = int(term_months)
+        except (TypeError, ValueError):
+            pass
+    if total_periods is None and sched_by_term:
+        total_periods = max(sched_by_term.keys())
+    if total_periods is None:
+        total_periods = 1
+    schedule = []
+    for i in range(1, total_periods + 1):
+        rec = sched_by_term.get(i) or {"period_no": i, "due_date": None, "principal_due": None, "interest_due": None, "total_due": None}
+        schedule.append({k: serialize_for_json(rec.get(k)) for k in sched_cols})
+    return schedule
+
+
 def _get_schedule_for_loan(cur, loan_id, schema):
     """获取单个 loan 的还款计划"""
     sched_cfg = schema.get("repayment_schedule", {})
@@ -34,8 +86,6 @@ def _get_schedule_for_loan(cur, loan_id, schema):
     if sched_cfg.get("source") == "jsonb":
         sched_table = sched_cfg.get("table", "raw_loan")
         jsonb_col = sched_cfg.get("jsonb_column", "repayment_schedule")
-        jsonb_path = sched_cfg.get("jsonb_path", "schedule")
-        keys = sched_cfg.get("jsonb_keys", {"period_no": "term", "due_date": "due_date", "principal_due": "principal", "interest_due": "interest", "total_due": "total"})
         id_col = schema.get("loan", {}).get("id_column", "loan_id")
         cur.execute(
             f"SELECT term_months, {jsonb_col} FROM {sched_table} WHERE {id_col} = %s",
@@ -43,38 +93,7 @@ def _get_schedule_for_loan(cur, loan_id, schema):
         )
         row = cur.fetchone()
         if row:
-            term_months, rs_json = row[0], row[1]
-            schedule_arr = (rs_json or {}).get(jsonb_path, []) if isinstance(rs_json, dict) else []
-            sched_by_term = {}
-            for elem in schedule_arr:
-                if not isinstance(elem, dict):
-                    continue
-                t = elem.get(keys["period_no"])
-                if t is not None:
-                    try:
-                        term_no = int(t)
-                    except (TypeError, ValueError):
-                        continue
-                    sched_by_term[term_no] = {
-                        "period_no": term_no,
-                        "due_date": elem.get(keys["due_date"]),
-                        "principal_due": elem.get(keys["principal_due"]),
-                        "interest_due": elem.get(keys["interest_due"]),
-                        "total_due": elem.get(keys["total_due"]),
-                    }
-            total_periods = None
-            if term_months is not None:
-                try:
-                    total_periods = int(term_months)
-                except (TypeError, ValueError):
-                    pass
-            if total_periods is None and sched_by_term:
-                total_periods = max(sched_by_term.keys())
-            if total_periods is None:
-                total_periods = 1
-            for i in range(1, total_periods + 1):
-                rec = sched_by_term.get(i) or {"period_no": i, "due_date": None, "principal_due": None, "interest_due": None, "total_due": None}
-                schedule.append({k: serialize_for_json(rec.get(k)) for k in sched_cols})
+            schedule = _schedule_from_jsonb(row[0], row[1], sched_cfg, sched_cols)
     else:
         sched_table = sched_cfg.get("table", "loan_repayment_schedule")
         sched_loan_col = sched_cfg.get("loan_id_column", "loan_id")
@@ -173,6 +192,175 @@ def query_loan_detail(loan_id: str, spv_id: str = None):
         return {"error": str(e)}
 
 
+def _loan_360_sql(schema, calc_table=None, spv_id=None):
+    """
+    单条查询：目标 loan -> 同合同全部 loan（含 jsonb 还款计划）、其还款记录、目标 loan 在 stat_date 的逾期状态、客户
+    各部分以 json 聚合为一行；calc_table 为 None 时逾期状态列为 NULL
+    spv_id 为空时不按 spv 过滤（与 query_loan_detail 一致）
+    参数顺序: [loan_id, (spv_id), (spv_id), (loan_id, (spv_id), stat_date)]，见 _loan_360_params
+    """
+    loan_cfg = schema.get("loan", {})
+    loan_table = loan_cfg.get("table", "raw_loan")
+    id_col = loan_cfg.get("id_column", "loan_id")
+    cols = loan_cfg.get("columns", ["loan_id", "disbursement_time", "disbursement_amount", "term_months", "loan_maturity_date", "customer_id", "contract_no", "spv_id"])
+    sched_cfg = schema.get("repayment_schedule", {})
+    jsonb_col = sched_cfg.get("jsonb_column", "repayment_schedule")
+    rec_cfg = schema.get("repayment_records", {})
+    rec_table = rec_cfg.get("table", "raw_repayment")
+    rec_loan_col = rec_cfg.get("loan_id_column", "loan_id")
+    rec_cols = rec_cfg.get("columns", ["repayment_type", "repayment_term", "repayment_date", "total_repayment", "principal_repayment", "interest_repayment", "penalty_repayment", "extension_fee", "waiver_amount", "repayment_txn_id", "is_settled"])
+    order_col = rec_cfg.get("order_column", "repayment_date")
+
+    loan_obj = ", ".join(f"'{c}', l.{c}" for c in cols)
+    rec_obj = ", ".join(f"'{c}', p.{c}" for c in rec_cols)
+    spv_filter = " AND spv_id = %s" if spv_id else ""
+    loans_spv_filter = " AND l.spv_id = %s" if spv_id else ""
+    calc_spv_filter = " AND c.spv_id = %s" if spv_id else ""
+    overdue = "NULL"
+    if calc_table:
+        overdue = f"""(SELECT json_build_object('dpd', c.dpd, 'loan_status', c.loan_status, 'outstanding_principal', c.outstanding_principal)
+               FROM {calc_table} c WHERE c.loan_id = %s{calc_spv_filter} AND c.stat_date = %s LIMIT 1)"""
+    return f"""
+        WITH target AS (
+            SELECT {id_col} AS loan_id, contract_no, customer_id FROM {loan_table} WHERE {id_col} = %s{spv_filter} LIMIT 1
+        ), loans AS (
+            SELECT l.* FROM {loan_table} l, target t
+            WHERE (l.{id_col} = t.loan_id OR (COALESCE(t.contract_no, '') <> '' AND l.contract_no = t.contract_no)){loans_spv_filter}
+        )
+        SELECT
+            (SELECT json_agg(json_build_object({loan_obj}, '_term_months', l.term_months, '_schedule', l.{jsonb_col})
+                             ORDER BY l.disbursement_time NULLS LAST, l.{id_col}) FROM loans l) AS loans,
+            (SELECT json_agg(json_build_object('_loan_id', p.{rec_loan_col}, {rec_obj}) ORDER BY p.{order_col}, p.repayment_term)
+               FROM {rec_table} p WHERE p.{rec_loan_col} IN (SELECT {id_col} FROM loans)) AS records,
+            {overdue} AS overdue,
+            (SELECT row_to_json(cu) FROM raw_customer cu WHERE cu.customer_id = (SELECT customer_id FROM target) LIMIT 1) AS customer
+    """
+
+
+def _loan_360_params(loan_id: str, spv_id: str = None, stat_date: str = None) -> list:
+    spv_params = [spv_id] if spv_id else []
+    params = [loan_id] + spv_params + spv_params
+    if stat_date:
+        params += [loan_id] + spv_params + [stat_date[:10]]
+    return params
+
+
+def _loan_360_fetch(loan_id: str, spv_id: str = None, stat_date: str = None):
+    """执行 loan-360 查询；仅当 stat_date 所在 calc_overdue 分区不存在时去掉逾期部分重试，其他错误照常返回"""
+    from psycopg2 import errors as pg_errors
+    from kn_data_utils import get_calc_table
+    schema = load_schema()
+    sched_cfg = schema.get("repayment_schedule", {})
+    if sched_cfg.get("source") != "jsonb":
+        return None  # 非 jsonb 还款计划表无法并入单条查询
+    conn = get_db()
+    if not conn:
+        return {"error": "数据库未配置或连接失败，请检查 .env 配置"}
+    try:
+        cur = conn.cursor()
+        try:
+            row = None
+            if stat_date:
+                try:
+                    cur.execute(_loan_360_sql(schema, get_calc_table(stat_date), spv_id),
+                                _loan_360_params(loan_id, spv_id, stat_date))
+                    row = cur.fetchone()
+                except pg_errors.UndefinedTable:
+                    conn.rollback()
+                    stat_date = None
+            if stat_date is None:
+                cur.execute(_loan_360_sql(schema, spv_id=spv_id), _loan_360_params(loan_id, spv_id))
+                row = cur.fetchone()
+        finally:
+            cur.close()
+            conn.close()
+    except Exception as e:
+        return {"error": str(e)}
+
+    loans_json, records_json, overdue_json, customer_json = row or (None, None, None, None)
+    if not loans_json:
+        return {"error": f"未找到 Loan ID: {loan_id}"}
+    loan_cols = schema.get("loan", {}).get("columns", ["loan_id", "disbursement_time", "disbursement_amount", "term_months", "loan_maturity_date", "customer_id", "contract_no", "spv_id"])
+    sched_cols = sched_cfg.get("columns", ["period_no", "due_date", "principal_due", "interest_due", "total_due"])
+    records_by_loan = {}
+    for r in records_json or []:
+        lid = r.pop("_loan_id", None)
+        records_by_loan.setdefault(lid, []).append(r)
+    loans = []
+    for l in loans_json:
+        lid = l.get("loan_id")
+        loans.append({
+            "loan_id": lid,
+            "status": {k: l.get(k) for k in loan_cols},
+            "schedule": _schedule_from_jsonb(l.get("_term_months"), l.get("_schedule"), sched_cfg, sched_cols),
+            "records": records_by_loan.get(lid, []),
+        })
+    target = next((l for l in loans if str(l["loan_id"]) == loan_id), loans[0])
+    contract_no = target["status"].get("contract_no")
+    overdue = {}
+    if overdue_json:
+        overdue = {"dpd": int(overdue_json.get("dpd") or 0), "loan_status": int(overdue_json.get("loan_status") or 0),
+                   "outstanding_principal": float(overdue_json.get("outstanding_principal") or 0)}
+    customer_info = {}
+    if customer_json:
+        from kn_risk_query import customer_display_fields
+        customer_info = customer_display_fields(customer_json)
+    return {
+        "contract_no": contract_no if contract_no not in (None, "") else "-",
+        "loans": loans,
+        "overdue": overdue,
+        "customer_info": customer_info,
+        "stat_date": stat_date[:10] if stat_date else None,
+    }
+
+
+def query_loan_360(loan_id: str, spv_id: str, stat_date: str = None):
+    """
+    贷款详情（loan-360）：一次往返获取同合同 loan、还款计划、还款记录、逾期状态（stat_date，默认缓存最新数据日）与客户信息
+    结果按 (spv_id, loan_id, stat_date) 进 LRU（LOAN_360_CACHE_SIZE 条，LOAN_360_CACHE_TTL 秒过期），返回副本，调用方可修改
+    返回: { contract_no, loans: [{ loan_id, status, schedule, records }], overdue, customer_info, stat_date }
+          或 { error: str }；还款计划非 jsonb 配置时返回 None（调用方回退 query_loan_detail）
+    """
+    loan_id = (loan_id or "").strip()
+    if not loan_id:
+        return {"error": "请输入 Loan ID"}
+    if not stat_date:
+        from kn_risk_query import resolve_latest_stat_date
+        stat_date = resolve_latest_stat_date(spv_id)
+    key = (spv_id, loan_id, (stat_date or "")[:10])
+    now = time.monotonic()
+    with _loan_360_lock:
+        cached = None
+        hit = _loan_360_cache.get(key)
+        if hit is not None:
+            if now - hit[0] < LOAN_360_CACHE_TTL:
+                cached = hit[1]
+                _loan_360_cache.move_to_end(key)
+            else:
+                _loan_360_cache.pop(key, None)
+    _record_cache("memory", cached is not None)
+    if cached is not None:
+        return copy.deepcopy(cached)
+
+    result = _loan_360_fetch(loan_id, spv_id, stat_date)
+    if result is None or result.get("error"):
+        return result
+    with _loan_360_lock:
+        _loan_360_cache[key] = (now, copy.deepcopy(result))
+        _loan_360_cache.move_to_end(key)
+        while len(_loan_360_cache) > LOAN_360_CACHE_SIZE:
+            _loan_360_cache.popitem(last=False)
+    return result
+
+
+def _record_cache(layer: str, hit: bool):
+    try:
+        from kn_metrics import record_cache
+        record_cache(layer, hit)
+    except Exception:
+        pass
+
+
 def query_daily_disbursements(query_date: str):
     """
     查询某一天的所有新增放款
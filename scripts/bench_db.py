@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+数据库基准测试 - 在本地 PostgreSQL 合成数据（scripts/bench_synthetic_data.py）上计时核心计算，并与基线比较
+
+计时项（每个 bench_ 生产商各执行一次，合计为一轮；重复 --repeat 轮取中位数）：
+- query_kn_core_metrics / compute_vintage_data / compute_collection_report
+- compute_revenue_data / compute_cashflow_forecast
+- full_refresh：refresh_producer_full_cache 全流程（共享中间结果、并发生产商、发布），缓存写入临时目录
+
+基线：scripts/bench_results/db_baseline_<规模>.json（--save-baseline 写入，随代码提交）；
+中位数比基线慢超过 --threshold（默认 20%）记为回归，退出码 1。每次结果另追加到 db_history.jsonl（不提交）。
+
+运行：
+  cd RT_RISK
+  python3 scripts/bench_synthetic_data.py --scale 100k           # 先生成数据
+  python3 scripts/bench_db.py --scale 100k --save-baseline       # 记录基线
+  python3 scripts/bench_db.py --scale 100k                       # 改动后比较
+  python3 scripts/bench_db.py --scale 100k --seed                # 生成数据后直接测
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BASE, "scripts", "bench_results")
+
+CASES = ["query_kn_core_metrics", "compute_vintage_data", "compute_collection_report",
+         "compute_revenue_data", "compute_cashflow_forecast", "full_refresh"]
+
+
+def _prepare_env(dsn: str, cache_dir: str):
+    """须在导入业务模块前设置：数据库、独立缓存目录、关闭变更跳过（每轮都完整计算）"""
+    os.environ["DATABASE_URL"] = dsn
+    # .env 中的 DB_HOST_IP / DB_PORT 会覆盖 DSN 的 host/port；置空后 load_dotenv 不再写入
+    os.environ["DB_HOST_IP"] = ""
+    os.environ["DB_PORT"] = ""
+    os.environ["RT_RISK_CACHE_DIR"] = cache_dir
+    os.environ["REFRESH_SKIP_UNCHANGED"] = "0"
+    os.environ.pop("BLOB_READ_WRITE_TOKEN", None)
+    os.environ.pop("VERCEL", None)
+
+
+def _bench_meta():
+    from db_connect import get_connection
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT key, value FROM bench_meta")
+        return dict(cur.fetchall())
+    except Exception:
+        conn.rollback()
+        return {}
+    finally:
+        cur.close()
+        conn.close()
+
+
+def _spv_ids():
+    from db_connect import get_connection
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT spv_id FROM spv_config WHERE spv_id LIKE 'bench_%' ORDER BY spv_id")
+        return [r[0] for r in cur.fetchall()]
+    finally:
+        cur.close()
+        conn.close()
+
+
+def _case_fn(name, stat_date):
+    """返回 fn(spv_id)；full_refresh 返回不带参数的函数"""
+    if name == "query_kn_core_metrics":
+        from kn_risk_query import query_kn_core_metrics
+        return lambda sid: query_kn_core_metrics(stat_date, sid)
+    if name == "compute_vintage_data":
+        from kn_vintage import compute_vintage_data
+        return lambda sid: compute_vintage_data(sid, stat_date)
+    if name == "compute_collection_report":
+        from kn_collection import compute_collection_report
+        return lambda sid: compute_collection_report(sid, stat_date)
+    if name == "compute_revenue_data":
+        from kn_revenue import compute_revenue_data
+        return compute_revenue_data
+    if name == "compute_cashflow_forecast":
+        from kn_cashflow import compute_cashflow_forecast
+        return compute_cashflow_forecast
+    if name == "full_refresh":
+        def _full():
+            from kn_producer_cache import refresh_producer_full_cache
+            r = refresh_producer_full_cache(triggered_by="bench", time_budget=0)
+            if r.get("error"):
+                raise RuntimeError(r["error"])
+        return _full
+    raise KeyError(name)
+
+
+def run_cases(cases, spv_ids, stat_date, repeat: int, log=print) -> dict:
+    """各计时项：{ name: { median, min, runs: [...] } }（秒）"""
+    out = {}
+    for name in cases:
+        fn = _case_fn(name, stat_date)
+        runs = []
+        for i in range(repeat):
+            t0 = time.perf_counter()
+            if name == "full_refresh":
+                fn()
+            else:
+                for sid in spv_ids:
+                    fn(sid)
+            runs.append(time.perf_counter() - t0)
+        out[name] = {"median": statistics.median(runs), "min": min(runs), "runs": [round(r, 4) for r in runs]}
+        log(f"  {name:<28} 中位数 {out[name]['median']:8.3f}s  最快 {out[name]['min']:8.3f}s")
+    return out
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """与基线比较：[(name, cur, base, ratio, 状态)]，状态为 REGRESSION / faster / ok / new"""
+    rows = []
+    base_cases = (baseline or {}).get("cases") or {}
+    for name, r in results.items():
+        b = (base_cases.get(name) or {}).get("median")
+        if not b:
+            rows.append((name, r["median"], None, None, "new"))
+            continue
+        ratio = r["median"] / b
+        status = "REGRESSION" if ratio > 1 + threshold else ("faster" if ratio < 1 - threshold else "ok")
+        rows.append((name, r["median"], b, ratio, status))
+    return rows
+
+
+def _baseline_path(scale: str) -> str:
+    return os.path.join(RESULTS_DIR, f"db_baseline_{scale}.json")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="数据库基准测试（本地合成数据）")
+    ap.add_argument("--dsn", default=os.getenv("BENCH_DATABASE_URL", "postgresql://localhost/rt_risk_bench"))
+    ap.add_argument("--scale", default="10k", help="基线按规模区分：10k / 100k / 1m / 5m 或数字")
+    ap.add_argument("--seed", action="store_true", help="先用 bench_synthetic_data 重新生成数据")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--cases", default=",".join(CASES), help="逗号分隔的计时项")
+    ap.add_argument("--threshold", type=float, default=0.2, help="回归判定阈值（相对基线变慢比例）")
+    ap.add_argument("--baseline", default=None, help="基线文件（默认 scripts/bench_results/db_baseline_<规模>.json）")
+    ap.add_argument("--save-baseline", action="store_true", help="把本次结果写为基线")
+    args = ap.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix="rt_risk_bench_")
+    _prepare_env(args.dsn, cache_dir)
+    from bench_synthetic_data import parse_scale, seed
+    scale = args.scale.lower()
+    if args.seed:
+        print(f"生成合成数据：{parse_scale(scale)} 笔贷款")
+        seed(args.dsn, parse_scale(scale))
+
+    meta = _bench_meta()
+    if not meta:
+        raise SystemExit("未找到 bench_meta，请先运行 scripts/bench_synthetic_data.py 生成数据")
+    if int(meta.get("loans") or 0) != parse_scale(scale):
+        print(f"警告：库中数据为 {meta.get('loans')} 笔，与 --scale {scale} 不一致")
+    stat_date = meta.get("as_of")
+    spv_ids = _spv_ids()
+    cases = [c.strip() for c in args.cases.split(",") if c.strip()]
+    print(f"规模 {scale}（{meta.get('loans')} 笔，seed {meta.get('seed')}），stat_date {stat_date}，"
+          f"生产商 {', '.join(spv_ids)}，重复 {args.repeat} 次")
+    results = run_cases(cases, spv_ids, stat_date, args.repeat)
+
+    record = {"scale": scale, "loans": int(meta.get("loans") or 0), "seed": meta.get("seed"),
+              "at": datetime.now().isoformat(timespec="seconds"), "repeat": args.repeat, "cases": results}
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(os.path.join(RESULTS_DIR, "db_history.jsonl"), "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    baseline_path = args.baseline or _baseline_path(scale)
+    if args.save_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+        print(f"基线已写入 {baseline_path}")
+        return 0
+    if not os.path.isfile(baseline_path):
+        print(f"无基线 {baseline_path}，用 --save-baseline 记录")
+        return 0
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\n对比基线（{baseline.get('at')}，阈值 ±{args.threshold:.0%}）")
+    regressions = 0
+    for name, cur, base, ratio, status in compare(results, baseline, args.threshold):
+        if base is None:
+            print(f"  {name:<28} {cur:8.3f}s  （基线无此项）")
+            continue
+        print(f"  {name:<28} {cur:8.3f}s  基线 {base:8.3f}s  {(ratio - 1) * 100:+6.1f}%  {status}")
+        regressions += status == "REGRESSION"
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
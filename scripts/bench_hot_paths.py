@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+页面热路径微基准（不访问数据库）- 每次页面访问都会执行的纯 Python 代码，在 10 / 100 / 1000 生产商夹具上计时
+
+计时项：
+- load_producer_full_cache：manifest + 全部分片 JSON 解析（每次清空进程内缓存，即冷读）
+- load_risk_cache_usd：单独风控缓存读取 + USD 视图换算（risk_data_to_usd）
+- build_loans_from_rows：下钻列表行 -> loan dict（kn_risk_query._build_loans_from_rows）
+- portfolio_stats：下钻页统计（app._portfolio_stats）
+- aggregate_producer_data：生产商拓展列表聚合（app._aggregate_producer_data）
+- json_to_excel_rows：Excel 导出行构建（app._json_to_excel_rows）
+- partner_manage：生产商管理页逐生产商循环（PM 身份，仅读缓存，经 Flask test client 完整请求）
+- render_partner_risk：partner_risk.html 模板渲染（大 risk_data）
+
+计时方式与 timeit.autorange 相同：自动选择每组调用次数使单组 >= 0.2 秒，取 --repeat 组的每次调用中位数。
+结果追加到 scripts/bench_results/hot_paths_history.jsonl（含 git 提交号），并与上一次同规模结果对比。
+若运行中出现数据库连接尝试，会在结果中标记（这些路径不应访问 DB）。
+
+运行：cd RT_RISK && python3 scripts/bench_hot_paths.py --scales 10,100,1000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BASE, "scripts", "bench_results")
+HISTORY_FILE = os.path.join(RESULTS_DIR, "hot_paths_history.jsonl")
+_MIN_SAMPLE_SECONDS = 0.2
+
+_db_attempts = 0
+
+
+def _count_db_attempts():
+    """包装 db_connect.get_connection，统计连接尝试（夹具数据库不可达，尝试即失败）"""
+    import db_connect
+    orig = db_connect.get_connection
+
+    def _counting():
+        global _db_attempts
+        _db_attempts += 1
+        return orig()
+    db_connect.get_connection = _counting
+
+
+def measure(fn, repeat: int) -> dict:
+    """autorange：单组耗时 >= 0.2s 的调用次数；返回每次调用耗时（秒）的中位数 / 最小值"""
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - t0 >= _MIN_SAMPLE_SECONDS or number >= 10_000:
+            break
+        number *= 2 if number < 8 else 5
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - t0) / number)
+    return {"median": statistics.median(samples), "min": min(samples), "number": number}
+
+
+def _loan_rows(n, rng):
+    return [(f"L{i:08d}", rng.uniform(100, 5000), datetime(2025, 1 + i % 12, 1 + i % 28), rng.choice((1, 3, 6, 12)),
+             rng.uniform(0.001, 0.004), rng.choice(("1", "2")), rng.choice("ABCDE"), rng.choice((0, 0, 0, 5, 40)),
+             rng.uniform(0, 5000), rng.choice((1, 1, 2))) for i in range(n)]
+
+
+def _feishu_records(n, rng):
+    return [{"name": f"生产商{i}", "region": rng.choice(("拉美", "东南亚", "非洲")),
+             "region_detail": rng.choice(("墨西哥", "印尼", "菲律宾", "尼日利亚", "肯尼亚")),
+             "industry": rng.choice(("消费金融", "小微", "供应链")), "maturity": rng.choice(("早期", "成熟")),
+             "scenario": rng.choice(("线上", "线下")), "type": rng.choice(("PL", "MCA", "BNPL"))} for i in range(n)]
+
+
+def build_cases(scale: int, producers: dict):
+    """返回 [(name, fn)]；夹具已写入当前 RT_RISK_CACHE_DIR"""
+    import app as app_module
+    import kn_producer_cache as pc
+    from kn_risk_cache import load_risk_cache, risk_data_to_usd
+    from kn_risk_query import _build_loans_from_rows
+    from flask import render_template
+
+    rng = random.Random(7)
+    first = next(iter(producers.values()))
+    loan_rows = _loan_rows(scale * 20, rng)
+    loans = _build_loans_from_rows(loan_rows)
+    records = _feishu_records(scale * 5, rng)
+    excel_rows = [row for p in producers.values() for row in p["risk_data"][:3]]
+    big_risk = [row for p in list(producers.values())[:max(1, scale // 10)] for row in p["risk_data"]]
+
+    def cold_full_cache():
+        pc._manifest_memory = None
+        pc._shard_memory.clear()
+        pc.load_producer_full_cache()
+
+    def risk_usd():
+        data, _ = load_risk_cache(first["id"])
+        risk_data_to_usd(data, first["exchange_rate"])
+
+    client = app_module.app.test_client()
+    with client.session_transaction() as s:
+        s["user"] = {"username": "pm", "role": "project_manager", "name": "PM",
+                     "permissions": ["apply_partner", "manage_partners", "apply_transactions"]}
+
+    def partner_manage():
+        r = client.get("/partner/manage")
+        assert r.status_code == 200, r.status_code
+
+    user = {"username": "pm", "role": "project_manager", "role_label": "PM", "display_name": "PM",
+            "permissions": ["manage_partners"]}
+    partner = {"id": first["id"], "name": first["name"], "country": first["region"], "product_type": "PL",
+               "status": "active", "local_currency": first["currency"], "exchange_rate": first["exchange_rate"],
+               "alerts": []}
+
+    def render_risk():
+        with app_module.app.test_request_context("/partner/x/risk"):
+            render_template("partner_risk.html", user=user, partner=partner, risk_data=big_risk, alerts=[],
+                            priority_indicators=first["priority_indicators"], local_currency=first["currency"],
+                            exchange_rate=first["exchange_rate"], cache_last_updated=None, use_risk_cache=True,
+                            data_source="cache")
+
+    return [
+        ("load_producer_full_cache", cold_full_cache),
+        ("load_risk_cache_usd", risk_usd),
+        ("build_loans_from_rows", lambda: _build_loans_from_rows(loan_rows)),
+        ("portfolio_stats", lambda: app_module._portfolio_stats(loans)),
+        ("aggregate_producer_data", lambda: app_module._aggregate_producer_data(records)),
+        ("json_to_excel_rows", lambda: app_module._json_to_excel_rows(excel_rows)),
+        ("partner_manage", partner_manage),
+        ("render_partner_risk", render_risk),
+    ]
+
+
+def _git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BASE,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def _previous(scale: int):
+    """历史中同规模的上一条结果"""
+    if not os.path.isfile(HISTORY_FILE):
+        return None
+    prev = None
+    with open(HISTORY_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if rec.get("scale") == scale:
+                prev = rec
+    return prev
+
+
+def run_scale(scale: int, repeat: int, only=None, risk_days: int = 30) -> dict:
+    """在子进程中运行：每个规模使用独立夹具目录与全新的模块状态"""
+    from bench_fixtures import prepare_env, build_fixture_cache
+    cache_dir = tempfile.mkdtemp(prefix=f"rt_risk_hot_{scale}_")
+    prepare_env(cache_dir)
+    import logging
+    logging.disable(logging.WARNING)
+    try:
+        producers = build_fixture_cache(scale, risk_days)
+        _count_db_attempts()
+        results = {}
+        for name, fn in build_cases(scale, producers):
+            if only and name not in only:
+                continue
+            before = _db_attempts
+            results[name] = measure(fn, repeat)
+            if _db_attempts != before:
+                results[name]["db_attempts"] = _db_attempts - before
+        return results
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="页面热路径微基准（无数据库）")
+    ap.add_argument("--scales", default="10,100,1000", help="生产商数量，逗号分隔")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--cases", default="", help="只运行指定计时项（逗号分隔）")
+    ap.add_argument("--risk-days", type=int, default=30, help="每个生产商 risk_data 天数")
+    ap.add_argument("--no-save", action="store_true", help="不写入历史")
+    ap.add_argument("--_child", type=int, default=None, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    only = {c.strip() for c in args.cases.split(",") if c.strip()} or None
+
+    if args._child is not None:
+        # 子进程：输出 JSON 结果
+        print(json.dumps(run_scale(args._child, args.repeat, only, args.risk_days)))
+        return 0
+
+    rev = _git_rev()
+    for scale in [int(s) for s in args.scales.split(",") if s.strip()]:
+        cmd = [sys.executable, os.path.abspath(__file__), "--_child", str(scale), "--repeat", str(args.repeat),
+               "--risk-days", str(args.risk_days)]
+        if args.cases:
+            cmd += ["--cases", args.cases]
+        out = subprocess.run(cmd, capture_output=True, text=True, cwd=BASE)
+        if out.returncode != 0:
+            print(out.stderr[-2000:])
+            return out.returncode
+        results = json.loads(out.stdout.strip().splitlines()[-1])
+        prev = _previous(scale)
+        prev_cases = (prev or {}).get("cases") or {}
+        print(f"\n规模 {scale} 个生产商" + (f"（对比 {prev.get('git')} @ {prev.get('at')}）" if prev else ""))
+        for name, r in results.items():
+            line = f"  {name:<26} {r['median'] * 1000:10.3f} ms  (x{r['number']})"
+            old = (prev_cases.get(name) or {}).get("median")
+            if old:
+                line += f"  {(r['median'] / old - 1) * 100:+6.1f}%"
+            if r.get("db_attempts"):
+                line += f"  !! 访问了数据库 {r['db_attempts']} 次"
+            print(line)
+        if not args.no_save:
+            os.makedirs(RESULTS_DIR, exist_ok=True)
+            with open(HISTORY_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"scale": scale, "git": rev, "at": datetime.now().isoformat(timespec="seconds"),
+                                    "repeat": args.repeat, "cases": results}, ensure_ascii=False) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+压测 - 用缓存夹具启动应用，多个虚拟用户并发回放真实访问组合，输出各路由吞吐与 p50/p95/p99
+
+- 用户：config/users.json 中指定角色的账号（默认 investor / project_manager，即只读缓存的角色），每个虚拟用户独立会话登录
+- 访问组合（权重见 MIX）：dashboard、生产商列表（PM）/ 投资组合（Investor）、风控 / 收益 / 现金流 Tab、
+  下钻分页（vintage / DPD / 到期月，第 1-3 页）、Excel 下载；按角色权限生成，各用户只访问 config/producers.json 中可见的生产商
+- 应用：默认在子进程中以 threaded 模式启动（单实例），缓存目录为临时夹具（scripts/bench_fixtures.py），
+  夹具前几个生产商使用 producers.json 中的 id，其余 fx0000 ... 只用于撑大统一缓存与列表页；
+  数据库默认指向不可达地址（下钻查询立即失败后走 JSON 回退），--dsn 指定替身库时下钻对该库执行真实分页查询（替身库的 spv_id 需与 producers.json 一致）
+- --url 压测已运行的实例（需以 RT_RISK_CACHE_DIR 指向同参数生成的夹具目录启动）
+- 结果追加到 scripts/bench_results/load_history.jsonl
+
+运行：
+  cd RT_RISK
+  python3 scripts/bench_load.py --users 20 --duration 60
+  python3 scripts/bench_load.py --users 50 --duration 120 --dsn postgresql://localhost/rt_risk_bench
+"""
+import argparse
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BASE, "scripts", "bench_results")
+
+# 路由 -> 权重（每次请求按权重随机选择）
+MIX = {
+    "dashboard": 10,
+    "partner_list": 15,
+    "portfolio": 15,
+    "risk_tab": 20,
+    "revenue_tab": 10,
+    "cashflow_tab": 10,
+    "drill_vintage": 8,
+    "drill_dpd": 8,
+    "drill_maturity": 6,
+    "excel_download": 3,
+}
+_DPD_BUCKETS = ["M1", "M2", "M3", "M6+"]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _load_users(roles) -> list:
+    """指定角色的用户，附带角色权限"""
+    with open(os.path.join(BASE, "config", "users.json"), "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    perms = {r: set(v.get("permissions", [])) for r, v in cfg.get("roles", {}).items()}
+    return [dict(u, permissions=perms.get(u.get("role"), set())) for u in cfg.get("users", []) if u.get("role") in roles]
+
+
+def _json_producer_ids() -> list:
+    """config/producers.json 中的生产商（Excel 下载按此校验生产商）"""
+    try:
+        with open(os.path.join(BASE, "config", "producers.json"), "r", encoding="utf-8") as f:
+            return list(json.load(f).get("producers", {}).keys())
+    except Exception:
+        return []
+
+
+def build_targets(producers: dict, partner_ids, permissions) -> dict:
+    """某角色各路由可选的 URL 列表（下钻月份取自夹具的 vintage / 催收数据）"""
+    ids = [i for i in partner_ids if i in producers]
+    t = {"dashboard": ["/dashboard"],
+         "partner_list": ["/partner/manage"] if "manage_partners" in permissions else [],
+         "portfolio": ["/portfolio"] if "view_portfolio" in permissions else [],
+         "risk_tab": [f"/partner/{i}/risk" for i in ids],
+         "revenue_tab": [f"/partner/{i}/revenue" for i in ids],
+         "cashflow_tab": [f"/partner/{i}/cashflow" for i in ids],
+         "drill_vintage": [], "drill_dpd": [], "drill_maturity": [],
+         "excel_download": [f"/api/partner/{i}/download-excel" for i in ids]}
+    for pid in ids:
+        latest = (producers[pid].get("risk_data") or [{}])[0]
+        for v in (latest.get("vintage_data") or [])[-6:]:
+            for page in (1, 2, 3):
+                t["drill_vintage"].append(f"/partner/{pid}/vintage/{v['disbursement_month']}?page={page}")
+        for b in _DPD_BUCKETS:
+            for page in (1, 2, 3):
+                t["drill_dpd"].append(f"/partner/{pid}/dpd/{b}?page={page}")
+        for c in (latest.get("collection_report") or [])[-6:]:
+            t["drill_maturity"].append(f"/partner/{pid}/maturity/{c['maturity_month']}?page=1")
+    return {k: v for k, v in t.items() if v}
+
+
+def start_server(port: int, log_path: str):
+    """以 threaded 模式启动应用（继承当前环境变量），等待 /login 可访问"""
+    import requests
+    code = f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True, debug=False, use_reloader=False)"
+    log = open(log_path, "w")
+    proc = subprocess.Popen([sys.executable, "-c", code], cwd=BASE, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"应用启动失败，日志见 {log_path}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/login", timeout=2)
+            return proc
+        except Exception:
+            time.sleep(0.3)
+    proc.terminate()
+    raise SystemExit(f"应用 60 秒内未就绪，日志见 {log_path}")
+
+
+def _percentile(sorted_vals, p):
+    """最近秩百分位"""
+    if not sorted_vals:
+        return 0.0
+    k = math.ceil(p / 100 * len(sorted_vals)) - 1
+    return sorted_vals[max(0, min(len(sorted_vals) - 1, k))]
+
+
+class _VirtualUser(threading.Thread):
+    def __init__(self, base_url, user, targets, deadline, warmup_until, think, samples, lock, seed):
+        """targets：该用户角色的 { route: [url] }"""
+        super().__init__(daemon=True)
+        self.base_url, self.user, self.targets = base_url, user, targets
+        self.deadline, self.warmup_until, self.think = deadline, warmup_until, think
+        self.samples, self.lock = samples, lock
+        self.rng = random.Random(seed)
+        self.routes = list(targets)
+        self.weights = [MIX[r] for r in self.routes]
+
+    def _login(self, s):
+        r = s.post(self.base_url + "/api/login", json={"username": self.user["username"],
+                                                       "password": self.user["password"]}, timeout=30)
+        if not (r.ok and r.json().get("success")):
+            raise RuntimeError(f"登录失败：{self.user['username']}")
+
+    def run(self):
+        import requests
+        s = requests.Session()
+        try:
+            self._login(s)
+        except Exception as e:
+            with self.lock:
+                self.samples.append(("login", 0, 0.0, 0, str(e)))
+            return
+        while time.time() < self.deadline:
+            route = self.rng.choices(self.routes, self.weights)[0]
+            url = self.base_url + self.rng.choice(self.targets[route])
+            t0 = time.perf_counter()
+            err = None
+            try:
+                r = s.get(url, timeout=120, allow_redirects=False)
+                status, size = r.status_code, len(r.content)
+            except Exception as e:
+                status, size, err = 0, 0, type(e).__name__
+            elapsed = time.perf_counter() - t0
+            if time.time() >= self.warmup_until:
+                with self.lock:
+                    self.samples.append((route, status, elapsed, size, err))
+            if self.think:
+                time.sleep(self.rng.uniform(0, 2 * self.think))
+
+
+def report(samples, seconds: float) -> dict:
+    """{ route: { count, errors, rps, p50, p95, p99, mean, max, avg_bytes } }，另含 _total"""
+    by_route = {}
+    for route, status, elapsed, size, err in samples:
+        by_route.setdefault(route, []).append((status, elapsed, size, err))
+    out = {}
+    for route, rows in sorted(by_route.items()) + [("_total", [r for v in by_route.values() for r in v])]:
+        lat = sorted(e for _, e, _, _ in rows)
+        errors = sum(1 for st, _, _, err in rows if err or not 200 <= st < 300)
+        out[route] = {"count": len(rows), "errors": errors, "rps": round(len(rows) / seconds, 2) if seconds else 0,
+                      "p50": _percentile(lat, 50), "p95": _percentile(lat, 95), "p99": _percentile(lat, 99),
+                      "mean": sum(lat) / len(lat) if lat else 0.0, "max": lat[-1] if lat else 0.0,
+                      "avg_bytes": int(sum(sz for _, _, sz, _ in rows) / len(rows)) if rows else 0}
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="应用压测（缓存夹具 + 并发虚拟用户）")
+    ap.add_argument("--url", default=None, help="压测已运行的实例；不指定则在本机启动单实例")
+    ap.add_argument("--users", type=int, default=20, help="并发虚拟用户数")
+    ap.add_argument("--duration", type=float, default=60, help="压测时长（秒，不含预热）")
+    ap.add_argument("--warmup", type=float, default=5, help="预热时长（秒，不计入结果）")
+    ap.add_argument("--think", type=float, default=0, help="请求间平均思考时间（秒），0 为持续施压")
+    ap.add_argument("--roles", default="investor,project_manager", help="参与压测的角色，逗号分隔")
+    ap.add_argument("--producers", type=int, default=20, help="夹具生产商数量")
+    ap.add_argument("--risk-days", type=int, default=30)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--dsn", default=None, help="替身数据库（本地合成库）；不指定则数据库不可达")
+    ap.add_argument("--no-save", action="store_true", help="不写入 load_history.jsonl")
+    args = ap.parse_args()
+
+    from bench_fixtures import prepare_env, build_fixture_cache, make_producers
+    users = _load_users({r.strip() for r in args.roles.split(",") if r.strip()})
+    if not users:
+        raise SystemExit(f"config/users.json 中没有角色 {args.roles} 的用户")
+    partner_ids = _json_producer_ids()
+
+    proc = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+        producers = make_producers(args.producers, args.risk_days, args.seed, ids=partner_ids)
+    else:
+        cache_dir = tempfile.mkdtemp(prefix="rt_risk_load_")
+        prepare_env(cache_dir, db_free=not args.dsn)
+        if args.dsn:
+            os.environ["DATABASE_URL"] = args.dsn
+            os.environ["DB_HOST_IP"] = ""
+            os.environ["DB_PORT"] = ""
+        print(f"生成夹具：{args.producers} 个生产商 -> {cache_dir}")
+        producers = build_fixture_cache(args.producers, args.risk_days, args.seed, ids=partner_ids)
+        port = _free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        log_path = os.path.join(cache_dir, "server.log")
+        proc = start_server(port, log_path)
+        print(f"应用已启动：{base_url}（日志 {log_path}）")
+
+    targets = {u["role"]: build_targets(producers, partner_ids, u["permissions"]) for u in users}
+    print(f"{args.users} 个虚拟用户（{', '.join(sorted({u['username'] for u in users}))}），"
+          f"预热 {args.warmup:.0f}s + 压测 {args.duration:.0f}s，可访问生产商：{', '.join(partner_ids)}")
+    samples, lock = [], threading.Lock()
+    start = time.time()
+    warmup_until = start + args.warmup
+    deadline = warmup_until + args.duration
+    threads = [_VirtualUser(base_url, users[i % len(users)], targets[users[i % len(users)]["role"]], deadline,
+                            warmup_until, args.think, samples, lock, args.seed + i) for i in range(args.users)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    login_failures = [s for s in samples if s[0] == "login"]
+    if login_failures:
+        print(f"登录失败 {len(login_failures)} 次：{login_failures[0][4]}")
+    stats = report([s for s in samples if s[0] != "login"], args.duration)
+    print(f"\n{'路由':<16}{'请求':>8}{'错误':>7}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'平均KB':>9}")
+    for route, r in stats.items():
+        print(f"{route:<16}{r['count']:>8}{r['errors']:>7}{r['rps']:>9.1f}{r['p50'] * 1000:>10.1f}"
+              f"{r['p95'] * 1000:>10.1f}{r['p99'] * 1000:>10.1f}{r['max'] * 1000:>10.1f}{r['avg_bytes'] / 1024:>9.1f}")
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        record = {"at": datetime.now().isoformat(timespec="seconds"), "url": args.url, "users": args.users,
+                  "duration": args.duration, "think": args.think, "roles": args.roles, "producers": args.producers,
+                  "dsn": bool(args.dsn), "routes": stats}
+        with open(os.path.join(RESULTS_DIR, "load_history.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return 1 if stats.get("_total", {}).get("errors") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
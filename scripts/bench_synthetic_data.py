@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+基准测试合成数据 - 按固定随机种子生成与生产库同结构的数据，写入本地 PostgreSQL
+
+生成的表：
+- spv_config / spv_internal_params：若干 bench_ 生产商（含 config JSONB、多个 effective_date）
+- raw_customer：客户与信用评级（rating_a）
+- raw_loan：贷款与 repayment_schedule（JSONB：{"schedule": [{term, due_date, principal, interest, total}]}）
+- raw_repayment：按贷款行为（按期 / 提前结清 / 逾期 / 展期结清 / 违约）生成的还款记录
+- calc_overdue_yYYYYmMM：月末快照 + 最后 N 天的每日快照（loan_status 1 正常 / 2 逾期 / 3 当月结清）
+
+规模：10k（默认）、100k、1m、5m 笔贷款，或直接给数字；用 COPY 分批写入，5M 规模也不需整表驻留内存。
+同一 seed + 规模生成的数据完全一致，基准结果可跨次比较。
+
+仅允许写入本地数据库（localhost / 127.0.0.1 / Unix socket），会 DROP 并重建上述表。
+
+运行：cd RT_RISK && python3 scripts/bench_synthetic_data.py --dsn postgresql://localhost/rt_risk_bench --scale 100k
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "5m": 5_000_000}
+# 生产商：(spv_id, 名称, 地区, 币种, 汇率, 贷款占比)
+SPVS = [
+    ("bench_kn", "Bench KN", "墨西哥", "MXN", 17.2, 0.45),
+    ("bench_dk", "Bench Docking", "印尼", "IDR", 15800, 0.30),
+    ("bench_ph", "Bench PH", "菲律宾", "PHP", 56.5, 0.15),
+    ("bench_ng", "Bench NG", "尼日利亚", "NGN", 1500, 0.10),
+]
+_FLUSH_BYTES = 16 * 1024 * 1024
+_RATINGS = ["A", "B", "C", "D", "E"]
+
+DDL = """
+DROP TABLE IF EXISTS spv_config, spv_internal_params, raw_customer, raw_loan, raw_repayment, bench_meta;
+CREATE TABLE spv_config (
+    spv_id VARCHAR(32) PRIMARY KEY, name VARCHAR(128), region VARCHAR(64), contact VARCHAR(128),
+    product_type VARCHAR(32), onboard_date VARCHAR(32), currency VARCHAR(8) DEFAULT 'USD',
+    exchange_rate NUMERIC(18,6) DEFAULT 1, status VARCHAR(16) DEFAULT 'active', leverage_ratio VARCHAR(32),
+    priority_yield_pct NUMERIC(10,4), liquidation_line NUMERIC(10,4), margin_call_line NUMERIC(10,4),
+    baseline NUMERIC(10,4), margin_deposit NUMERIC(18,2), guarantee_deposit NUMERIC(18,2), config JSONB,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE spv_internal_params (
+    spv_id VARCHAR(32) NOT NULL, effective_date DATE NOT NULL, agreed_rate NUMERIC(10,4),
+    coverage_current NUMERIC(10,4), leverage_current NUMERIC(10,4), margin_deposit_current NUMERIC(18,2),
+    margin_deposit_required NUMERIC(18,2), guarantee_deposit_current NUMERIC(18,2),
+    guarantee_deposit_required NUMERIC(18,2), early_repayment_overdue_discount NUMERIC(10,4),
+    vtg30_predicted_default_rate NUMERIC(10,4), principal_amount NUMERIC(18,2), product_term NUMERIC(10,2),
+    PRIMARY KEY (spv_id, effective_date)
+);
+CREATE TABLE raw_customer (
+    customer_id VARCHAR(32) PRIMARY KEY, spv_id VARCHAR(32), rating_a VARCHAR(8), gender VARCHAR(8),
+    age INT, city VARCHAR(64), created_at TIMESTAMP
+);
+CREATE TABLE raw_loan (
+    loan_id VARCHAR(32) PRIMARY KEY, contract_no VARCHAR(32), spv_id VARCHAR(32), customer_id VARCHAR(32),
+    disbursement_time TIMESTAMP, disbursement_amount NUMERIC(18,2), customer_rate NUMERIC(10,6),
+    term_months INT, loan_maturity_date DATE, repayment_method INT, repayment_schedule JSONB
+);
+CREATE TABLE raw_repayment (
+    repayment_txn_id VARCHAR(40), loan_id VARCHAR(32), spv_id VARCHAR(32), repayment_type INT,
+    repayment_term INT, repayment_date DATE, total_repayment NUMERIC(18,2), principal_repayment NUMERIC(18,2),
+    interest_repayment NUMERIC(18,2), penalty_repayment NUMERIC(18,2), extension_fee NUMERIC(18,2),
+    waiver_amount NUMERIC(18,2), is_settled BOOLEAN
+);
+CREATE TABLE bench_meta (key VARCHAR(64) PRIMARY KEY, value TEXT);
+"""
+
+CALC_DDL = """
+CREATE TABLE {t} (
+    loan_id VARCHAR(32), spv_id VARCHAR(32), stat_date DATE, loan_status INT, dpd INT,
+    outstanding_principal NUMERIC(18,2)
+)
+"""
+
+# 数据加载完成后再建索引（比逐行维护索引快得多）
+INDEX_DDL = [
+    "CREATE INDEX ON raw_loan (spv_id)",
+    "CREATE INDEX ON raw_loan (contract_no)",
+    "CREATE INDEX ON raw_repayment (loan_id, repayment_term)",
+    "CREATE INDEX ON raw_repayment (spv_id, repayment_date)",
+]
+CALC_INDEX_DDL = "CREATE INDEX ON {t} (spv_id, stat_date)"
+
+
+def parse_scale(s) -> int:
+    s = str(s).strip().lower()
+    if s in SCALES:
+        return SCALES[s]
+    return int(s.replace("_", ""))
+
+
+def _add_months(d: date, n: int) -> date:
+    y, m = divmod(d.month - 1 + n, 12)
+    y, m = d.year + y, m + 1
+    last = (date(y + (m == 12), m % 12 + 1, 1) - timedelta(days=1)).day
+    return date(y, m, min(d.day, last))
+
+
+def _month_end(d: date) -> date:
+    return _add_months(date(d.year, d.month, 1), 1) - timedelta(days=1)
+
+
+def _calc_table(d: date) -> str:
+    return f"calc_overdue_y{d.year}m{d.month:02d}"
+
+
+def stat_dates(start: date, as_of: date, daily_days: int) -> list:
+    """快照日：每月月末（不晚于 as_of）+ as_of 前 daily_days 天逐日"""
+    out = set()
+    d = _month_end(start)
+    while d < as_of:
+        out.add(d)
+        d = _month_end(d + timedelta(days=1))
+    for i in range(max(1, daily_days)):
+        out.add(as_of - timedelta(days=i))
+    return sorted(out)
+
+
+def _simulate_loan(rng, amount, rate, term, method, disb: date, as_of: date):
+    """
+    生成单笔贷款的还款计划与还款记录
+    返回: (schedule, payments)；payment = (term, date, type, principal, interest, penalty, ext_fee)
+    """
+    schedule = []
+    outstanding = amount
+    per_principal = round(amount / term, 2)
+    for i in range(1, term + 1):
+        due = _add_months(disb, i)
+        interest = round(outstanding * rate * 30, 2)
+        if method == 2:
+            principal = round(outstanding, 2) if i == term else 0.0
+        else:
+            principal = round(outstanding, 2) if i == term else per_principal
+        outstanding = round(outstanding - principal, 2)
+        schedule.append({"term": i, "due_date": due.isoformat(), "principal": principal,
+                         "interest": interest, "total": round(principal + interest, 2)})
+
+    roll = rng.random()
+    payments = []
+    if roll < 0.70:
+        fate, stop = "ontime", None
+    elif roll < 0.80:
+        fate, stop = "early", rng.randint(1, term)
+    elif roll < 0.88:
+        fate, stop = "late", None
+    elif roll < 0.93:
+        fate, stop = "extension", rng.randint(1, term)
+    else:
+        fate, stop = "default", rng.randint(1, term)
+    remaining = amount
+    for s in schedule:
+        i, due = s["term"], date.fromisoformat(s["due_date"])
+        if fate == "default" and i >= stop:
+            break
+        if fate == "late":
+            paid_on, ptype = due + timedelta(days=rng.randint(1, 25)), 5
+        else:
+            paid_on, ptype = due - timedelta(days=rng.randint(0, 3)), 1
+        if paid_on > as_of:
+            break
+        penalty = round(s["interest"] * 0.1, 2) if ptype == 5 else 0.0
+        if fate in ("early", "extension") and i == stop:
+            if fate == "early":
+                payments.append((i, paid_on, 2, round(remaining, 2), s["interest"], 0.0, 0.0))
+            else:
+                payments.append((i, paid_on, 3, round(remaining, 2), s["interest"], 0.0,
+                                 round(remaining * 0.05, 2)))
+            break
+        payments.append((i, paid_on, ptype, s["principal"], s["interest"], penalty, 0.0))
+        remaining = round(remaining - s["principal"], 2)
+    return schedule, payments
+
+
+def _snapshot_rows(amount, schedule, payments, disb: date, dates):
+    """各快照日的 (stat_date, loan_status, dpd, outstanding_principal)；结清后仅出现在结清当月的快照中（status 3）"""
+    paid_terms = {p[0]: p[1] for p in payments}
+    settled_on = None
+    if payments and abs(sum(p[3] for p in payments) - amount) < 0.05:
+        settled_on = payments[-1][1]
+    dues = [(s["term"], date.fromisoformat(s["due_date"])) for s in schedule]
+    for d in dates:
+        if d < disb:
+            continue
+        if settled_on is not None and settled_on <= d:
+            if (settled_on.year, settled_on.month) == (d.year, d.month):
+                yield d, 3, 0, 0.0
+            continue
+        principal_paid = sum(p[3] for p in payments if p[1] <= d)
+        dpd = 0
+        for term, due in dues:
+            if due > d:
+                break
+            paid = paid_terms.get(term)
+            if paid is None or paid > d:
+                dpd = (d - due).days
+                break
+        yield d, 2 if dpd > 0 else 1, dpd, round(max(0.0, amount - principal_paid), 2)
+
+
+class _CopyBuffer:
+    """按表累积 COPY 文本，超过阈值写入"""
+
+    def __init__(self, cur):
+        self.cur = cur
+        self.bufs = {}
+        self.size = 0
+        self.rows = {}
+
+    def add(self, table, values):
+        line = "\t".join("\\N" if v is None else str(v) for v in values) + "\n"
+        self.bufs.setdefault(table, []).append(line)
+        self.rows[table] = self.rows.get(table, 0) + 1
+        self.size += len(line)
+        if self.size >= _FLUSH_BYTES:
+            self.flush()
+
+    def flush(self):
+        for table, lines in self.bufs.items():
+            if lines:
+                self.cur.copy_expert(f"COPY {table} FROM STDIN", io.StringIO("".join(lines)))
+        self.bufs = {}
+        self.size = 0
+
+
+def _check_local(dsn: str, force: bool):
+    os.environ["DATABASE_URL"] = dsn
+    os.environ["DB_HOST_IP"] = ""
+    os.environ["DB_PORT"] = ""
+    from db_config import get_db_config
+    host = (get_db_config().get("host") or "").lower()
+    if host not in ("localhost", "127.0.0.1", "::1", "") and not host.startswith("/") and not force:
+        raise SystemExit(f"拒绝写入非本地数据库 host={host}（会 DROP 表）；确认是基准库时加 --force")
+
+
+def seed(dsn: str, loans: int, seed_value: int = 42, as_of: date = date(2025, 12, 31), months: int = 18,
+         daily_days: int = 7, force: bool = False, log=print):
+    """生成并写入合成数据，返回各表行数"""
+    _check_local(dsn, force)
+    import psycopg2
+    rng = random.Random(seed_value)
+    start = _add_months(date(as_of.year, as_of.month, 1), -months + 1)
+    if start.year < 2024 or as_of.year > 2027:
+        raise SystemExit("calc_overdue 分区仅识别 2024-2027 年，请调整 --as-of / --months")
+    dates = stat_dates(start, as_of, daily_days)
+    tables = sorted({_calc_table(d) for d in dates})
+    span_days = (as_of - start).days
+
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    t0 = time.time()
+    cur.execute(DDL)
+    cur.execute("SELECT table_name FROM information_schema.tables WHERE table_schema='public' "
+                "AND table_name LIKE 'calc_overdue_y%'")
+    for (t,) in cur.fetchall():
+        cur.execute(f"DROP TABLE {t}")
+    for t in tables:
+        cur.execute(CALC_DDL.format(t=t))
+
+    for sid, name, region, ccy, fx, _ in SPVS:
+        cfg = {"senior_junior_ratio": "7:3", "liquidation_line": 1.02, "margin_call_line": 1.15, "baseline": 1.43}
+        cur.execute("""
+            INSERT INTO spv_config (spv_id, name, region, contact, product_type, onboard_date, currency,
+                exchange_rate, status, leverage_ratio, priority_yield_pct, liquidation_line, margin_call_line,
+                baseline, margin_deposit, guarantee_deposit, config)
+            VALUES (%s, %s, %s, 'bench', 'PL', %s, %s, %s, 'active', '7:3', 15, 1.02, 1.15, 1.43, 100000, 50000, %s)
+        """, (sid, name, region, start.isoformat(), ccy, fx, json.dumps(cfg)))
+        for k in range(3):
+            cur.execute("""
+                INSERT INTO spv_internal_params VALUES (%s, %s, 0.15, %s, 2.3, 100000, 80000, 50000, 40000,
+                    0.9, 0.05, %s, 12)
+            """, (sid, _add_months(start, k * 6), round(1.2 + rng.random() * 0.3, 4), 1_000_000 * (k + 1)))
+
+    buf = _CopyBuffer(cur)
+    n_customers = max(1, int(loans * 0.7))
+    per_spv = [(sid, max(1, int(loans * w))) for sid, _, _, _, _, w in SPVS]
+    for c in range(n_customers):
+        buf.add("raw_customer", (f"CU{c:09d}", per_spv[c % len(per_spv)][0], rng.choice(_RATINGS),
+                                 rng.choice(("M", "F")), rng.randint(21, 60), f"city_{c % 97}",
+                                 f"{start.isoformat()} 00:00:00"))
+    n_rep = 0
+    for sid, n in per_spv:
+        for k in range(n):
+            loan_id = f"{sid}-{k:08d}"
+            disb = start + timedelta(days=rng.randint(0, span_days))
+            term = rng.choice((1, 3, 3, 6, 6, 12))
+            method = 2 if rng.random() < 0.2 else 1
+            amount = round(min(50000.0, rng.lognormvariate(7.5, 0.8)), 2)
+            rate = round(rng.uniform(0.001, 0.004), 6)
+            schedule, payments = _simulate_loan(rng, amount, rate, term, method, disb, as_of)
+            buf.add("raw_loan", (loan_id, f"C{sid}-{k // 2:08d}", sid, f"CU{rng.randrange(n_customers):09d}",
+                                 f"{disb.isoformat()} {rng.randint(8, 20):02d}:00:00", amount, rate, term,
+                                 _add_months(disb, term).isoformat(), method,
+                                 json.dumps({"schedule": schedule}, separators=(",", ":"))))
+            for term_no, paid_on, ptype, pr, it, pen, fee in payments:
+                n_rep += 1
+                buf.add("raw_repayment", (f"T{n_rep:012d}", loan_id, sid, ptype, term_no, paid_on.isoformat(),
+                                          round(pr + it + pen + fee, 2), pr, it, pen, fee, 0,
+                                          "t" if ptype in (2, 3) else "f"))
+            for d, status, dpd, outstanding in _snapshot_rows(amount, schedule, payments, disb, dates):
+                buf.add(_calc_table(d), (loan_id, sid, d.isoformat(), status, dpd, outstanding))
+            if k and k % 100_000 == 0:
+                log(f"  {sid}: {k}/{n} 笔（{time.time() - t0:.0f}s）")
+    buf.flush()
+
+    log("建索引 / ANALYZE ...")
+    for ddl in INDEX_DDL:
+        cur.execute(ddl)
+    for t in tables:
+        cur.execute(CALC_INDEX_DDL.format(t=t))
+    meta = {"seed": seed_value, "loans": loans, "as_of": as_of.isoformat(), "start": start.isoformat(),
+            "daily_days": daily_days, "generated_at": datetime.now().isoformat(timespec="seconds")}
+    cur.executemany("INSERT INTO bench_meta VALUES (%s, %s)", [(k, str(v)) for k, v in meta.items()])
+    conn.commit()
+    conn.autocommit = True
+    cur.execute("ANALYZE")
+    cur.close()
+    conn.close()
+    log(f"完成：{time.time() - t0:.1f}s，行数 {json.dumps(buf.rows, ensure_ascii=False)}")
+    return buf.rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description="生成基准测试合成数据（会重建相关表，仅限本地库）")
+    ap.add_argument("--dsn", default=os.getenv("BENCH_DATABASE_URL", "postgresql://localhost/rt_risk_bench"))
+    ap.add_argument("--scale", default="10k", help="贷款笔数：10k / 100k / 1m / 5m 或数字")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--as-of", default="2025-12-31", help="最新数据日（最后一个快照日）")
+    ap.add_argument("--months", type=int, default=18, help="放款跨越的月数")
+    ap.add_argument("--daily-days", type=int, default=7, help="最新数据日前逐日快照的天数")
+    ap.add_argument("--force", action="store_true", help="允许非本地 host")
+    args = ap.parse_args()
+    seed(args.dsn, parse_scale(args.scale), args.seed, date.fromisoformat(args.as_of), args.months,
+         args.daily_days, args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -172,10 +172,8 @@ def main():
 
     # 3. 获取 risk_data（M0 覆盖率）
     try:
-        from kn_producer_cache import load_producer_full_cache
-        data, _ = load_producer_full_cache()
-        producers = (data or {}).get("producers", {})
-        pc = producers.get(spv_id) or producers.get("docking")
+        from kn_producer_cache import load_producer_shard
+        pc = load_producer_shard(spv_id) or load_producer_shard("docking")
         risk_data = (pc or {}).get("risk_data", [])
     except Exception:
         risk_data = []
@@ -6,7 +6,7 @@ import os
 import json
 from decimal import Decimal
 
-from kn_data_utils import serialize_for_json
+from kn_data_utils import serialize_for_json, table_exists
 
 
 def load_spv_config():
@@ -24,13 +24,7 @@ def load_spv_config():
     cur = conn.cursor()
     try:
         # 检查表是否存在
-        cur.execute("""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.tables
-                WHERE table_schema = 'public' AND table_name = 'spv_config'
-            )
-        """)
-        if not cur.fetchone()[0]:
+        if not table_exists(cur, "spv_config"):
             return {}
 
         # 查询 spv_config 表（SELECT * 兼容不同列结构）
@@ -8,7 +8,7 @@
 """
 from decimal import Decimal
 
-from kn_data_utils import serialize_for_json
+from kn_data_utils import serialize_for_json, table_exists
 
 
 def _num(rec, k, *alts, default=0):
@@ -22,24 +22,32 @@ def _num(rec, k, *alts, default=0):
     return default
 
 
-def _compute_coverage_ratio(rec, spv_cfg, risk_data, exchange_rate, base_default=1.43):
+def _coverage_params(rec):
     """
-    覆盖倍数 V/L
-    Value = (M0本金 + M0应收利息 * 早偿逾期折损) * (1 - Vtg30预估default rate) + 现金余额
-    Loan = 合作本金 + 未分配收益（spv_internal_params 中已是 USD）
-    早偿逾期折损、vtg30_predicted_default_rate、合作本金、未分配收益 从 spv_internal_params
-    返回: (ratio, breakdown_dict)
+    覆盖倍数公式中来自 spv_internal_params 的参数
+    返回: (早偿逾期折损, Vtg30 default rate(小数), 合作本金, 未分配收益)
+    早偿逾期折损 <= 0 时按 1（不折损）；合作本金 = principal_amount，未分配收益 = principal_amount * product_term / 12
     """
     early_discount = _num(rec, "early_repayment_loss_rate", "early_repayment_overdue_discount")
     if early_discount <= 0:
         early_discount = 1.0  # 默认不折损
     vtg30_default = _num(rec, "vtg_30_plus_predicted", "vtg30_predicted_default_rate", "vtg30_plus_predicted")
     vtg30_default = vtg30_default / 100 if vtg30_default > 1 else vtg30_default
-    # 合作本金：principal_amount；未分配收益：principal_amount * product_term / 12
     principal_amount = _num(rec, "principal_amount")
     product_term = _num(rec, "product_term")
-    coop_principal = principal_amount
     unallocated = principal_amount * product_term / 12 if product_term > 0 else 0
+    return early_discount, vtg30_default, principal_amount, unallocated
+
+
+def _compute_coverage_ratio(rec, spv_cfg, risk_data, exchange_rate, base_default=1.43):
+    """
+    覆盖倍数 V/L
+    Value = (M0本金 + M0应收利息 * 早偿逾期折损) * (1 - Vtg30预估default rate) + 现金余额
+    Loan = 合作本金 + 未分配收益（spv_internal_params 中已是 USD）
+    早偿逾期折损、vtg30_predicted_default_rate、合作本金、未分配收益 从 spv_internal_params
+    返回: (ratio, breakdown_dict)
+    """
+    early_discount, vtg30_default, coop_principal, unallocated = _coverage_params(rec)
     rate = exchange_rate or 1
     if rate <= 0:
         rate = 1
@@ -89,15 +97,7 @@ def _compute_coverage_ratio_abs(rec, spv_cfg, risk_data, exchange_rate, base_def
     Loan = 合作本金 + 未分配收益（与 M0 相同）
     返回: (ratio, breakdown_dict)
     """
-    early_discount = _num(rec, "early_repayment_loss_rate", "early_repayment_overdue_discount")
-    if early_discount <= 0:
-        early_discount = 1.0
-    vtg30_default = _num(rec, "vtg_30_plus_predicted", "vtg30_predicted_default_rate", "vtg30_plus_predicted")
-    vtg30_default = vtg30_default / 100 if vtg30_default > 1 else vtg30_default
-    principal_amount = _num(rec, "principal_amount")
-    product_term = _num(rec, "product_term")
-    coop_principal = principal_amount
-    unallocated = principal_amount * product_term / 12 if product_term > 0 else 0
+    early_discount, vtg30_default, coop_principal, unallocated = _coverage_params(rec)
     rate = exchange_rate or 1
     if rate <= 0:
         rate = 1
@@ -201,13 +201,7 @@ def load_invested_spv_ids_for_portfolio():
     cur = conn.cursor()
     out = []
     try:
-        cur.execute("""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.tables
-                WHERE table_schema = 'public' AND table_name = 'spv_internal_params'
-            )
-        """)
-        if not cur.fetchone()[0]:
+        if not table_exists(cur, "spv_internal_params"):
             return []
 
         cur.execute("""
@@ -252,13 +246,7 @@ def load_all_spv_internal_params_for_portfolio():
     cur = conn.cursor()
     out = []
     try:
-        cur.execute("""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.tables
-                WHERE table_schema = 'public' AND table_name = 'spv_internal_params'
-            )
-        """)
-        if not cur.fetchone()[0]:
+        if not table_exists(cur, "spv_internal_params"):
             return []
 
         cur.execute("""
@@ -307,7 +295,20 @@ def load_priority_indicators_for_spv(spv_id, risk_data=None, exchange_rate=1):
     从 spv_internal_params 表加载优先级指标（按最新 effective_date）
     risk_data、exchange_rate 用于计算覆盖倍数 V/L
     返回与 partner_risk 模板兼容的 priority_indicators 结构，若表不存在或无数据返回 None
+    全量刷新中复用 spv_internal_params_latest / spv_config_rows 阶段结果（全部 SPV 各一条查询），不再逐个生产商查询
+    多个生产商一起计算请用 load_priority_indicators_batch
     """
+    from kn_data_utils import _current_refresh_run
+    run = _current_refresh_run()
+    if run is not None:
+        try:
+            rec = run.get("spv_internal_params_latest").get(str(spv_id))
+            if not rec:
+                return None
+            return _priority_from_params(rec, _load_spv_config_config(spv_id), risk_data, exchange_rate)
+        except Exception:
+            return None
+
     try:
         from db_connect import get_connection
         conn = get_connection()
@@ -316,13 +317,7 @@ def load_priority_indicators_for_spv(spv_id, risk_data=None, exchange_rate=1):
 
     cur = conn.cursor()
     try:
-        cur.execute("""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.tables
-                WHERE table_schema = 'public' AND table_name = 'spv_internal_params'
-            )
-        """)
-        if not cur.fetchone()[0]:
+        if not table_exists(cur, "spv_internal_params"):
             return None
 
         # 按 spv_id + 最新 effective_date 取一条（若无 effective_date 列则取任意一条）
@@ -343,77 +338,7 @@ def load_priority_indicators_for_spv(spv_id, risk_data=None, exchange_rate=1):
 
         # 从 spv_config.config 读取：Senior/Junior 比例、斩仓线、平仓线、基准线
         spv_cfg = _load_spv_config_config(spv_id)
-
-        # 杠杆比例：Senior:Junior 从 spv_config.config 解析，limit = Senior/Junior
-        lev_str = spv_cfg.get("senior_junior_ratio") or spv_cfg.get("leverage_ratio") or "7:3"
-        lev_limit = _parse_ratio_to_limit(lev_str)
-        lev_current = _num(rec, "leverage_current", "leverage_ratio_current", "coverage_current")
-        if lev_current <= 0:
-            lev_current = lev_limit * 0.6  # 占位
-        leverage_ratio = {"current": round(lev_current, 1), "limit": lev_limit, "unit": "x"}
-
-        # 优先收益率：目标固定 15%，当前值从 spv_internal_params 获取，找不到则缺失
-        py_target = 0.15  # 目标固定写死 15%
-        py_current = _num(rec, "priority_yield_current", "priority_yield_pct_current", "agreed_rate")
-        py_current = py_current / 100 if py_current > 1 else py_current
-        if py_current <= 0:
-            priority_yield = None  # 缺失
-        else:
-            priority_yield = {"current": py_current, "target": py_target, "unit": "%"}
-
-        # 覆盖倍数：V/L，斩仓线、平仓线、基准线从 spv_config.config
-        liq = spv_cfg.get("liquidation_line") or 1.02
-        mc = spv_cfg.get("margin_call_line") or 1.15
-        base = spv_cfg.get("baseline") or 1.43
-        cov_current, cov_breakdown = _compute_coverage_ratio(
-            rec, spv_cfg, risk_data, exchange_rate, base
-        )
-        coverage_ratio = {
-            "current": round(cov_current, 2),
-            "liquidation": liq,
-            "margin_call": mc,
-            "baseline": base,
-            "unit": "x",
-            "breakdown": cov_breakdown,
-        }
-        # 方案二（ABS）：全量 Loan，与 M0 公式结构相同
-        cov_abs_current, cov_abs_breakdown = _compute_coverage_ratio_abs(
-            rec, spv_cfg, risk_data, exchange_rate, base
-        )
-        coverage_ratio_abs = {
-            "current": round(cov_abs_current, 2),
-            "liquidation": liq,
-            "margin_call": mc,
-            "baseline": base,
-            "unit": "x",
-            "breakdown": cov_abs_breakdown,
-        }
-
-        # 优先本金：KN Risk 页面中 优先本金 = 合作本金 = principal_amount
-        priority_principal = _num(rec, "principal_amount")
-
-        # 保证金、担保金
-        margin_deposit = None
-        mg_cur = _num(rec, "margin_deposit_current", "margin_deposit")
-        mg_req = _num(rec, "margin_deposit_required", "margin_deposit_required")
-        if mg_cur > 0 or mg_req > 0:
-            margin_deposit = {"current": mg_cur, "required": mg_req or mg_cur, "currency": "USD"}
-
-        guarantee_deposit = None
-        gt_cur = _num(rec, "guarantee_deposit_current", "guarantee_deposit")
-        gt_req = _num(rec, "guarantee_deposit_required", "guarantee_deposit_required")
-        if gt_cur > 0 or gt_req > 0:
-            guarantee_deposit = {"current": gt_cur, "required": gt_req or gt_cur, "currency": "USD"}
-
-        return {
-            "priority_principal": priority_principal if priority_principal > 0 else None,
-            "leverage_ratio": leverage_ratio,
-            "priority_yield": priority_yield,
-            "coverage_ratio": coverage_ratio,
-            "coverage_ratio_abs": coverage_ratio_abs,
-            "margin_deposit": margin_deposit,
-            "guarantee_deposit": guarantee_deposit,
-        }
+        return _priority_from_params(rec, spv_cfg, risk_data, exchange_rate)
     except Exception:
         return None
     finally:
@@ -427,6 +352,191 @@ def load_priority_indicators_for_spv(spv_id, risk_data=None, exchange_rate=1):
             pass
 
 
+def _priority_from_params(rec, spv_cfg, risk_data=None, exchange_rate=1):
+    """由 spv_internal_params 一条记录 + spv_config 配置计算优先级指标（不访问 DB）"""
+    # 杠杆比例：Senior:Junior 从 spv_config.config 解析，limit = Senior/Junior
+    lev_str = spv_cfg.get("senior_junior_ratio") or spv_cfg.get("leverage_ratio") or "7:3"
+    lev_limit = _parse_ratio_to_limit(lev_str)
+    lev_current = _num(rec, "leverage_current", "leverage_ratio_current", "coverage_current")
+    if lev_current <= 0:
+        lev_current = lev_limit * 0.6  # 占位
+    leverage_ratio = {"current": round(lev_current, 1), "limit": lev_limit, "unit": "x"}
+
+    # 优先收益率：目标固定 15%，当前值从 spv_internal_params 获取，找不到则缺失
+    py_target = 0.15  # 目标固定写死 15%
+    py_current = _num(rec, "priority_yield_current", "priority_yield_pct_current", "agreed_rate")
+    py_current = py_current / 100 if py_current > 1 else py_current
+    if py_current <= 0:
+        priority_yield = None  # 缺失
+    else:
+        priority_yield = {"current": py_current, "target": py_target, "unit": "%"}
+
+    # 覆盖倍数：V/L，斩仓线、平仓线、基准线从 spv_config.config
+    liq = spv_cfg.get("liquidation_line") or 1.02
+    mc = spv_cfg.get("margin_call_line") or 1.15
+    base = spv_cfg.get("baseline") or 1.43
+    cov_current, cov_breakdown = _compute_coverage_ratio(
+        rec, spv_cfg, risk_data, exchange_rate, base
+    )
+    coverage_ratio = {
+        "current": round(cov_current, 2),
+        "liquidation": liq,
+        "margin_call": mc,
+        "baseline": base,
+        "unit": "x",
+        "breakdown": cov_breakdown,
+    }
+    # 方案二（ABS）：全量 Loan，与 M0 公式结构相同
+    cov_abs_current, cov_abs_breakdown = _compute_coverage_ratio_abs(
+        rec, spv_cfg, risk_data, exchange_rate, base
+    )
+    coverage_ratio_abs = {
+        "current": round(cov_abs_current, 2),
+        "liquidation": liq,
+        "margin_call": mc,
+        "baseline": base,
+        "unit": "x",
+        "breakdown": cov_abs_breakdown,
+    }
+
+    # 优先本金：KN Risk 页面中 优先本金 = 合作本金 = principal_amount
+    priority_principal = _num(rec, "principal_amount")
+
+    # 保证金、担保金
+    margin_deposit = None
+    mg_cur = _num(rec, "margin_deposit_current", "margin_deposit")
+    mg_req = _num(rec, "margin_deposit_required", "margin_deposit_required")
+    if mg_cur > 0 or mg_req > 0:
+        margin_deposit = {"current": mg_cur, "required": mg_req or mg_cur, "currency": "USD"}
+
+    guarantee_deposit = None
+    gt_cur = _num(rec, "guarantee_deposit_current", "guarantee_deposit")
+    gt_req = _num(rec, "guarantee_deposit_required", "guarantee_deposit_required")
+    if gt_cur > 0 or gt_req > 0:
+        guarantee_deposit = {"current": gt_cur, "required": gt_req or gt_cur, "currency": "USD"}
+
+    return {
+        "priority_principal": priority_principal if priority_principal > 0 else None,
+        "leverage_ratio": leverage_ratio,
+        "priority_yield": priority_yield,
+        "coverage_ratio": coverage_ratio,
+        "coverage_ratio_abs": coverage_ratio_abs,
+        "margin_deposit": margin_deposit,
+        "guarantee_deposit": guarantee_deposit,
+    }
+
+
+def _rows_by_spv(cur) -> dict:
+    """当前结果集转为 { spv_id 原值: rec }（列名小写）"""
+    cols = [d[0].lower() for d in cur.description] if cur.description else []
+    out = {}
+    for row in cur.fetchall():
+        rec = dict(zip(cols, row))
+        key = rec.get("spv_id") or rec.get("id")
+        if key:
+            out[str(key)] = rec
+    return out
+
+
+def fetch_latest_params(conn, cur) -> dict:
+    """
+    spv_internal_params 中每个 spv_id 最新 effective_date 的一条（DISTINCT ON，一条查询覆盖全部 SPV）
+    返回: { spv_id 原值: rec }；无 effective_date 列时各取任意一条
+    """
+    try:
+        cur.execute("""
+            SELECT DISTINCT ON (spv_id) * FROM spv_internal_params
+            ORDER BY spv_id, effective_date DESC NULLS LAST
+        """)
+    except Exception:
+        conn.rollback()
+        cur.execute("SELECT DISTINCT ON (spv_id) * FROM spv_internal_params ORDER BY spv_id")
+    return _rows_by_spv(cur)
+
+
+def _load_latest_params_and_configs():
+    """
+    全部 SPV 的最新 spv_internal_params 与 spv_config 配置：(params_by_spv, config_rows_by_spv)
+    全量刷新中复用阶段结果；否则一次连接内两条 DISTINCT ON 查询（另有一次表存在性检查）
+    """
+    from kn_data_utils import _current_refresh_run
+    run = _current_refresh_run()
+    if run is not None:
+        return run.get("spv_internal_params_latest") or {}, run.get("spv_config_rows") or {}
+
+    from db_connect import get_connection
+    conn = get_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT table_name FROM information_schema.tables
+            WHERE table_schema='public' AND table_name IN ('spv_internal_params', 'spv_config')
+        """)
+        tables = {r[0] for r in cur.fetchall()}
+        params = fetch_latest_params(conn, cur) if "spv_internal_params" in tables else {}
+        configs = {}
+        if "spv_config" in tables:
+            cur.execute("SELECT DISTINCT ON (spv_id) * FROM spv_config ORDER BY spv_id")
+            configs = _rows_by_spv(cur)
+        return params, configs
+    finally:
+        try:
+            cur.close()
+        except Exception:
+            pass
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def load_priority_indicators_batch(spv_ids=None, risk_by_spv=None, rates=None, fallback=True):
+    """
+    一次计算多个生产商的优先级指标（M0 / ABS 覆盖倍数、杠杆、优先收益率等），结构同 load_priority_indicators_for_spv
+    spv_ids: 需要的 spv_id，默认 spv_internal_params 中全部 SPV 与 risk_by_spv 的并集
+    risk_by_spv: { spv_id: risk_data }，rates: { spv_id: exchange_rate }，用于覆盖倍数 V/L
+    fallback=True: 无 spv_internal_params 记录但有 risk_data 时按 compute_priority_from_risk_data 计算
+    返回: { spv_id: priority_indicators 或 None }；数据库不可用时返回 {}
+    """
+    risk_by_spv = risk_by_spv or {}
+    rates = rates or {}
+    try:
+        params, config_rows = _load_latest_params_and_configs()
+    except Exception:
+        return {}
+    ids = list(spv_ids) if spv_ids is not None else list(dict.fromkeys(list(params) + list(risk_by_spv)))
+    producers = None  # spv_config 无该 SPV 时的回退配置，整批只加载一次
+    out = {}
+    for spv_id in ids:
+        key = str(spv_id)
+        risk_data = risk_by_spv.get(spv_id)
+        rate = rates.get(spv_id, 1)
+        if not params.get(key) and not (fallback and risk_data):
+            out[spv_id] = None
+            continue
+        rec = config_rows.get(key)
+        if rec:
+            spv_cfg = _spv_cfg_from_rec(rec)
+        else:
+            if producers is None:
+                try:
+                    from spv_config import load_producers_from_spv_config
+                    producers = load_producers_from_spv_config()
+                except Exception:
+                    producers = {}
+            spv_cfg = _spv_cfg_from_producer(producers.get(spv_id, {}))
+        try:
+            if params.get(key):
+                out[spv_id] = _priority_from_params(params[key], spv_cfg, risk_data, rate)
+            elif fallback and risk_data:
+                out[spv_id] = _priority_from_risk(spv_cfg, risk_data, rate)
+            else:
+                out[spv_id] = None
+        except Exception:
+            out[spv_id] = None
+    return out
+
+
 def _parse_ratio_to_limit(ratio_str):
     """解析 Senior:Junior 如 7:3 -> limit = 7/3"""
     try:
@@ -447,69 +557,84 @@ def _load_spv_config_config(spv_id):
     若无 config 列则从顶层字段 fallback
     """
     try:
-        from db_connect import get_connection
-        import json
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM spv_config WHERE spv_id = %s", (spv_id,))
-        row = cur.fetchone()
-        if not row:
+        from kn_data_utils import _current_refresh_run
+        run = _current_refresh_run()
+        if run is not None:
+            # 全量刷新中：spv_config 全表只查一次，各生产商共享
+            rec = run.get("spv_config_rows").get(str(spv_id))
+            if not rec:
+                return _load_spv_config_fallback(spv_id)
+        else:
+            from db_connect import get_connection
+            conn = get_connection()
+            cur = conn.cursor()
+            cur.execute("SELECT * FROM spv_config WHERE spv_id = %s", (spv_id,))
+            row = cur.fetchone()
+            if not row:
+                cur.close()
+                conn.close()
+                return _load_spv_config_fallback(spv_id)
+            cols = [d[0].lower() for d in cur.description]
+            rec = dict(zip(cols, row))
             cur.close()
             conn.close()
-            return _load_spv_config_fallback(spv_id)
-        cols = [d[0].lower() for d in cur.description]
-        rec = dict(zip(cols, row))
-        cur.close()
-        conn.close()
-
-        out = {}
-        config_json = rec.get("config")
-        if config_json:
-            if isinstance(config_json, dict):
-                out = {k: v for k, v in config_json.items() if v is not None}
-            elif isinstance(config_json, str):
-                try:
-                    out = json.loads(config_json)
-                except Exception:
-                    pass
-        def _f(key, *alts, default=None):
-            for k in [key] + list(alts):
-                v = out.get(k) or rec.get(k)
-                if v is not None:
-                    try:
-                        return float(v)
-                    except (ValueError, TypeError):
-                        pass
-            return default
-        return {
-            "senior_junior_ratio": out.get("senior_junior_ratio") or rec.get("leverage_ratio"),
-            "leverage_ratio": out.get("leverage_ratio") or rec.get("leverage_ratio"),
-            "liquidation_line": _f("liquidation_line", default=1.02),
-            "margin_call_line": _f("margin_call_line", default=1.15),
-            "baseline": _f("baseline", default=1.43),
-            "priority_yield_pct": _f("priority_yield_pct", default=15),
-        }
+        return _spv_cfg_from_rec(rec)
     except Exception:
         return _load_spv_config_fallback(spv_id)
 
 
+def _spv_cfg_from_rec(rec):
+    """spv_config 一行 -> 配置 dict（config 列 JSONB 优先，否则顶层字段）"""
+    import json
+    out = {}
+    config_json = rec.get("config")
+    if config_json:
+        if isinstance(config_json, dict):
+            out = {k: v for k, v in config_json.items() if v is not None}
+        elif isinstance(config_json, str):
+            try:
+                out = json.loads(config_json)
+            except Exception:
+                pass
+    def _f(key, *alts, default=None):
+        for k in [key] + list(alts):
+            v = out.get(k) or rec.get(k)
+            if v is not None:
+                try:
+                    return float(v)
+                except (ValueError, TypeError):
+                    pass
+        return default
+    return {
+        "senior_junior_ratio": out.get("senior_junior_ratio") or rec.get("leverage_ratio"),
+        "leverage_ratio": out.get("leverage_ratio") or rec.get("leverage_ratio"),
+        "liquidation_line": _f("liquidation_line", default=1.02),
+        "margin_call_line": _f("margin_call_line", default=1.15),
+        "baseline": _f("baseline", default=1.43),
+        "priority_yield_pct": _f("priority_yield_pct", default=15),
+    }
+
+
 def _load_spv_config_fallback(spv_id):
     """从 load_producers 获取（无 config 列时）"""
     try:
         from spv_config import load_producers_from_spv_config
-        p = load_producers_from_spv_config().get(spv_id, {})
-        return {
-            "senior_junior_ratio": p.get("leverage_ratio"),
-            "leverage_ratio": p.get("leverage_ratio"),
-            "liquidation_line": p.get("liquidation_line") or 1.02,
-            "margin_call_line": p.get("margin_call_line") or 1.15,
-            "baseline": p.get("baseline") or 1.43,
-            "priority_yield_pct": p.get("priority_yield_pct") or 15,
-        }
+        return _spv_cfg_from_producer(load_producers_from_spv_config().get(spv_id, {}))
     except Exception:
         return {"liquidation_line": 1.02, "margin_call_line": 1.15, "baseline": 1.43, "priority_yield_pct": 15}
 
 
+def _spv_cfg_from_producer(p):
+    return {
+        "senior_junior_ratio": p.get("leverage_ratio"),
+        "leverage_ratio": p.get("leverage_ratio"),
+        "liquidation_line": p.get("liquidation_line") or 1.02,
+        "margin_call_line": p.get("margin_call_line") or 1.15,
+        "baseline": p.get("baseline") or 1.43,
+        "priority_yield_pct": p.get("priority_yield_pct") or 15,
+    }
+
+
 def _load_spv_config_thresholds(spv_id):
     """兼容旧接口：返回与 _load_spv_config_config 相同结构"""
     return _load_spv_config_config(spv_id)
@@ -523,7 +648,11 @@ def compute_priority_from_risk_data(spv_id, risk_data, exchange_rate=1):
     """
     if not risk_data:
         return None
-    spv_cfg = _load_spv_config_config(spv_id)
+    return _priority_from_risk(_load_spv_config_config(spv_id), risk_data, exchange_rate)
+
+
+def _priority_from_risk(spv_cfg, risk_data, exchange_rate=1):
+    """无 spv_internal_params 记录时，由 risk_data + spv_config 配置计算（不访问 DB）"""
     liq = spv_cfg.get("liquidation_line") or 1.02
     mc = spv_cfg.get("margin_call_line") or 1.15
     base = spv_cfg.get("baseline") or 1.43
@@ -58,6 +58,24 @@ TRANSLATIONS = {
         "cache_no_data": "暂无",
         "cache_first_refresh_hint": "首次使用或新部署后请点击下方「刷新全量缓存」从数据库加载数据",
         "cache_logs_placeholder": "刷新后将显示日志",
+        "cache_profile_title": "刷新性能报告",
+        "cache_profile_none": "暂无性能报告（完成一次全量刷新后生成）",
+        "cache_profile_metric": "指标",
+        "cache_profile_current": "本次",
+        "cache_profile_previous": "上次",
+        "cache_profile_change": "变化",
+        "cache_profile_wall": "耗时（秒）",
+        "cache_profile_db": "数据库时间（秒）",
+        "cache_profile_queries": "查询数",
+        "cache_profile_rows": "返回行数",
+        "cache_profile_bytes": "返回数据量（KB，估算）",
+        "cache_profile_stages": "各阶段耗时",
+        "cache_profile_stage": "阶段",
+        "cache_profile_slowest": "最慢查询 Top {n}",
+        "cache_profile_producer": "生产商",
+        "cache_profile_sql": "SQL",
+        "cache_profile_caller": "调用方",
+        "cache_profile_producers": "各生产商耗时",
         # Login
         "login_title": "CHUAN | 登录",
         "welcome_login": "欢迎登录",
@@ -146,6 +164,9 @@ TRANSLATIONS = {
         "coverage_ratio": "覆盖倍数",
         "coverage_ratio_m0": "覆盖倍数（方案一 M0）",
         "coverage_ratio_abs": "覆盖倍数（方案二 ABS）",
+        "coverage_trend": "覆盖倍数走势",
+        "coverage_contract": "合同口径",
+        "coverage_vintage": "Vintage 口径",
         "leverage_ratio": "杠杆倍数",
         "missing": "缺失",
         # Common
@@ -378,6 +399,24 @@ TRANSLATIONS = {
         "cache_no_data": "N/A",
         "cache_first_refresh_hint": "On first use or after deployment, click 'Refresh Full Cache' below to load data from database",
         "cache_logs_placeholder": "Logs will appear after refresh",
+        "cache_profile_title": "Refresh Profile",
+        "cache_profile_none": "No profile yet (generated after a full refresh completes)",
+        "cache_profile_metric": "Metric",
+        "cache_profile_current": "This run",
+        "cache_profile_previous": "Previous",
+        "cache_profile_change": "Change",
+        "cache_profile_wall": "Wall time (s)",
+        "cache_profile_db": "DB time (s)",
+        "cache_profile_queries": "Queries",
+        "cache_profile_rows": "Rows fetched",
+        "cache_profile_bytes": "Data fetched (KB, est.)",
+        "cache_profile_stages": "Time by stage",
+        "cache_profile_stage": "Stage",
+        "cache_profile_slowest": "Top {n} slowest queries",
+        "cache_profile_producer": "Producer",
+        "cache_profile_sql": "SQL",
+        "cache_profile_caller": "Caller",
+        "cache_profile_producers": "Time by producer",
         # Login
         "login_title": "CHUAN | Login",
         "welcome_login": "Welcome",
@@ -466,6 +505,9 @@ TRANSLATIONS = {
         "coverage_ratio": "Coverage Ratio",
         "coverage_ratio_m0": "Coverage Ratio (Plan 1 M0)",
         "coverage_ratio_abs": "Coverage Ratio (Plan 2 ABS)",
+        "coverage_trend": "Coverage Ratio Trend",
+        "coverage_contract": "Contract",
+        "coverage_vintage": "Vintage",
         "leverage_ratio": "Leverage Ratio",
         "missing": "N/A",
         # Common